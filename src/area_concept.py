@@ -1,118 +1,103 @@
-# Unused and unfinished code for a new layout generator based on nested area objects
+# Nested areas of the poster layout (poster, margins, title, grid cells, covers, ...)
 
 from __future__ import annotations
-from dataclasses import dataclass
-import numpy as np
+import math
+from typing import Dict, Hashable, Literal, Tuple
 from PIL import ImageDraw
-from typing import Literal
-from Dimensions_file import Dimensions, Position, Dimensions_px
-import layout_generator as lg
-
-H = 0  # horizontal index
-V = 1  # vertical intex
-
-TOP = 0  # top margin index
-BOTTOM = 1  # bottom margin index
-SIDES = 2  # sides margin index
+from dimensions import Position
+from constants import *
 
 
 class Area:
-    # content: list[Area] = list()
-    content = {}
+    """Rectangle placed at an offset (in px) within its container area.
+    The absolute position is rounded to whole pixels (halves up, so that equal offsets
+    give equal distances), calculated once and cached.
+    Changing the offset of an area invalidates the cached positions of the area and of
+    its content only."""
 
     def __init__(
         self,
-        container: Area = None,
-        offset: Dimensions_px = (0, 0),
-        dimensions: Dimensions_px = (0, 0),
-    ):
-        self.offset = offset
-        self.dimensions = dimensions
-        self.position = None
-
-    # def add_content(self, new_content):
-    #     self.content.append(new_content)
-    #     self._update_content_positions()
-
-    def add_content(self, identifier: str, new_content):
+        offset: Tuple[float, float] = (0, 0),
+        dimensions: Tuple[float, float] = (0, 0),
+        dpi: int = 300,
+    ) -> None:
+        self.container: Area = None
+        self.content: Dict[Hashable, Area] = {}
+        self.dpi = dpi
+        self._offset = tuple(offset)
+        self.dimensions = tuple(dimensions)
+        self._position: Tuple[float, float] = None  # absolute, None if not calculated yet
+
+    def add_content(self, identifier: Hashable, new_content: Area) -> Area:
+        new_content.container = self
+        new_content.invalidate()
         self.content[identifier] = new_content
-        self.content[identifier].calculate_position(self.position)
-        # self._update_content_positions()
-
-    def via_position(self, position: Position, dimensions: Dimensions):
-        assert position.dpi == dimensions.dpi, "DPI mismatch!"
-        self.offset = Dimensions(0, 0, unit="cm", dpi=self._dpi)
-        self.position = position
-        self.dimensions = dimensions
-
-    def _update_content_positions(self):
-        for c in self.content:
-            c.calculate_position(self.position)
-
-    def calculate_position(self, container_position: Position):
-        self.position = container_position.add(self.offset)
+        return new_content
+
+    @property
+    def offset(self) -> Tuple[float, float]:
+        return self._offset
+
+    @offset.setter
+    def offset(self, offset: Tuple[float, float]) -> None:
+        offset = tuple(offset)
+        if offset != self._offset:
+            self._offset = offset
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        if self._position is None:
+            return  # the content can only be calculated after its container
+        self._position = None
+        for area in self.content.values():
+            area.invalidate()
+
+    @property
+    def position_px(self) -> Tuple[int, int]:
+        """Absolute position of the upper left corner"""
+        if self._position is None:
+            container_position = (0, 0) if self.container is None else self.container.position_px
+            self._position = (
+                math.floor(container_position[H] + self._offset[H] + 0.5),
+                math.floor(container_position[V] + self._offset[V] + 0.5),
+            )
+        return self._position
 
-    def draw_outline(self, draw: ImageDraw, outline_width: int = 1):
-        draw.rectangle(
-            [self.position.xy_px, self.dimensions.dim_px],
-            fill=None,
-            width=outline_width,
-            outline="black",
-        )
+    def update_positions(self) -> int:
+        """Calculating the positions of the area and its content that are not cached
+        (e.g. after changing offsets), returns the number of areas calculated"""
+        n_calculated = int(self._position is None)
+        self.position_px
+        for area in self.content.values():
+            n_calculated += area.update_positions()
+        return n_calculated
 
     def get_position_of(
         self,
-        vertical_pos: Literal["top", "middle", "bottom"],
-        horizontal_pos: Literal["left", "middle", "right"],
-    ):
-        if self.position is None:
-            raise ValueError("Position not set!")
-        if vertical_pos == "top":
-            vertical_offset = 0
-        elif vertical_pos == "middle":
-            vertical_offset = self.dimensions.height_cm / 2
-        elif vertical_pos == "bottom":
-            vertical_offset = self.dimensions.height_cm
-        else:
+        vertical_pos: Literal["top", "middle", "bottom"] = "top",
+        horizontal_pos: Literal["left", "middle", "right"] = "left",
+        rounded: bool = True,
+    ) -> Position:
+        """Position of a corner, an edge center or the center of the area"""
+        factors = {"top": 0.0, "left": 0.0, "middle": 0.5, "bottom": 1.0, "right": 1.0}
+        if vertical_pos not in ("top", "middle", "bottom"):
             raise ValueError("Vertical position not recognized!")
-        if horizontal_pos == "left":
-            horizontal_offset = 0
-        elif horizontal_pos == "middle":
-            horizontal_offset = self.dimensions.width_cm / 2
-        elif horizontal_pos == "right":
-            horizontal_offset = self.dimensions.width_cm
-        else:
+        if horizontal_pos not in ("left", "middle", "right"):
             raise ValueError("Horizontal position not recognized!")
-        return self.position.add(
-            Dimensions(
-                horizontal_offset, vertical_offset, unit="cm", dpi=self.dimensions.dpi
-            )
-        )
-
-
-@dataclass
-class PosterLayout:
-    poster: lg.PosterParameters
-    grid: lg.GridParameters
-    year_shading: lg.YearShadingParameters
-    book: lg.BookParameters
-    title: lg.TitleParameters
-    signature: lg.SignatureParameters
-    dpi: int
-
-    def __post_init__(self):
-        poster_area = Area(self.poster.dim.dim_px)
-        marginless_area_dim = Dimensions_px(
-            self.poster.dim.width_px - self.poster.margins[SIDES].px * 2,
-            self.poster.dim.height_px - self.poster.margins[TOP].px * 2,
-        )
-        marginless_area = Area(
-            container=poster_area,
-            offset=Dimensions_px(
-                self.poster.margins[SIDES].px, self.poster.margins[TOP].px
-            ),
-            dimensions=marginless_area_dim,
+        x = self.position_px[H] + factors[horizontal_pos] * self.dimensions[H]
+        y = self.position_px[V] + factors[vertical_pos] * self.dimensions[V]
+        if rounded:
+            x, y = math.floor(x + 0.5), math.floor(y + 0.5)
+        return Position(x, y, unit="px", dpi=self.dpi)
+
+    def draw_outline(self, draw: ImageDraw, outline_width: int = 1) -> None:
+        """For checking layouts"""
+        x, y = self.get_position_of().xy_px
+        draw.rectangle(
+            [(x, y), (x + self.dimensions[H] - 1, y + self.dimensions[V] - 1)],
+            fill=None,
+            width=outline_width,
+            outline="black",
         )
-        # book_grid_area = Area(container=marginless_area, offset=(0,title_font.))
-
-    #     # title_area =
+        for area in self.content.values():
+            area.draw_outline(draw, outline_width)
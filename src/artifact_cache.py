@@ -0,0 +1,148 @@
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+from typing import Any, Dict, List
+
+# Increased whenever a cached stage changes its results, so that old artifacts are not reused
+ARTIFACT_VERSION = 2
+
+# The stages with artifacts in this cache and the artifacts each of them depends on.
+# The key of a stage contains the hashes of exactly these artifacts, so it is computed again
+# whenever one of them changed. Downloads, covers, layouts and the chrome are stored elsewhere
+# (response bodies, cover store, layout and chrome caches), they are identified by their hashes.
+STAGE_INPUTS = {
+    "parse": ("download",),  # parsed feed pages and books of CSV exports
+    "filter": ("parse",),  # books of the poster
+    "poster": ("filter", "covers", "layout", "chrome"),  # output files
+}
+
+
+class Artifact_cache:
+    """Results of the pipeline stages (parsed feeds, filtered books, posters), stored under
+    a hash of their inputs. The keys of later stages contain the content hashes of the
+    artifacts they depend on (STAGE_INPUTS), so a stage is only computed again if one of its
+    inputs changed. Also counts per stage how often it was skipped, for the run summary.
+    Per stage, only the max_entries artifacts (max_file_entries output files) used last are kept."""
+
+    def __init__(
+        self, cache_dir: str = "./cache/artifacts", max_entries: int = 256, max_file_entries: int = 16
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_file_entries = max_file_entries
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(stage: str, artifact_hashes: Dict[str, Any], *parameters) -> str:
+        """Hash of the inputs of a stage: the hashes of the artifacts it depends on
+        (by stage name, see STAGE_INPUTS) and parameters (plain values and containers)"""
+        if set(artifact_hashes) != set(STAGE_INPUTS[stage]):
+            raise ValueError(
+                f"Stage {stage} depends on {', '.join(STAGE_INPUTS[stage])}, got {', '.join(artifact_hashes)}"
+            )
+        inputs = (ARTIFACT_VERSION, stage, sorted(artifact_hashes.items()), parameters)
+        return hashlib.sha256(repr(inputs).encode()).hexdigest()[:32]
+
+    @staticmethod
+    def get_content_hash(value: Any) -> str:
+        return hashlib.sha256(pickle.dumps(value)).hexdigest()[:32]
+
+    def get_path(self, stage: str, key: str) -> str:
+        return os.path.join(self.cache_dir, stage, key)
+
+    def load(self, stage: str, key: str) -> Any:
+        """Cached artifact or None"""
+        path = self.get_path(stage, key) + ".pickle"
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path)  # used last, evicted last
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+
+    def save(self, stage: str, key: str, value: Any) -> None:
+        path = self.get_path(stage, key) + ".pickle"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(value, f)
+        os.replace(temp_path, path)
+        self.evict(stage, self.max_entries)
+
+    def load_files(self, stage: str, key: str, paths: List[str]) -> bool:
+        """Copying cached output files (or directories) to paths, if all are available"""
+        cache_paths = self.get_file_cache_paths(stage, key, paths)
+        if not all(os.path.exists(p) for p in cache_paths):
+            return False
+        try:
+            os.utime(self.get_path(stage, key))  # used last, evicted last
+            for cache_path, path in zip(cache_paths, paths):
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.isdir(cache_path):
+                    shutil.copytree(cache_path, path, dirs_exist_ok=True)
+                else:
+                    shutil.copyfile(cache_path, path)
+        except FileNotFoundError:  # evicted by another render in the meantime
+            return False
+        return True
+
+    def save_files(self, stage: str, key: str, paths: List[str]) -> None:
+        """Keeping copies of output files (or directories), the outputs may be overwritten later"""
+        directory = self.get_path(stage, key)
+        temp_directory = f"{directory}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(temp_directory, exist_ok=True)
+        for cache_path, path in zip(self.get_file_cache_paths(stage, key, paths), paths):
+            temp_path = os.path.join(temp_directory, os.path.basename(cache_path))
+            if os.path.isdir(path):
+                shutil.copytree(path, temp_path, dirs_exist_ok=True)
+            else:
+                shutil.copyfile(path, temp_path)
+        shutil.rmtree(directory, ignore_errors=True)
+        try:
+            os.replace(temp_directory, directory)
+        except OSError:  # written by another render in the meantime
+            shutil.rmtree(temp_directory, ignore_errors=True)
+        self.evict(stage, self.max_file_entries)
+
+    def evict(self, stage: str, max_entries: int) -> None:
+        """Removing the artifacts (files or directories) of a stage, except for the
+        max_entries used last"""
+        entries = []
+        for entry in os.scandir(os.path.join(self.cache_dir, stage)):
+            if entry.name.endswith(".tmp"):
+                continue  # written at the moment
+            try:
+                entries.append((entry.stat().st_mtime, entry.path, entry.is_dir()))
+            except FileNotFoundError:  # evicted by another render in the meantime
+                continue
+        for _, path, is_dir in sorted(entries, reverse=True)[max_entries:]:
+            if is_dir:
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def get_file_cache_paths(self, stage: str, key: str, paths: List[str]) -> List[str]:
+        directory = self.get_path(stage, key)
+        return [os.path.join(directory, f"{i}_{os.path.basename(p)}") for i, p in enumerate(paths)]
+
+    def record(self, stage: str, skipped: bool, count: int = 1) -> None:
+        with self.lock:
+            stage_stats = self.stats.setdefault(stage, {"skipped": 0, "computed": 0})
+            stage_stats["skipped" if skipped else "computed"] += count
+
+    def print_summary(self, **other_stats: Dict[str, int]) -> None:
+        """Which stages were skipped, other_stats: counts of caches managed elsewhere"""
+        print("Run summary:")
+        for stage, stats in {**other_stats, **self.stats}.items():
+            total = stats["skipped"] + stats["computed"]
+            if total:
+                print(f"  {stage}: {stats['skipped']} of {total} skipped")
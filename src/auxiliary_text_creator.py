@@ -1,3 +1,4 @@
+from functools import lru_cache
 from PIL import Image
 
 
@@ -50,15 +51,21 @@ class Auxiliary_text_creator:
         poster_image.paste(qr_code, signature_qr_code_position.xy_px)
 
     def create_qr_code(self, link: str, size_px: int) -> Image:
-        import qrcode
+        return create_qr_code(link, size_px)
 
-        qr = qrcode.QRCode(
-            version=1,
-            box_size=1,
-            border=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-        )
-        qr.add_data(link)
-        qr.make(fit=True)
-        img = qr.make_image(fill="black", back_color="white")
-        return img.resize((size_px, size_px), Image.BICUBIC)
\ No newline at end of file
+
+@lru_cache(maxsize=32)
+def create_qr_code(link: str, size_px: int) -> Image:
+    """QR code image of the link, cached since the same codes appear on every poster"""
+    import qrcode
+
+    qr = qrcode.QRCode(
+        version=1,
+        box_size=1,
+        border=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+    )
+    qr.add_data(link)
+    qr.make(fit=True)
+    img = qr.make_image(fill="black", back_color="white")
+    return img.resize((size_px, size_px), Image.BICUBIC)
\ No newline at end of file
@@ -0,0 +1,81 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Tuple
+import numpy as np
+import layout_generator
+from numpy_canvas import Numpy_canvas
+from constants import *
+
+# Set in each worker process by init_worker
+worker_state = {}
+
+
+class Band_compositor:
+    """Compositing of the grid by several processes.
+    The poster canvas lies in shared memory (released by close, or at the end of a with block)
+    and is split into row bands, one per row of the grid. Each worker draws the shading, shadows, covers and texts intersecting its band
+    directly into the canvas (clipped to the band), so the bands need no stitching."""
+
+    def __init__(self, layout: layout_generator.PosterLayout, processes: int) -> None:
+        self.layout = layout
+        self.processes = processes
+        width, height = layout.poster.dim.dim_px
+        self.shape = (height, width, 3)
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)))
+        pixels = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shared_memory.buf)
+        self.canvas = Numpy_canvas((width, height), layout.poster.background_color_hex, pixels)
+
+    def get_bands(self) -> List[Tuple[int, int, int, int]]:
+        """Boxes (x0, y0, x1, y1) of the bands, bounded by the top of the shading of each row"""
+        width, height = self.layout.poster.dim.dim_px
+        edges = [0]
+        for row in range(1, self.layout.grid.n_books[V]):
+            edges.append(int(self.layout.get_shading_start_position(0, row).xy_px[V]))
+        edges.append(height)
+        return [(0, y0, width, y1) for y0, y1 in zip(edges[:-1], edges[1:]) if y0 < y1]
+
+    def composite(self, creator) -> None:
+        """Adding the books of the creator to the canvas, band by band in parallel"""
+        # Computed once here instead of in every band
+        cover_boxes = creator.get_grid_cover_boxes()
+        with ProcessPoolExecutor(
+            max_workers=self.processes,
+            initializer=init_worker,
+            initargs=(creator, cover_boxes, self.shared_memory.name, self.shape),
+        ) as executor:
+            # Raises the first error of a worker
+            list(executor.map(composite_band, self.get_bands()))
+
+    def __enter__(self) -> "Band_compositor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Releasing the shared memory. The segment is removed at once, the memory is freed
+        once images created from the canvas are deleted (e.g. with the traceback of an error)."""
+        self.canvas = None
+        self.shared_memory.unlink()
+        try:
+            self.shared_memory.close()
+        except BufferError:  # images of the canvas still exist
+            pass
+
+
+def init_worker(creator, cover_boxes: List[tuple], shared_memory_name: str, shape: tuple) -> None:
+    worker_state["creator"] = creator
+    worker_state["cover_boxes"] = cover_boxes
+    worker_state["shared_memory"] = shared_memory.SharedMemory(name=shared_memory_name)
+    worker_state["pixels"] = np.ndarray(
+        shape, dtype=np.uint8, buffer=worker_state["shared_memory"].buf
+    )
+
+
+def composite_band(band_box: tuple) -> None:
+    x0, y0, x1, y1 = band_box
+    # The band of the shared canvas, drawn in poster coordinates
+    band = Numpy_canvas(
+        (x1 - x0, y1 - y0), pixels=worker_state["pixels"][y0:y1, x0:x1], origin=(x0, y0)
+    )
+    worker_state["creator"].add_books_in_grid_band(band, band_box, worker_state["cover_boxes"])
@@ -0,0 +1,98 @@
+"""Compares the PIL and the NumPy compositing backends on a large synthetic grid.
+The books are added by Book_poster_creator.add_books_in_grid, as for a poster.
+Usage: python src/benchmark_compositing.py [columns rows [repeats]]"""
+
+import dataclasses
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from PIL import Image, ImageDraw
+import poster_config
+import layout_generator
+from book_poster_creator import Book_poster_creator, COVER_URL_KEY
+from layout_spec import LayoutSpec
+from layout_sweep import get_config_layout
+from numpy_canvas import Numpy_canvas
+from constants import *
+
+
+def main() -> None:
+    n_books = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (30, 40)
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    # A copy of the layout configuration with the grid size, the defaults are not changed
+    config_layout = get_config_layout({"grid.n_books": n_books})
+    config = poster_config.Config(stream_covers=False)
+    layout = layout_generator.PosterLayoutCreator(
+        spec=LayoutSpec.from_config(config_layout, config)
+    ).create_poster_layout()
+    with tempfile.TemporaryDirectory() as covers_dir:
+        books = create_books(layout, covers_dir)
+        creator = Book_poster_creator(
+            layout, dataclasses.replace(config, covers_dir=covers_dir), [], books=books
+        )
+        # Covers are resized before timing, only the compositing is compared
+        for book in creator.books:
+            creator.get_cover_image(book)
+        print(
+            f"Compositing {n_books[H]}x{n_books[V]} books on a "
+            f"{layout.poster.dim.width_px}x{layout.poster.dim.height_px} px poster:"
+        )
+        for backend in ["pil", "numpy"]:
+            times = [composite(creator, backend) for _ in range(repeats)]
+            print(f"  {backend:>5}: {min(times):.3f} s (best of {repeats})")
+
+
+def create_books(layout: layout_generator.PosterLayout, covers_dir: str) -> np.ndarray:
+    """Books filling the grid, read over several years, with a few distinct noise covers
+    (identical files, like the deduplicated covers of a poster)"""
+    rng = np.random.default_rng(0)
+    width, height = layout.book.cover_area.dim_px
+    cover_files = []
+    for i in range(16):
+        cover_file = os.path.join(covers_dir, f"noise_{i}.jpg")
+        Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), "RGB").save(cover_file)
+        cover_files.append(cover_file)
+    first_read_at = datetime(year=2015, month=1, day=1, tzinfo=timezone.utc)
+    books = []
+    for i in range(layout.grid.n_books_total):
+        shutil.copyfile(cover_files[i % len(cover_files)], os.path.join(covers_dir, f"{i}.jpg"))
+        read_at = first_read_at + timedelta(days=3 * i)
+        books.append(
+            {
+                "book_id": str(i),
+                "title": f"Book {i}",
+                "author_name": "Author",
+                "num_pages": "123",
+                "average_rating": "3.9",
+                "user_rating": "4",
+                "user_read_at": read_at.strftime("%a, %d %b %Y %H:%M:%S %z"),
+                "user_name": "benchmark",
+                COVER_URL_KEY: f"https://example.com/{i}.jpg",  # downloaded already
+            }
+        )
+    return np.array(books)
+
+
+def composite(creator: Book_poster_creator, backend: str) -> float:
+    start = time.perf_counter()
+    layout = creator.layout
+    if backend == "numpy":
+        poster_image = Numpy_canvas(layout.poster.dim.dim_px, layout.poster.background_color_hex)
+        draw = poster_image
+    else:
+        poster_image = Image.new(
+            "RGB", layout.poster.dim.dim_px, layout.poster.background_color_hex
+        )
+        draw = ImageDraw.Draw(poster_image)
+    creator.add_books_in_grid(poster_image, draw)
+    if backend == "numpy":
+        poster_image = poster_image.to_image()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
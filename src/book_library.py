@@ -0,0 +1,133 @@
+import itertools
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Iterable, Tuple
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    user_name TEXT NOT NULL,
+    book_id TEXT NOT NULL,
+    read_at TEXT NOT NULL,  -- ISO 8601 in UTC, sorts by time
+    entry TEXT NOT NULL,  -- fields of the feed entry as JSON
+    PRIMARY KEY (user_name, book_id)
+);
+CREATE INDEX IF NOT EXISTS books_read_at ON books (read_at);
+CREATE INDEX IF NOT EXISTS books_book_id ON books (book_id);
+CREATE TABLE IF NOT EXISTS shelves (
+    user_name TEXT NOT NULL,
+    shelf TEXT NOT NULL,
+    book_id TEXT NOT NULL,
+    PRIMARY KEY (user_name, shelf, book_id)
+);
+"""
+
+
+class Book_library:
+    """Local record of the books loaded so far (SQLite), one row per user and book.
+    The feeds are synced into it and the books of a poster are selected by a query
+    (shelves, date range, the newest n), so other date ranges need no new downloads."""
+
+    SYNC_BATCH_SIZE = 1000  # books written at once
+
+    def __init__(self, db_file: str) -> None:
+        if os.path.dirname(db_file):
+            os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        self.connection.executescript(SCHEMA)
+
+    def sync(
+        self, shelf: str, dated_books: Iterable[Tuple[datetime, dict]], is_complete: bool = False
+    ) -> set:
+        """Adding or updating the books of a shelf, given with their read dates.
+        If the books are the complete shelf, books no longer on it are removed from it.
+        Returns the names of the users of the books."""
+        rows = (
+            (book["user_name"], book["book_id"], self.to_key(read_at), self.to_json(book))
+            for read_at, book in dated_books
+        )
+        user_names = set()
+        with self.connection:
+            # In batches, the books (e.g. of a large export) are not all held in memory
+            while True:
+                batch = list(itertools.islice(rows, self.SYNC_BATCH_SIZE))
+                if not batch:
+                    break
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO books (user_name, book_id, read_at, entry) "
+                    "VALUES (?, ?, ?, ?)",
+                    batch,
+                )
+                new_user_names = {row[0] for row in batch} - user_names
+                if is_complete:
+                    for user_name in new_user_names:
+                        self.connection.execute(
+                            "DELETE FROM shelves WHERE user_name = ? AND shelf = ?",
+                            (user_name, shelf),
+                        )
+                user_names |= new_user_names
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO shelves (user_name, shelf, book_id) VALUES (?, ?, ?)",
+                    [(row[0], shelf, row[1]) for row in batch],
+                )
+            # Books on no shelf any more
+            self.connection.execute(
+                "DELETE FROM books WHERE NOT EXISTS (SELECT 1 FROM shelves "
+                "WHERE shelves.user_name = books.user_name AND shelves.book_id = books.book_id)"
+            )
+        return user_names
+
+    def query(
+        self,
+        shelves: Iterable[str],
+        start_date: datetime,
+        end_date: datetime,
+        max_books: int = None,
+        user_names: Iterable[str] = None,
+    ) -> np.ndarray:
+        """Books on the shelves read in the date range, at most the max_books read last,
+        ordered by read date. Books of several users (same book_id) are included once."""
+        shelves = list(shelves)
+        conditions = [
+            "books.read_at BETWEEN ? AND ?",
+            f"shelves.shelf IN ({', '.join('?' * len(shelves))})",
+        ]
+        parameters = [self.to_key(start_date), self.to_key(end_date), *shelves]
+        if user_names is not None:
+            user_names = list(user_names)
+            conditions.append(f"books.user_name IN ({', '.join('?' * len(user_names))})")
+            parameters += user_names
+        # The entry of the user who read the book last (SQLite takes the row of MAX)
+        rows = self.connection.execute(
+            "SELECT books.entry, MAX(books.read_at) AS last_read_at FROM books "
+            "JOIN shelves ON shelves.user_name = books.user_name "
+            "AND shelves.book_id = books.book_id "
+            f"WHERE {' AND '.join(conditions)} "
+            "GROUP BY books.book_id ORDER BY last_read_at DESC LIMIT ?",
+            parameters + [max_books if max_books is not None else -1],
+        ).fetchall()
+        return np.array([json.loads(entry) for entry, _ in reversed(rows)])
+
+    def count_books(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    def __enter__(self) -> "Book_library":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @staticmethod
+    def to_key(date: datetime) -> str:
+        return date.astimezone(timezone.utc).isoformat()
+
+    @staticmethod
+    def to_json(book: dict) -> str:
+        """The text fields of the entry, these are all fields used for the poster"""
+        return json.dumps({key: value for key, value in book.items() if isinstance(value, str)})
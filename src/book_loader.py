@@ -1,71 +1,358 @@
-from datetime import datetime
+import contextlib
+import csv
+import hashlib
+import heapq
+import itertools
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import urllib.error
+import warnings
 import numpy as np
 import feedparser
-from typing import Tuple
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Sequence, Tuple
 import poster_config
+from http_client import Http_client
+from artifact_cache import Artifact_cache
+from book_library import Book_library
+
+# Shelf feeds return at most this many books per page, shorter pages are the last page
+FEED_PAGE_SIZE = 100
+
+
+class No_books_error(Exception):
+    """No books for the poster (e.g. empty feeds or no books read in the date range)"""
+
+
+def open_library(config: poster_config.Config):
+    """The library of the config as context manager, which closes it (no library if not set)"""
+    if config.library_file:
+        return Book_library(config.library_file)
+    return contextlib.nullcontext()
+
 
 class Book_loader:
-    def __init__(self, config: poster_config.Config):
+    def __init__(
+        self,
+        config: poster_config.Config,
+        http_client: Http_client = None,
+        artifact_cache: Artifact_cache = None,
+        library: Book_library = None,
+    ):
         self.config = config
+        # Keep-alive connections, can be shared with the cover downloads
+        self.http_client = http_client if http_client is not None else Http_client.from_config(config)
+        # Parsed feeds and filtered book lists of previous runs
+        self.artifact_cache = artifact_cache if artifact_cache is not None else Artifact_cache()
+        # All books loaded so far, the books of the poster are selected from it
+        # (opened by the caller with open_library)
+        self.library = library
+
+    def get_list_of_books(self, rss_urls, max_books: int = None):
+        """Books read in the date range ordered by read date, at most the max_books read last"""
+        if self.library is not None:
+            return self.get_list_of_books_from_library(rss_urls, max_books)
+        if self.config.input_csv_file:
+            # Library export instead of the RSS feeds
+            sources = [self.load_csv(self.config.input_csv_file, max_books)]
+        else:
+            # Loading feeds (max_books allows to stop paging early)
+            sources = self.load_feeds(rss_urls, max_books)
+        # Merging and filtering is skipped if the books and the effective date range are unchanged
+        key = self.artifact_cache.get_key(
+            "filter",
+            {"parse": self.artifact_cache.get_content_hash(sources)},
+            *self.get_effective_date_range(itertools.chain.from_iterable(sources)),
+            max_books,
+        )
+        filtered_books = self.artifact_cache.load("filter", key)
+        self.artifact_cache.record("filter", skipped=filtered_books is not None)
+        if filtered_books is None:
+            filtered_books = self.merge_books(sources, max_books)
+            self.artifact_cache.save("filter", key, filtered_books)
+        return filtered_books
 
-    def get_list_of_books(self, rss_urls):
-        # Loading feeds
-        books = self.load_feeds(rss_urls)
-        # Reordering books by read date
-        books, read_at_list = self.sort_books(books)
-        # Excluding books read before start_date
-        books = self.filter_books_by_date(
-            books, read_at_list, self.config.start_date, self.config.end_date
+    def get_list_of_books_from_library(self, rss_urls, max_books: int = None) -> np.ndarray:
+        """Syncing the feeds (or the CSV export) into the library and querying the books.
+        Without syncing, the books are taken from the library only."""
+        user_names = None
+        if self.config.sync_library:
+            user_names = self.sync_library(rss_urls, max_books)
+        if self.config.input_csv_file:
+            shelves = [self.config.csv_shelf]
+        else:
+            shelves = [self.get_shelf(url) for url in rss_urls]
+        books = self.library.query(
+            shelves, self.config.start_date, self.config.end_date, max_books, user_names
         )
+        print(f"{books.size} books selected from the library ({self.library.db_file})")
+        if books.size == 0:
+            raise No_books_error(
+                f"No books read between {self.config.start_date.date()} and {self.config.end_date.date()}. Please check the feeds and your date constraints and try again."
+            )
         return books
 
-    def load_feeds(self, rss_urls: list) -> np.ndarray:
-        """Downloading the RSS feed and converting it to an array of books"""
+    def sync_library(self, rss_urls, max_books: int = None) -> set:
+        """Adding the loaded books to the library, returns the names of their users"""
+        if self.config.input_csv_file:
+            # The export contains the complete shelf, its rows are read while syncing
+            print(f"Loading {self.config.input_csv_file}...")
+            books = self.iter_csv_books(self.config.input_csv_file, in_date_range_only=False)
+            shelf_books = [(self.config.csv_shelf, books, True)]
+        else:
+            print("Loading feeds...")
+            shelf_books = []
+            for i, url in enumerate(rss_urls):
+                books, is_complete = self.load_feed_pages(url, i, max_books)
+                shelf_books.append((self.get_shelf(url), books, is_complete))
+        user_names = set()
+        for shelf, books, is_complete in shelf_books:
+            user_names |= self.library.sync(
+                shelf, ((self.get_read_date(book), book) for book in books), is_complete
+            )
+        return user_names
+
+    def get_shelf(self, url: str) -> str:
+        """Shelf of a feed, feeds without shelf contain all shelves"""
+        return dict(parse_qsl(urlsplit(url).query)).get("shelf", "#ALL#")
+
+    def merge_books(self, sources: List[Iterable[dict]], max_books: int = None) -> np.ndarray:
+        """Merging the books of several feeds by read date, newest first, in one pass (k-way merge).
+        Duplicates (by book_id) are dropped as they appear, keeping the entry read last.
+        The merge stops at the first book read before start_date or once max_books are found,
+        so only the books on the poster are collected. Returns them ordered oldest first."""
+        books = []
+        book_ids = set()
+        merged = heapq.merge(
+            *[self.iter_newest_first(source, max_books) for source in sources],
+            key=itemgetter(0),
+            reverse=True,
+        )
+        for read_at, book in merged:
+            if read_at < self.config.start_date:
+                break  # all further books were read before
+            if read_at > self.config.end_date or book["book_id"] in book_ids:
+                continue
+            book_ids.add(book["book_id"])
+            books.append(book)
+            if max_books is not None and len(books) == max_books:
+                break
+        if not books:
+            raise No_books_error(
+                f"No books read between {self.config.start_date.date()} and {self.config.end_date.date()}. Please check the feeds and your date constraints and try again."
+            )
+        return np.array(books[::-1])
+
+    def iter_newest_first(
+        self, books: Sequence[dict], max_books: int = None
+    ) -> Iterator[Tuple[datetime, dict]]:
+        """(read date, book) of the books, newest first. Feeds sorted by read date
+        (sort=user_read_at) are read lazily, so the merge stops reading them early.
+        Of other sources, only the max_books read last in the date range are kept."""
+        if self.is_newest_first(books):
+            return ((self.get_read_date(book), book) for book in books)
+        return iter(self.get_newest_books(books, max_books))
+
+    def is_newest_first(self, books: Iterable[dict]) -> bool:
+        read_dates, next_read_dates = itertools.tee(map(self.get_read_date, books))
+        next(next_read_dates, None)
+        return all(a >= b for a, b in zip(read_dates, next_read_dates))
+
+    def get_newest_books(
+        self, books: Iterable[dict], max_books: int = None
+    ) -> List[Tuple[datetime, dict]]:
+        """(read date, book) of the max_books read last in the date range, newest first.
+        One pass over the books with a min-heap of at most max_books (the oldest on top).
+        A shelf lists each book once, duplicates of several feeds are dropped by the merge."""
+        newest = []  # (read date, position, book), the position breaks ties of dates
+        for i, book in enumerate(books):
+            read_at = self.get_read_date(book)
+            if not self.config.start_date <= read_at <= self.config.end_date:
+                continue
+            if max_books is None or len(newest) < max_books:
+                heapq.heappush(newest, (read_at, i, book))
+            elif read_at > newest[0][0]:
+                heapq.heapreplace(newest, (read_at, i, book))
+        newest.sort(key=itemgetter(0, 1), reverse=True)
+        return [(read_at, book) for read_at, _, book in newest]
+
+    def get_effective_date_range(self, books: Iterable[dict]) -> Tuple[str, str]:
+        """Date range as far as it excludes any books, e.g. an end date after the last read date
+        (like the default: now) gives the same books as any other end date after it"""
+        first_read_at = last_read_at = None
+        for book in books:  # one pass, the read dates are not collected
+            read_at = self.get_read_date(book)
+            first_read_at = read_at if first_read_at is None else min(first_read_at, read_at)
+            last_read_at = read_at if last_read_at is None else max(last_read_at, read_at)
+        start_date, end_date = self.config.start_date, self.config.end_date
+        start_str = start_date.isoformat() if start_date > first_read_at else "first"
+        end_str = end_date.isoformat() if end_date < last_read_at else "last"
+        return start_str, end_str
+
+    def load_feeds(self, rss_urls: list, max_books: int = None) -> List[list]:
+        """Downloading the RSS feeds, the books of each feed in feed order"""
         print("Loading feeds...")
-        books = np.atleast_1d(np.array([]))
-        for i, url in enumerate(rss_urls):
-            feed = feedparser.parse(url)
-            print(f"Feed {i}:", feed.feed.title)
-            books_from_feed = np.array(feed.entries)
-            books = np.concatenate((books, books_from_feed))
-        books = np.array(
-            list({b["book_id"]: b for b in books}.values())
-        )  # removing duplicates
+        feeds = [self.load_feed_pages(url, i, max_books)[0] for i, url in enumerate(rss_urls)]
+        if not any(feeds):
+            raise No_books_error("No books found in the feeds. Please check the feeds and try again.")
+        return feeds
+
+    def load_csv(self, csv_file: str, max_books: int = None) -> np.ndarray:
+        """Reading books from a Goodreads library export (CSV), row by row.
+        Only books on the shelf and in the date range are kept, at most the max_books read last,
+        ordered newest first."""
+        print(f"Loading {csv_file}...")
+        file_hash = hashlib.sha256()
+        with open(csv_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):  # the export may be large
+                file_hash.update(chunk)
+        key = self.artifact_cache.get_key(
+            "parse",
+            {"download": file_hash.hexdigest()},
+            "csv",
+            self.config.csv_shelf,
+            self.config.csv_user_name,
+            *self.get_effective_csv_date_range(),
+            max_books,
+        )
+        books = self.artifact_cache.load("parse", key)
+        self.artifact_cache.record("parse", skipped=books is not None)
+        if books is None:
+            # The rows are in no order, only max_books of them are held while reading
+            newest_books = self.get_newest_books(self.iter_csv_books(csv_file), max_books)
+            books = np.array([book for _, book in newest_books])
+            self.artifact_cache.save("parse", key, books)
         if books.size == 0:
-            exit("No books found in the feeds. Please check the feeds and try again.")
+            raise No_books_error(f"No books found in {csv_file}. Please check the file and the shelf name and try again.")
         return books
 
-    def sort_books(self, books: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-        """Reordering books by read date"""
-        read_at_list = []
-        for book in books:
-            if book["user_read_at"] == "":  # no read date entered
-                read_at_list.append(self.config.DEFAULT_READ_DATE)
-            else:
-                read_at_list.append(
-                    datetime.strptime(book["user_read_at"], "%a, %d %b %Y %H:%M:%S %z")
+    def get_effective_csv_date_range(self) -> Tuple[str, str]:
+        """The end date is only relevant up to the day (CSV dates are midnight UTC),
+        an end date in the future (like the default: now) is the same as today"""
+        end_date = min(self.config.end_date, datetime.now(timezone.utc))
+        return self.config.start_date.isoformat(), str(end_date.astimezone(timezone.utc).date())
+
+    def iter_csv_books(self, csv_file: str, in_date_range_only: bool = True) -> Iterator[dict]:
+        with open(csv_file, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                shelves = [s.strip() for s in row.get("Bookshelves", "").split(",")]
+                if self.config.csv_shelf not in [row.get("Exclusive Shelf")] + shelves:
+                    continue
+                book = self.convert_csv_row(row)
+                if not in_date_range_only or (
+                    self.config.start_date <= self.get_read_date(book) <= self.config.end_date
+                ):
+                    yield book
+
+    def convert_csv_row(self, row: dict) -> dict:
+        """Converting a CSV row into the fields of an RSS feed entry"""
+        isbn = (row.get("ISBN13") or row.get("ISBN") or "").strip('="')
+        book = {
+            "book_id": row["Book Id"],
+            "title": row["Title"],
+            "author_name": row["Author"],
+            "book_published": row.get("Original Publication Year") or row.get("Year Published", ""),
+            "num_pages": row.get("Number of Pages", ""),
+            "average_rating": row.get("Average Rating") or "0",
+            "user_rating": row.get("My Rating") or "0",
+            "user_read_at": self.convert_csv_date(row.get("Date Read", "")),
+            "user_date_added": self.convert_csv_date(row.get("Date Added", "")),
+            "user_name": self.config.csv_user_name,
+            "isbn": isbn,
+        }
+        # The export contains no cover links, Open Library provides covers by ISBN
+        for size, key in [("S", "book_small_image_url"), ("M", "book_medium_image_url"), ("L", "book_large_image_url")]:
+            book[key] = f"https://covers.openlibrary.org/b/isbn/{isbn}-{size}.jpg?default=false" if isbn else ""
+        return book
+
+    def convert_csv_date(self, date_str: str) -> str:
+        """Converting a CSV date (e.g. 2023/05/14) into the RSS date format"""
+        if not date_str:
+            return ""
+        date = datetime.strptime(date_str, "%Y/%m/%d").replace(tzinfo=timezone.utc)
+        return date.strftime("%a, %d %b %Y %H:%M:%S %z")
+
+    def load_feed_pages(self, url: str, feed_index: int, max_books: int = None) -> Tuple[list, bool]:
+        """Paging through a shelf feed, the feed only returns up to 100 books per page.
+        Also returns if the entries are the complete shelf (all pages loaded without errors)."""
+        feed = self.parse_feed(self.get_page_url(url, 1))
+        print(f"Feed {feed_index}:", feed.feed.get("title", url))
+        entries = list(feed.entries)
+        has_errors = bool(feed.bozo)
+        last_page_is_full = len(entries) >= FEED_PAGE_SIZE
+        n_pages = 1
+        next_page = 2
+        with ThreadPoolExecutor(max_workers=self.config.feed_page_concurrency) as executor:
+            while (
+                last_page_is_full
+                and next_page <= self.config.max_feed_pages
+                and not self.is_enough_loaded(entries, url, max_books)
+            ):
+                pages = range(
+                    next_page,
+                    min(next_page + self.config.feed_page_concurrency, self.config.max_feed_pages + 1),
                 )
-        read_at_list = np.array(read_at_list)
-        order = np.argsort(read_at_list).astype(int)
-        books = books[order]
-        read_at_list = read_at_list[order]
-        return books, read_at_list
+                feeds = executor.map(
+                    lambda page: self.parse_feed(self.get_page_url(url, page)), pages
+                )
+                for feed in feeds:
+                    entries += feed.entries
+                    has_errors = has_errors or bool(feed.bozo)
+                    n_pages += 1
+                    if len(feed.entries) < FEED_PAGE_SIZE:  # last page reached
+                        last_page_is_full = False
+                        break
+                next_page = pages[-1] + 1
+        if n_pages > 1:
+            print(f"  {len(entries)} books on {n_pages} pages")
+        return entries, not last_page_is_full and not has_errors
 
-    def filter_books_by_date(
-        self,
-        books: np.ndarray,
-        read_at_list: np.ndarray,
-        start_date: datetime,
-        end_date: datetime,
-    ) -> np.ndarray:
-        """Excluding books read before start_date"""
+    def parse_feed(self, url: str) -> feedparser.FeedParserDict:
+        """Downloading and parsing a feed page, parsing is skipped if the page is unchanged"""
         try:
-            start_index = np.where(start_date <= read_at_list)[0][0]
-            end_index = np.where(read_at_list <= end_date)[0][-1]
-        except IndexError:
-            exit(
-                f"No books read between {start_date.date()} and {end_date.date()}. Please check the feeds and your date constraints and try again."
-            )
-        read_at_list = read_at_list[start_index : end_index + 1]
-        books = books[start_index : end_index + 1]
-        return books
\ No newline at end of file
+            response = self.http_client.get(url)
+        except urllib.error.URLError as e:
+            warnings.warn(f"Feed {url} not available ({e}).")
+            return feedparser.parse(b"")
+        response_headers = {
+            "content-location": response.url,
+            "content-type": response.headers.get("content-type", ""),
+        }
+        key = self.artifact_cache.get_key(
+            "parse", {"download": hashlib.sha256(response.body).hexdigest()}, "feed", response_headers
+        )
+        feed = self.artifact_cache.load("parse", key)
+        self.artifact_cache.record("parse", skipped=feed is not None)
+        if feed is None:
+            feed = feedparser.parse(response.body, response_headers=response_headers)
+            self.artifact_cache.save("parse", key, feed)
+        return feed
+
+    def get_page_url(self, url: str, page: int) -> str:
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        query_parameters = [(k, v) for k, v in parse_qsl(query) if k != "page"]
+        query_parameters.append(("page", str(page)))
+        return urlunsplit((scheme, netloc, path, urlencode(query_parameters), fragment))
+
+    def is_enough_loaded(self, entries: list, url: str, max_books: int = None) -> bool:
+        """Checks if further pages can not contribute to the poster.
+        Only possible for feeds sorted by read date, newest first."""
+        query = dict(parse_qsl(urlsplit(url).query))
+        if query.get("sort") != "user_read_at" or query.get("order", "d") != "d":
+            return False
+        read_at_list = [self.get_read_date(entry) for entry in entries]
+        # All books on later pages were read before start_date
+        if read_at_list and read_at_list[-1] < self.config.start_date:
+            return True
+        # Enough books to fill the poster
+        n_books_in_range = sum(
+            self.config.start_date <= read_at <= self.config.end_date
+            for read_at in read_at_list
+        )
+        return max_books is not None and n_books_in_range >= max_books
+
+    def get_read_date(self, book: dict) -> datetime:
+        if book["user_read_at"] == "":  # no read date entered
+            return self.config.DEFAULT_READ_DATE
+        return datetime.strptime(book["user_read_at"], "%a, %d %b %Y %H:%M:%S %z")
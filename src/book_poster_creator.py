@@ -1,40 +1,366 @@
 # Future work:
-# TODO: Add a shadow to the books (plot blurred rectangle first, use mask to blurr selectively? or paste blurred image?)
 # TODO: Font color options
 # TODO: Update class structure
 
 
+import dataclasses
+import logging
+import math
+import re
+import time
 import warnings
+from dataclasses import dataclass, field
 from datetime import datetime
 import sys
 import os
+import json
 from os.path import exists
-import urllib
+import urllib.error
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
 from PIL import Image, ImageDraw
 from typing import Tuple, List
 import poster_config
 from dimensions import Dimensions
 import layout_generator
-from book_loader import Book_loader
+from book_loader import Book_loader, No_books_error, open_library
 from year_shader import Year_shader
 from auxiliary_text_creator import Auxiliary_text_creator
+from poster_exporter import Poster_exporter, OutputSpec
+from chrome_cache import Chrome_cache
+from justified_layout import Justified_layout, Cover_cell
+from cover_store import Cover_store
+from pdf_writer import Pdf_document, Pdf_canvas
+from http_client import Http_client
+from layout_spec import LayoutSpec
+from layout_cache import Layout_cache
+from artifact_cache import Artifact_cache
+from book_library import Book_library
+from json_fields import from_json_fields, to_json_fields
+from numpy_canvas import Numpy_canvas
+from band_compositor import Band_compositor
+from shadow_renderer import Shadow_renderer
 from constants import *
 
+logger = logging.getLogger(__name__)
+
+COVER_URL_KEY = "book_large_image_url"
+# Increased whenever the record of the missing covers changes, other versions are ignored
+MISSING_COVERS_VERSION = 2
+LOSSLESS_FORMATS = ("PNG", "TIFF", "BMP")
+# Cover variants of the feeds, smallest first, with a lower bound of their height in px
+# (used if the URL does not state the size, e.g. "._SY75_"). None: the largest variant
+COVER_URL_KEYS = {
+    "book_small_image_url": 75,
+    "book_medium_image_url": 100,
+    "book_large_image_url": None,
+}
+
 
 def main() -> None:
     """Creates a poster with the book covers of a 'read' shelf on goodreads using RSS feeds"""
     check_python_version()
+    # The progress of the render is logged
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     # List of RSS-feeds to use
-    # Warning: Goodreads only supports upto 100 books per rss feed!
-    #          Recommended: To get the 100 books you read last, add '&sort=user_read_at' at the end of the rss url.
-    #          For posters with more than 100 books, split shelves into shelves with less than 100 books.
-    #          Duplicates are eliminated.
-    layout = layout_generator.PosterLayoutCreator().create_poster_layout()
+    # Shelf feeds return up to 100 books per page, all pages are loaded (see load_feed_pages).
+    # '&sort=user_read_at' is added to the urls, so paging stops once the poster is full.
+    # Duplicates are eliminated.
     config = poster_config.Config()
-    rss_urls = read_rss_urls(config.input_rss_file)
-    creator = Book_poster_creator(layout, config, rss_urls)
-    creator.create_poster_image()
+    rss_urls = [] if config.input_csv_file else read_rss_urls(config.input_rss_file)
+    # Results of previous runs (only stages with changed inputs are computed again)
+    # and the connections for feeds and covers
+    caches = Render_caches.from_config(config)
+    try:
+        books, spec = load_books(config, rss_urls, caches)
+    except No_books_error as e:
+        exit(str(e))
+    if config.multi_sheet:
+        results = render_sheets(books, spec, config.get_output_specs(), config, caches, rss_urls)
+    else:
+        results = [render_poster(books, spec, config.get_output_specs(), config, caches, rss_urls)]
+    caches.artifact_cache.print_summary(
+        layout=caches.layout_cache.stats,
+        chrome=caches.chrome_cache.stats,
+        resize=results[-1].resize_stats,
+    )
+
+
+def load_books(
+    config: poster_config.Config, rss_urls: List[str], caches: "Render_caches"
+) -> Tuple[np.ndarray, LayoutSpec]:
+    """Books of the feeds (or the CSV export) and the layout spec of the ConfigLayout"""
+    with open_library(config) as library:
+        loader = Book_loader(config, caches.http_client, caches.artifact_cache, library)
+        if poster_config.ConfigLayout.grid["auto_size"]:
+            # The grid size depends on the number of books
+            books = loader.get_list_of_books(rss_urls)
+            return books, LayoutSpec.from_config(poster_config.ConfigLayout(), config, books.size)
+        spec = LayoutSpec.from_config(poster_config.ConfigLayout(), config)
+        if config.multi_sheet:
+            return loader.get_list_of_books(rss_urls), spec
+        # Only the books read last that fit on the poster are loaded
+        layout = caches.layout_cache.get_layout(spec)
+        return loader.get_list_of_books(rss_urls, max_books=layout.grid.n_books_total), spec
+
+
+@dataclass
+class Render_caches:
+    """Caches and connections shared by renders, all thread-safe.
+    Created once (e.g. per service) and passed to every render_poster call."""
+
+    layout_cache: Layout_cache = field(default_factory=Layout_cache)
+    chrome_cache: Chrome_cache = field(default_factory=Chrome_cache)
+    artifact_cache: Artifact_cache = field(default_factory=Artifact_cache)
+    http_client: Http_client = None  # None: new connections for each render
+
+    @classmethod
+    def from_config(cls, config: poster_config.Config) -> "Render_caches":
+        return cls(http_client=Http_client.from_config(config))
+
+
+@dataclass
+class Render_result:
+    files: List[str]  # all files and directories written
+    n_books: int  # books on the poster
+    start_date: datetime  # of the title, the read date of the first book if the grid is full
+    end_date: datetime
+    restored: bool  # copied from the cache, unchanged since a previous render
+    render_time_s: float
+    resize_stats: dict  # covers resized and reused
+    # Books drawn with title cards as their covers missed the deadline, see patch_missing_covers
+    missing_book_ids: List[str] = field(default_factory=list)
+
+
+def render_poster(
+    books: np.ndarray,
+    layout_spec: LayoutSpec,
+    outputs: List[OutputSpec],
+    config: poster_config.Config = None,
+    caches: Render_caches = None,
+    rss_urls: List[str] = (),
+) -> Render_result:
+    """Renders the poster of the books (ordered by read date) into the outputs.
+    If the first output is a .pdf file, it must be the only output.
+    Neither the arguments nor any global state are changed, so renders can run concurrently
+    (in threads), sharing only the caches. Outputs of concurrent renders must differ.
+    rss_urls: only for the profile link of the signature"""
+    if len(books) == 0:
+        raise No_books_error("No books to render.")
+    check_outputs(outputs)
+    start = time.perf_counter()
+    caches = caches if caches is not None else Render_caches()
+    # Copy of the config for this render
+    config = dataclasses.replace(
+        config if config is not None else poster_config.Config(),
+        output_file=outputs[0].file,
+        output_spec=outputs[0],
+        additional_outputs=tuple(outputs[1:]),
+    )
+    creator = Book_poster_creator(
+        caches.layout_cache.get_layout(layout_spec),
+        config,
+        list(rss_urls),
+        books=np.asarray(books),
+        chrome_cache=caches.chrome_cache,
+        http_client=caches.http_client,
+        artifact_cache=caches.artifact_cache,
+    )
+    if config.output_file.lower().endswith(".pdf"):
+        restored = creator.create_poster_pdf()
+        files = [config.output_file]
+    else:
+        restored = creator.create_poster_image()
+        files = Poster_exporter.get_output_paths(config.get_output_specs())
+    return get_render_result(creator, files, restored, start)
+
+
+def render_sheets(
+    books: np.ndarray,
+    layout_spec: LayoutSpec,
+    outputs: List[OutputSpec],
+    config: poster_config.Config = None,
+    caches: Render_caches = None,
+    rss_urls: List[str] = (),
+) -> List[Render_result]:
+    """Renders the books (ordered by read date) onto as many sheets as needed, all with the
+    same layout, cover store and caches. Images are rendered in parallel into numbered files
+    (poster_1.jpg, poster_2.jpg, ...). If the first output is a .pdf file (which must be the
+    only output), the sheets are the pages of one PDF. Returns the results of the sheets."""
+    if len(books) == 0:
+        raise No_books_error("No books to render.")
+    check_outputs(outputs)
+    start = time.perf_counter()
+    caches = caches if caches is not None else Render_caches()
+    config = config if config is not None else poster_config.Config()
+    layout = caches.layout_cache.get_layout(layout_spec)
+    sheets = split_into_sheets(np.asarray(books), layout, config.sheet_year_boundaries)
+    is_pdf = outputs[0].file.lower().endswith(".pdf")
+    creators = []
+    cover_store = None  # shared by all sheets, they have the same layout
+    for i, sheet_books in enumerate(sheets):
+        sheet_outputs = [
+            dataclasses.replace(spec, file=get_sheet_file(spec.file, i, len(sheets)))
+            for spec in outputs
+        ]
+        sheet_config = dataclasses.replace(
+            config,
+            output_file=outputs[0].file if is_pdf else sheet_outputs[0].file,
+            output_spec=outputs[0],
+            additional_outputs=tuple(sheet_outputs[1:]),
+            # Title of the sheet: from the first book, to the last one
+            start_date=config.start_date if i == 0 else get_read_date(sheet_books[0]),
+            end_date=config.end_date if i == len(sheets) - 1 else get_read_date(sheet_books[-1]),
+        )
+        creator = Book_poster_creator(
+            layout,
+            sheet_config,
+            list(rss_urls),
+            books=sheet_books,
+            chrome_cache=caches.chrome_cache,
+            cover_store=cover_store,
+            http_client=caches.http_client,
+            artifact_cache=caches.artifact_cache,
+        )
+        cover_store = creator.cover_store
+        creators.append(creator)
+    logger.info(f"{len(books)} books on {len(sheets)} sheets")
+    if is_pdf:
+        # The pages share the fonts and the covers embedded in the document
+        document = Pdf_document()
+        for creator in creators:
+            creator.add_pdf_page(document)
+        logger.info("Saving Poster...")
+        document.save(outputs[0].file)
+        logger.info("Done!")
+        return [get_render_result(creator, [outputs[0].file], False, start) for creator in creators]
+    with ThreadPoolExecutor(max_workers=config.parallel_sheets) as executor:
+        restored = list(executor.map(lambda creator: creator.create_poster_image(), creators))
+    return [
+        get_render_result(
+            creator,
+            Poster_exporter.get_output_paths(creator.config.get_output_specs()),
+            is_restored,
+            start,
+        )
+        for creator, is_restored in zip(creators, restored)
+    ]
+
+
+def check_outputs(outputs: List[OutputSpec]) -> None:
+    """A PDF as first output is created from the layout instead of a rendered image, further
+    outputs can not be encoded from it"""
+    if not outputs:
+        raise ValueError("No outputs to render.")
+    if outputs[0].file.lower().endswith(".pdf") and len(outputs) > 1:
+        raise ValueError(
+            f"The PDF output {outputs[0].file} must be the only output, "
+            f"{len(outputs) - 1} further outputs given!"
+        )
+
+
+def split_into_sheets(
+    books: np.ndarray, layout: layout_generator.PosterLayout, on_year_boundaries: bool = False
+) -> List[np.ndarray]:
+    """Consecutive parts of the books that fit on a sheet, the first sheet with the books read
+    first. On year boundaries, a sheet ends before the first book of a year, unless the sheet
+    would only contain books of that year."""
+    n_books_per_sheet = layout.grid.n_books_total
+    first_books_in_years = []
+    if on_year_boundaries:
+        first_books_in_years = Year_shader(layout).get_first_books_in_years(books)[1]
+    sheets = []
+    start = 0
+    while start < len(books):
+        end = min(start + n_books_per_sheet, len(books))
+        if end < len(books):
+            # The last year starting on the sheet moves to the next one
+            year_starts = [b for b in first_books_in_years if start < b <= end]
+            if year_starts:
+                end = year_starts[-1]
+        sheets.append(books[start:end])
+        start = end
+    return sheets
+
+
+def get_sheet_file(file: str, sheet_index: int, n_sheets: int) -> str:
+    """poster.jpg -> poster_1.jpg (numbered from 1, zero-padded to the digits of the last sheet)"""
+    base, extension = os.path.splitext(file)
+    return f"{base}_{sheet_index + 1:0{len(str(n_sheets))}d}{extension}"
+
+
+def get_read_date(book: dict) -> datetime:
+    return datetime.strptime(book["user_read_at"], "%a, %d %b %Y %H:%M:%S %z")
+
+
+def get_render_result(
+    creator: "Book_poster_creator", files: List[str], restored: bool, start: float
+) -> Render_result:
+    return Render_result(
+        files=files,
+        n_books=int(creator.books.size),
+        start_date=creator.config.start_date,
+        end_date=creator.config.end_date,
+        restored=restored,
+        render_time_s=time.perf_counter() - start,
+        resize_stats=dict(creator.cover_store.stats),
+        missing_book_ids=sorted(creator.late_book_ids),
+    )
+
+
+def get_missing_covers_file(output_file: str) -> str:
+    return f"{os.path.splitext(output_file)[0]}_missing_covers.json"
+
+
+def get_master_file(output_file: str) -> str:
+    """Lossless copy of a poster with missing covers, if none of its outputs is lossless"""
+    return f"{os.path.splitext(output_file)[0]}_missing_covers.tif"
+
+
+def patch_missing_covers(output_file: str, caches: "Render_caches" = None) -> List[str]:
+    """Background refresh of a poster rendered with a deadline: downloading the covers that
+    were missing (without deadline) and drawing them into their cells.
+    Returns the ids of the books patched, covers still missing are kept in the record."""
+    record_file = get_missing_covers_file(output_file)
+    if not exists(record_file):
+        return []
+    with open(record_file) as f:
+        record = json.load(f)
+    if record.get("version") != MISSING_COVERS_VERSION:
+        warnings.warn(f"Record {record_file} of another version ignored.")
+        return []
+    caches = caches if caches is not None else Render_caches()
+    # Covers are only downloaded for the missing books
+    config = dataclasses.replace(
+        from_json_fields(poster_config.Config, record["config"]),
+        cover_deadline_s=None,
+        stream_covers=True,
+    )
+    creator = Book_poster_creator(
+        caches.layout_cache.get_layout(from_json_fields(LayoutSpec, record["layout_spec"])),
+        config,
+        record["rss_urls"],
+        books=np.array(record["books"]),
+        chrome_cache=caches.chrome_cache,
+        http_client=caches.http_client,
+        artifact_cache=caches.artifact_cache,
+    )
+    # The books of the cells, in the order of the poster
+    missing_books = [creator.books[cell] for cell in record["missing_cells"].values()]
+    with ThreadPoolExecutor(max_workers=config.download_concurrency) as executor:
+        list(executor.map(creator.download_cover, missing_books))
+    creator.cover_store.save_index()
+    # Covers still missing (e.g. no cover available), the poster is complete otherwise
+    creator.late_book_ids = {
+        book["book_id"] for book in missing_books if creator.is_cover_missing(book)
+    }
+    patched_books = [book for book in missing_books if creator.has_cover(book)]
+    if patched_books:
+        creator.patch_cells(patched_books, record.get("master_file"))
+    creator.save_missing_covers()
+    return [book["book_id"] for book in patched_books]
 
 
 def read_rss_urls(input_rss_file: str) -> List[str]:
@@ -43,13 +369,13 @@ def read_rss_urls(input_rss_file: str) -> List[str]:
             line.strip().strip("-,.:;!#$%^&*_=+<>'\" ") for line in f.readlines()
         ]
     rss_urls = [line for line in rss_urls if line]  # removes empty lines
-    for line in rss_urls:
+    for i, line in enumerate(rss_urls):
+        # Sorting by read date allows to stop paging once the poster is full
         if "&sort=" not in line:
             line += "&sort=user_read_at"
         if "/list_rss/" not in line and "/list/" in line:
-            line = "".join(
-                line.split("/list/")[0], "/list_rss/", line.split("/list/")[1]
-            )
+            line = "/list_rss/".join(line.split("/list/", 1))
+        rss_urls[i] = line
     return rss_urls
 
 
@@ -59,16 +385,75 @@ class Book_poster_creator:
         layout: layout_generator.PosterLayout,
         config: poster_config.Config,
         rss_urls: List[str],
+        books: np.ndarray = None,
+        chrome_cache: Chrome_cache = None,
+        cover_store: Cover_store = None,
+        http_client: Http_client = None,
+        artifact_cache: Artifact_cache = None,
     ) -> None:
         self.layout = layout
         self.config = config
-        self.user_profile_link = self.get_user_profile_link_from_rss(rss_urls[0])
-        loader = Book_loader(self.config)
-        self.books = loader.get_list_of_books(rss_urls)
+        # Covers not downloaded by then are drawn as title cards (None: no deadline)
+        self.cover_deadline = (
+            None if config.cover_deadline_s is None else time.monotonic() + config.cover_deadline_s
+        )
+        self.late_book_ids = set()  # books whose cover missed the deadline
+        self.http_client = http_client if http_client is not None else Http_client.from_config(config)
+        # Results of previous runs (parsed feeds, filtered books, posters)
+        self.artifact_cache = artifact_cache if artifact_cache is not None else Artifact_cache()
+        # Pre-rendered title and signatures, can be shared between creators
+        self.chrome_cache = chrome_cache if chrome_cache is not None else Chrome_cache()
+        # Decoded and resized covers, shared by books with identical cover images
+        self.cover_store = (
+            cover_store
+            if cover_store is not None
+            else Cover_store(
+                self.resize_cover_image,
+                self.layout.book.font.path,
+                self.config.covers_dir,
+                self.config.max_covers_in_flight,
+            )
+        )
+        self.rss_urls = list(rss_urls)
+        self.user_profile_link = self.get_user_profile_link(rss_urls)
+        if books is None:
+            with open_library(self.config) as library:
+                loader = Book_loader(self.config, self.http_client, self.artifact_cache, library)
+                books = loader.get_list_of_books(
+                    rss_urls, max_books=self.layout.grid.n_books_total
+                )
+        self.books = books
         # Eliminate books that do not fit on the poster (for the given grid size)
         self.filter_books_by_grid_size()
         # Download the book covers from Goodreads
-        self.download_covers()
+        # (if streamed, covers are downloaded while the poster is created)
+        self.covers_downloaded = False
+        if not self.config.stream_covers:
+            self.download_covers()
+
+    def __getstate__(self) -> dict:
+        """For the worker processes of the Band_compositor: clients and caches with locks
+        are left out, the workers only draw"""
+        state = dict(self.__dict__)
+        for name in ("http_client", "artifact_cache", "chrome_cache", "cover_store"):
+            state[name] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.cover_store = Cover_store(
+            self.resize_cover_image,
+            self.layout.book.font.path,
+            self.config.covers_dir,
+            self.config.max_covers_in_flight,
+        )
+
+    def get_user_profile_link(self, rss_urls: List[str]) -> str:
+        if rss_urls:
+            return self.get_user_profile_link_from_rss(rss_urls[0])
+        if self.config.goodreads_user_id is not None:
+            return f"https://www.goodreads.com/user/show/{self.config.goodreads_user_id}"
+        return "https://www.goodreads.com"
 
     def get_user_profile_link_from_rss(self, rss_url: str) -> str:
         user_id = int(rss_url.split("?")[0].split("/")[-1])
@@ -77,45 +462,568 @@ class Book_poster_creator:
     def filter_books_by_grid_size(self) -> None:
         if self.books.size > self.layout.grid.n_books_total:
             warnings.warn(
-                f"Warning: The current poster grid only supports {self.layout.grid.n_books_total} books. {self.books.size - self.layout.grid.n_books_total} books are not included.",
+                f"Warning: The current poster grid only supports {self.layout.grid.n_books_total} books. {self.books.size - self.layout.grid.n_books_total} books are not included (see multi_sheet in poster_config.py).",
                 DeprecationWarning,
             )
             # Removing the first books to only include the books read last in the poster.
             self.books = self.books[-self.layout.grid.n_books_total :]
-            self.config.start_date = datetime.strptime(
-                self.books[0]["user_read_at"], "%a, %d %b %Y %H:%M:%S %z"
+            # A copy, the config may be shared with other renders
+            self.config = dataclasses.replace(
+                self.config,
+                start_date=datetime.strptime(
+                    self.books[0]["user_read_at"], "%a, %d %b %Y %H:%M:%S %z"
+                ),
             )
 
-    def download_covers(
-        self, COVER_URL_KEY: str = "book_large_image_url", PATH_TO_COVERS="./covers"
-    ) -> None:
-        """Downloading the book covers from goodreads (if not downloaded already)"""
-        print(f"Downloading missing covers of {int(self.books.size)} books...")
-        if not exists(PATH_TO_COVERS):
-            os.mkdir(PATH_TO_COVERS)
+    def download_covers(self, COVER_URL_KEY: str = None, PATH_TO_COVERS: str = None) -> None:
+        """Downloading the book covers from goodreads (if not downloaded already).
+        Without COVER_URL_KEY, the variant is chosen by the resolution of the cover area."""
+        logger.info(f"Downloading missing covers of {int(self.books.size)} books...")
+        executor = ThreadPoolExecutor(max_workers=self.config.download_concurrency)
+        # Submitted in grid order, so the first cells are filled first
+        futures = [
+            executor.submit(self.download_cover, book, COVER_URL_KEY, PATH_TO_COVERS)
+            for book in self.books
+        ]
+        done, _ = wait(futures, timeout=self.get_time_to_deadline())
+        # Downloads still running are not waited for (their covers are kept for later runs),
+        # pending ones are cancelled (by hand, shutdown(cancel_futures=True) needs Python 3.9)
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+        for book, future in zip(self.books, futures):
+            if future in done:
+                future.result()  # raises the errors of the download
+            else:
+                self.late_book_ids.add(book["book_id"])
+        self.warn_late_covers()
+        logger.info("Done!")
+        self.covers_downloaded = True
+        self.http_client.log_stats()
+        self.cover_store.save_index()
+
+    def download_cover(self, book: dict, COVER_URL_KEY: str = None, PATH_TO_COVERS: str = None) -> None:
+        """Downloading the cover, or a larger variant if the downloaded one is too small"""
+        PATH_TO_COVERS = PATH_TO_COVERS or self.config.covers_dir
+        cover_url_key = COVER_URL_KEY or self.get_cover_url_key(book)
+        if not book.get(cover_url_key):
+            warnings.warn(f'No cover available for "{book["title"]}".')
+            return
+        if self.cover_store.is_placeholder_url(book[cover_url_key]):
+            return  # replaced by a title card, no need to download
+        cover_file = self.get_cover_filename(book, PATH_TO_COVERS)
+        is_downloaded = exists(cover_file) and not self.is_larger_variant(
+            cover_url_key, self.cover_store.get_source(cover_file)
+        )
+        self.artifact_cache.record("covers", skipped=is_downloaded)
+        if not is_downloaded:
+            os.makedirs(PATH_TO_COVERS, exist_ok=True)
+            try:
+                self.http_client.download(book[cover_url_key], cover_file)
+                self.cover_store.set_source(cover_file, cover_url_key)
+            except urllib.error.URLError as e:
+                warnings.warn(f'Cover of "{book["title"]}" not available ({e}).')
+
+    def get_cover_url_key(self, book: dict) -> str:
+        """Smallest cover variant with enough pixels for the cover area (times the
+        oversampling factor), the largest variant if none is sufficient"""
+        target_size = self.get_cover_target_size()
+        available_keys = [key for key in COVER_URL_KEYS if book.get(key)]
+        for cover_url_key in available_keys:
+            width, height = self.get_cover_url_size(book[cover_url_key], cover_url_key)
+            # Covers are fitted into the cover area, one sufficient dimension is enough
+            if (
+                (width is None and height is None)
+                or (width is not None and width >= target_size[H])
+                or (height is not None and height >= target_size[V])
+            ):
+                return cover_url_key
+        return available_keys[-1] if available_keys else COVER_URL_KEY
+
+    def get_cover_target_size(self) -> Tuple[float, float]:
+        """Pixels of the cover area in the largest output (its DPI is the layout DPI times
+        the output scale), times the oversampling factor"""
+        output_scale = max(spec.scale for spec in self.config.get_output_specs())
+        return tuple(
+            size * output_scale * self.config.cover_oversampling
+            for size in self.layout.book.cover_area.dim_px
+        )
+
+    @staticmethod
+    def get_cover_url_size(url: str, cover_url_key: str) -> Tuple[int, int]:
+        """Width and height of a cover variant as far as known (None: unknown).
+        Image URLs of Goodreads state the size, e.g. "._SX98_" (width) or "._SY75_" (height)."""
+        size = {"X": None, "Y": None}
+        for match in re.finditer(r"_S([XY])(\d+)", url.rsplit("/", 1)[-1]):
+            size[match.group(1)] = int(match.group(2))
+        if size["X"] is None and size["Y"] is None:
+            size["Y"] = COVER_URL_KEYS.get(cover_url_key)
+        return size["X"], size["Y"]
+
+    @staticmethod
+    def is_larger_variant(cover_url_key: str, downloaded_url_key: str) -> bool:
+        """Checks if the variant is larger than the downloaded one
+        (covers downloaded before the variants were recorded are the largest variant)"""
+        variants = list(COVER_URL_KEYS)
+        if downloaded_url_key not in variants or cover_url_key not in variants:
+            return False
+        return variants.index(cover_url_key) > variants.index(downloaded_url_key)
+
+    def get_time_to_deadline(self) -> float:
+        """Seconds left for the cover downloads, None without deadline"""
+        if self.cover_deadline is None:
+            return None
+        return max(self.cover_deadline - time.monotonic(), 0.0)
+
+    def warn_late_covers(self) -> None:
+        if self.late_book_ids:
+            warnings.warn(
+                f"{len(self.late_book_ids)} covers not downloaded before the deadline, "
+                "title cards are drawn instead (see patch_missing_covers)."
+            )
+
+    def has_cover(self, book: dict) -> bool:
+        """Checks if a real cover image is available (not missing or a placeholder)"""
+        if book["book_id"] in self.late_book_ids:
+            return False  # even if downloaded in the meantime, the poster shows a title card
+        cover_file = self.get_cover_filename(book)
+        return exists(cover_file) and not self.cover_store.is_placeholder(
+            book, cover_file, self.get_cover_url_key(book)
+        )
+
+    def get_cover_image(self, book: dict, size: Tuple[int, int] = None) -> Image.Image:
+        """Resized cover of the book, or a generated title card if no cover is available.
+        Without size, the cover is fitted into the cover area."""
+        if not self.has_cover(book):
+            return self.cover_store.create_title_card(
+                book, size or self.layout.book.cover_area.dim_px
+            )
+        return self.cover_store.get_resized_cover(self.get_cover_filename(book), size)
+
+    def get_cover_filename(self, book: dict, PATH_TO_COVERS: str = None) -> str:
+        """Get the path to the cover image of the book"""
+        return f'{PATH_TO_COVERS or self.config.covers_dir}/{book["book_id"]}.jpg'
+
+    def create_poster_image(self) -> bool:
+        """Creating the poster image with the book covers and read date.
+        Returns True if the poster was restored from the cache."""
+        specs = self.config.get_output_specs()
+        poster_key = self.get_poster_key("image", specs, self.covers_downloaded)
+        if self.restore_poster(poster_key, specs):
+            self.save_missing_covers()
+            return True
+
+        logger.info("Creating poster...")
+        if self.config.compositing_processes > 1 and self.layout.grid.packing != "justified":
+            # The rows of the grid are composited in parallel into a canvas in shared memory,
+            # which is released even if the render fails
+            with Band_compositor(self.layout, self.config.compositing_processes) as compositor:
+                self.render_poster_image(specs, compositor)
+        else:
+            self.render_poster_image(specs)
+        self.store_poster(poster_key, "image", specs)
+        self.save_missing_covers()
+        logger.info("Done!")
+        return False
+
+    def render_poster_image(self, specs: List[OutputSpec], compositor: Band_compositor = None) -> None:
+        """Drawing the poster and saving it in all requested formats"""
+        # Create a poster with title and signatures (cached)
+        if compositor is not None or self.config.compositing_backend == "numpy":
+            # The canvas stands in for both the PIL image and the draw object
+            if compositor is not None:
+                poster_image = compositor.canvas
+            else:
+                poster_image = Numpy_canvas(
+                    self.layout.poster.dim.dim_px, self.layout.poster.background_color_hex
+                )
+            chrome_layer = self.chrome_cache.get_layer(
+                self.layout, self.config, self.user_profile_link, self.books[0]["user_name"]
+            )
+            for position, patch in chrome_layer:
+                poster_image.paste(patch, position)
+            draw = poster_image
+        else:
+            poster_image = self.chrome_cache.get_base_canvas(
+                self.layout, self.config, self.user_profile_link, self.books[0]["user_name"]
+            )
+            draw = ImageDraw.Draw(poster_image)
+
+        # Populate the poster with book covers and titles
+        logger.info("Adding books to poster...")
+        if self.layout.grid.packing == "justified":
+            if not self.covers_downloaded:
+                self.download_covers()  # all aspect ratios are needed for the rows
+            self.add_books_in_justified_rows(poster_image, draw)
+        elif compositor is not None:
+            if not self.covers_downloaded:
+                self.download_covers()  # the workers only read the covers
+            compositor.composite(self)
+        elif not self.covers_downloaded:
+            self.add_books_in_grid_streaming(poster_image, draw)
+        else:
+            self.add_books_in_grid(poster_image, draw)
+        if isinstance(poster_image, Numpy_canvas):
+            poster_image = poster_image.to_image()
+
+        # Save the poster in all requested formats
+        logger.info("Saving Poster...")
+        self.export_poster(poster_image, specs)
+
+    def export_poster(self, poster_image: Image.Image, specs: List[OutputSpec]) -> None:
+        """Saving the poster in all formats, and losslessly if covers are missing (to patch them)"""
+        export_specs = list(specs)
+        if self.late_book_ids:
+            master_spec = self.get_master_spec(specs)
+            if master_spec not in export_specs:
+                export_specs.append(master_spec)
+        exporter = Poster_exporter(self.layout.dpi)
+        exporter.log_report(exporter.export(poster_image, export_specs))
+
+    def get_master_spec(self, specs: List[OutputSpec]) -> OutputSpec:
+        """Lossless output of full size the covers are patched into later, otherwise an
+        additional TIFF file next to the record of the missing covers"""
+        for spec in specs:
+            if spec.scale == 1.0 and spec.get_format() in LOSSLESS_FORMATS:
+                return spec
+        return OutputSpec(get_master_file(self.config.output_file))
+
+    def get_poster_key(self, kind: str, specs: List[OutputSpec], covers_final: bool) -> str:
+        """Hash of everything the poster depends on. None if covers may still be downloaded
+        (covers_final: all downloads were attempted), the poster is then created anyway."""
+        cover_hashes = []
         for book in self.books:
-            if not exists(self.get_cover_filename(book)):
-                urllib.request.urlretrieve(
-                    book[COVER_URL_KEY], self.get_cover_filename(book, PATH_TO_COVERS)
+            if not self.has_cover(book):
+                if not covers_final and self.is_cover_missing(book):
+                    return None
+                cover_hashes.append(None)  # title card, depends on the book only
+            else:
+                cover_hashes.append(
+                    self.cover_store.get_hashes(self.get_cover_filename(book))["sha256"]
                 )
-        print("Done!")
+        return self.artifact_cache.get_key(
+            "poster",
+            {
+                "filter": self.artifact_cache.get_content_hash(self.books),
+                "covers": cover_hashes,
+                "layout": self.layout.get_hash(),
+                "chrome": self.chrome_cache.get_key(
+                    self.layout, self.config, self.user_profile_link, self.books[0]["user_name"]
+                ),
+            },
+            kind,
+            [self.config.get_book_str(book) for book in self.books],
+            self.config.aspect_ratio_stretch_tolerance,
+            specs,
+        )
 
-    def get_cover_filename(self, book: dict, PATH_TO_COVERS="./covers") -> str:
-        """Get the path to the cover image of the book"""
-        return f'{PATH_TO_COVERS}/{book["book_id"]}.jpg'
+    def restore_poster(self, poster_key: str, specs: List[OutputSpec]) -> bool:
+        """Copying the outputs of a previous run with identical inputs, if available"""
+        paths = Poster_exporter.get_output_paths(specs)
+        is_restored = poster_key is not None and self.artifact_cache.load_files(
+            "poster", poster_key, paths
+        )
+        self.artifact_cache.record("poster", skipped=is_restored)
+        if is_restored:
+            logger.info("Poster unchanged since the last run, restored from the cache:")
+            for path in paths:
+                logger.info(f"  {path}")
+        return is_restored
+
+    def store_poster(self, poster_key: str, kind: str, specs: List[OutputSpec]) -> None:
+        if poster_key is None:  # covers were downloaded while creating the poster
+            poster_key = self.get_poster_key(kind, specs, covers_final=True)
+        self.artifact_cache.save_files(
+            "poster", poster_key, Poster_exporter.get_output_paths(specs)
+        )
+
+    def save_missing_covers(self) -> None:
+        """Record of the covers that missed the deadline, with everything needed to patch
+        their cells later (see patch_missing_covers). Removed once no cover is missing."""
+        record_file = get_missing_covers_file(self.config.output_file)
+        if not self.late_book_ids:
+            for file in (record_file, get_master_file(self.config.output_file)):
+                if exists(file):
+                    os.remove(file)
+            return
+        record = {
+            "version": MISSING_COVERS_VERSION,
+            # Plain JSON values, the layout is created again from its spec
+            "layout_spec": to_json_fields(self.layout.spec),
+            "config": to_json_fields(self.config),
+            "books": [json.loads(Book_library.to_json(book)) for book in self.books],
+            "rss_urls": self.rss_urls,
+            # Cell (index in books) of each book whose cover is missing
+            "missing_cells": {
+                book["book_id"]: cell
+                for cell, book in enumerate(self.books)
+                if book["book_id"] in self.late_book_ids
+            },
+            # Lossless poster the covers are patched into, not saved if restored from the cache
+            "master_file": self.get_master_spec(self.config.get_output_specs()).file,
+        }
+        # Replaced at once, a patch may read it at the same time
+        temp_file = f"{record_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(record, f)
+        os.replace(temp_file, record_file)
+        logger.info(f"Missing covers recorded in {record_file}")
+
+    def patch_cells(self, books: List[dict], master_file: str = None) -> None:
+        """Drawing the covers of the books into the cells of the lossless master of the poster
+        and saving it again. Justified rows and PDFs depend on all covers, they are created
+        again, as posters without master."""
+        if self.config.output_file.lower().endswith(".pdf"):
+            self.create_poster_pdf()
+            return
+        if self.layout.grid.packing == "justified" or master_file is None or not exists(master_file):
+            self.create_poster_image()
+            return
+        logger.info(f"Patching {len(books)} covers into {self.config.output_file}...")
+        with Image.open(master_file) as poster_file:
+            poster_image = poster_file.convert("RGB")
+        chrome_layer = self.chrome_cache.get_layer(
+            self.layout, self.config, self.user_profile_link, self.books[0]["user_name"]
+        )
+        cover_boxes = self.get_grid_cover_boxes()
+        book_indices = {book["book_id"]: book_index for book_index, book in enumerate(self.books)}
+        for book in books:
+            row, col = self.grid_position(book_indices[book["book_id"]])
+            patch_box = self.get_cell_patch_box(col, row)
+            # Everything within the box is drawn again, as for a band of the Band_compositor
+            patch = Numpy_canvas(
+                (patch_box[2] - patch_box[0], patch_box[3] - patch_box[1]),
+                self.layout.poster.background_color_hex,
+                origin=patch_box[:2],
+            )
+            for position, chrome_patch in chrome_layer:
+                patch.paste(chrome_patch, position)
+            self.add_books_in_grid_band(patch, patch_box, cover_boxes)
+            poster_image.paste(patch.to_image(), patch_box[:2])
+        specs = self.config.get_output_specs()
+        self.export_poster(poster_image, specs)
+        self.store_poster(self.get_poster_key("image", specs, covers_final=True), "image", specs)
+
+    def get_cell_patch_box(self, col: int, row: int) -> Tuple[int, int, int, int]:
+        """Box (x0, y0, x1, y1) of everything a cover changes: the cover area with the outline
+        and the shadow"""
+        x, y = self.layout.get_cover_area_position(col, row).dim_px
+        width, height = self.layout.book.cover_area.dim_px
+        box = [x - 1, y - 1, x + width + 1, y + height + 1]
+        if self.layout.book.shadow.enable:
+            offset_x, offset_y = self.layout.book.shadow.offset.dim_px
+            # The blur extends about three radii beyond the shadow
+            margin = 3 * self.layout.book.shadow.blur_radius.px
+            box = [
+                min(box[0], math.floor(x + offset_x - margin)),
+                min(box[1], math.floor(y + offset_y - margin)),
+                max(box[2], math.ceil(x + width + offset_x + margin)),
+                max(box[3], math.ceil(y + height + offset_y + margin)),
+            ]
+        poster_width, poster_height = self.layout.poster.dim.dim_px
+        return (max(box[0], 0), max(box[1], 0), min(box[2], poster_width), min(box[3], poster_height))
+
+    def is_cover_missing(self, book: dict) -> bool:
+        """Checks if the cover has to be downloaded yet"""
+        cover_url = book.get(self.get_cover_url_key(book))
+        return (
+            bool(cover_url)
+            and not self.cover_store.is_placeholder_url(cover_url)
+            and not exists(self.get_cover_filename(book))
+        )
+
+    def add_books_in_grid(self, poster_image, draw) -> None:
+        # Adding shading for the years to the poster
+        self.add_year_shading(draw)
+        # Adding the shadows of all covers at once, before the covers
+        self.add_shadows(poster_image, self.get_grid_cover_boxes())
+
+        for book_index, book in enumerate(self.books):
+            # Check if the grid is already full
+            assert (
+                book_index + 1 <= self.layout.grid.n_books_total
+            ), "More books than the poster can handle!"
+
+            # Grid position of the current cover
+            row, col = self.grid_position(book_index)
+
+            # Add book cover to the poster
+            self.add_cover_to_poster(poster_image, draw, book, row, col)
+
+            # Add book-specific information below the cover
+            self.add_book_text(draw, book, row, col)
+
+    def add_books_in_grid_band(
+        self, band: Numpy_canvas, band_box: tuple, cover_boxes: List[tuple]
+    ) -> None:
+        """Adding everything of the grid within the band (x0, y0, x1, y1), as add_books_in_grid.
+        Called in the worker processes of the Band_compositor, band is clipped to the band."""
+        self.add_year_shading(band)
+        self.add_shadows(band, cover_boxes, clip=band_box)
+        band_rows = set()
+        for book_index, book in enumerate(self.books):
+            x0, y0, x1, y1 = cover_boxes[book_index]
+            # Including the outline, which extends one pixel beyond the cover
+            if y0 < band_box[3] and y1 + 1 > band_box[1]:
+                self.add_cover_to_poster(band, band, book, *self.grid_position(book_index))
+                band_rows.add(self.grid_position(book_index)[0])
+        for book_index, book in enumerate(self.books):
+            row, col = self.grid_position(book_index)
+            # Texts may reach into the neighbouring rows, they are clipped to the band
+            if band_rows & {row - 1, row, row + 1}:
+                self.add_book_text(band, book, row, col)
+
+    def add_books_in_grid_streaming(self, poster_image, draw) -> None:
+        """Covers are downloaded, resized and added to the poster as they arrive, in any order.
+        The number of resized covers waiting to be added is limited by max_covers_in_flight."""
+        self.add_year_shading(draw)
+        covers = queue.Queue(maxsize=self.config.max_covers_in_flight)
+        cancelled = threading.Event()
+
+        def load_cover(book_index: int, book: dict) -> None:
+            try:
+                self.download_cover(book)
+                item = (book_index, self.get_cover_image(book))
+            except Exception as e:  # raised again when the cover is added
+                item = (book_index, e)
+            while not cancelled.is_set():
+                try:
+                    covers.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        # Texts are drawn after the shadows, if there are any
+        draw_texts_later = self.layout.book.shadow.enable
+        cover_boxes = []
+        added_book_indices = set()
+        executor = ThreadPoolExecutor(max_workers=self.config.download_concurrency)
+        futures = [
+            executor.submit(load_cover, book_index, book)
+            for book_index, book in enumerate(self.books)
+        ]
+        try:
+            for _ in range(self.books.size):
+                try:
+                    book_index, cover_image = covers.get(timeout=self.get_time_to_deadline())
+                except queue.Empty:
+                    break  # deadline reached
+                if isinstance(cover_image, Exception):
+                    raise cover_image
+                added_book_indices.add(book_index)
+                row, col = self.grid_position(book_index)
+                cover_boxes.append(
+                    self.add_cover_image_to_poster(poster_image, draw, cover_image, row, col)
+                )
+                if not draw_texts_later:
+                    self.add_book_text(draw, self.books[book_index], row, col)
+        except BaseException:
+            # Stopping the workers, including those waiting for space in the queue
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            raise
+        late_book_indices = [i for i in range(self.books.size) if i not in added_book_indices]
+        if late_book_indices:
+            # Downloads still running are not waited for (their covers are kept for later runs)
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+        executor.shutdown(wait=not late_book_indices)
+        for book_index in late_book_indices:
+            book = self.books[book_index]
+            self.late_book_ids.add(book["book_id"])
+            row, col = self.grid_position(book_index)
+            cover_boxes.append(
+                self.add_cover_image_to_poster(
+                    poster_image, draw, self.get_cover_image(book), row, col
+                )
+            )
+            if not draw_texts_later:
+                self.add_book_text(draw, book, row, col)
+        self.warn_late_covers()
+        self.covers_downloaded = True
+        self.http_client.log_stats()
+        self.cover_store.save_index()
+
+        if draw_texts_later:
+            # Shadows are added after the covers, the covers and their outlines are excluded
+            outline_boxes = [(x0, y0, x1 + 1, y1 + 1) for x0, y0, x1, y1 in cover_boxes]
+            self.add_shadows(poster_image, cover_boxes, exclude_boxes=outline_boxes)
+            for book_index, book in enumerate(self.books):
+                self.add_book_text(draw, book, *self.grid_position(book_index))
 
-    def create_poster_image(self) -> None:
-        """Creating the poster image with the book covers and read date"""
+    def add_books_in_justified_rows(self, poster_image, draw) -> None:
+        cells = self.get_justified_cells()
+        if self.layout.year_shading.enable:
+            Year_shader(self.layout).shade_cells(self.books, draw, cells)
+        self.add_shadows(poster_image, [cell.box for cell in cells])
+        for book, cell in zip(self.books, cells):
+            cover_image = self.get_cover_image(book, (cell.width, cell.height))
+            poster_image.paste(cover_image, (cell.x, cell.y))
+            self.add_cover_outline(draw, (cell.x, cell.y), (cell.width, cell.height))
+            self.add_book_text_below_cell(draw, book, cell)
 
-        # Create a blank poster
-        print("Creating poster...")
-        poster_image = Image.new(
-            "RGB",
+    def get_justified_cells(self) -> List[Cover_cell]:
+        justified_layout = Justified_layout(self.layout)
+        aspect_ratios = justified_layout.read_aspect_ratios(
+            [self.get_cover_filename(book) for book in self.books],
+            default_aspect_ratio=self.layout.book.default_aspect_ratio,
+        )
+        return justified_layout.arrange(aspect_ratios)
+
+    def create_poster_pdf(self) -> bool:
+        """Creating the poster as PDF with vector text and the original cover JPEGs.
+        Returns True if the poster was restored from the cache."""
+        specs = [OutputSpec(self.config.output_file)]
+        poster_key = self.get_poster_key("pdf", specs, self.covers_downloaded)
+        if self.restore_poster(poster_key, specs):
+            self.save_missing_covers()
+            return True
+        logger.info("Creating PDF poster...")
+        document = Pdf_document()
+        self.add_pdf_page(document)
+        logger.info("Saving Poster...")
+        document.save(self.config.output_file)
+        self.store_poster(poster_key, "pdf", specs)
+        self.save_missing_covers()
+        logger.info("Done!")
+        return False
+
+    def add_pdf_page(self, document: Pdf_document) -> None:
+        """Adding the poster as a page of the document"""
+        canvas = Pdf_canvas(
+            document,
             self.layout.poster.dim.dim_px,
+            self.layout.dpi,
             self.layout.poster.background_color_hex,
         )
-        draw = ImageDraw.Draw(poster_image)
+        if not self.covers_downloaded:
+            self.download_covers()
+        # The canvas stands in for both the PIL image and the draw object
+        self.add_auxiliary_text(canvas, canvas)
+        logger.info("Adding books to poster...")
+        if self.layout.grid.packing == "justified":
+            cells = self.get_justified_cells()
+            if self.layout.year_shading.enable:
+                Year_shader(self.layout).shade_cells(self.books, canvas, cells)
+            self.add_shadows(canvas, [cell.box for cell in cells])
+            for book, cell in zip(self.books, cells):
+                cover_size = (cell.width, cell.height)
+                self.add_cover_image_to_pdf(canvas, book, (cell.x, cell.y), cover_size)
+                self.add_cover_outline(canvas, (cell.x, cell.y), cover_size)
+                self.add_book_text_below_cell(canvas, book, cell)
+        else:
+            self.add_year_shading(canvas)
+            self.add_shadows(canvas, self.get_grid_cover_boxes())
+            for book_index, book in enumerate(self.books):
+                row, col = self.grid_position(book_index)
+                self.add_cover_to_pdf(canvas, book, row, col)
+                self.add_book_text(canvas, book, row, col)
+        document.add_page(canvas)
 
+    def add_auxiliary_text(self, poster_image, draw) -> None:
         # Object for adding the title and signature/footer text to the poster
         if self.layout.title.enable or self.layout.signature.enable:
             text_creator = Auxiliary_text_creator(self.layout, self.config)
@@ -130,32 +1038,36 @@ class Book_poster_creator:
             )
             text_creator.add_right_signature(poster_image, draw)
 
-        # Adding shading for the years to the poster
-        if self.layout.year_shading:
+    def add_year_shading(self, draw) -> None:
+        if self.layout.year_shading.enable:
             shader = Year_shader(self.layout)
             shader.shade_years(self.books, draw)
 
-        # Populate the poster with book covers and titles
-        print("Adding books to poster...")
-        for book_index, book in enumerate(self.books):
-            # Check if the grid is already full
-            assert (
-                book_index + 1 <= self.layout.grid.n_books_total
-            ), "More books than the poster can handle!"
+    def add_shadows(
+        self,
+        poster_image,
+        cover_boxes: List[tuple],
+        exclude_boxes: List[tuple] = None,
+        clip: tuple = None,
+    ) -> None:
+        if self.layout.book.shadow.enable:
+            Shadow_renderer(self.layout).add_shadows(
+                poster_image, cover_boxes, exclude_boxes, clip
+            )
 
-            # Grid position of the current cover
+    def get_grid_cover_boxes(self) -> List[tuple]:
+        """Boxes of all covers in the grid (x0, y0, x1, y1), from the image headers only"""
+        cover_boxes = []
+        for book_index, book in enumerate(self.books):
             row, col = self.grid_position(book_index)
-
-            # Add book cover to the poster
-            self.add_cover_to_poster(poster_image, draw, book, row, col)
-
-            # Add book-specific information below the cover
-            self.add_book_text(draw, book, row, col)
-
-        # Save the poster
-        print("Saving Poster...")
-        poster_image.save(self.config.output_file)
-        print("Done!")
+            cover_size = self.get_cover_size(book)
+            position = self.layout.get_cover_position(
+                col, row, Dimensions(*cover_size, unit="px", dpi=self.layout.dpi)
+            ).dim_px
+            cover_boxes.append(
+                (position[H], position[V], position[H] + cover_size[H], position[V] + cover_size[V])
+            )
+        return cover_boxes
 
     def grid_position(self, i):
         row = i // self.layout.grid.n_books[H]
@@ -165,13 +1077,21 @@ class Book_poster_creator:
     def add_book_text(self, draw, book, row, col):
         # Add book-specific information below the cover
         # Available information in book (examples): 'title', 'author_name', 'book_published', 'num_pages', 'average_rating', 'user_rating', 'user_read_at', 'user_date_created', 'user_date_added'
+        text_position = self.layout.get_cover_text_position(col, row, [""], line_index=0)
+        self.draw_book_text(draw, book, text_position.dim_px)
+
+    def add_book_text_below_cell(self, draw, book, cell: Cover_cell) -> None:
+        text_position = (
+            cell.x + round(cell.width / 2.0),
+            cell.y + cell.height + self.layout.book.font_vspace.px,
+        )
+        self.draw_book_text(draw, book, text_position)
+
+    def draw_book_text(self, draw, book, text_position: Tuple[int, int]) -> None:
         if book["user_read_at"] != "":
             text, align_multiline = self.config.get_book_str(book)
-            text_position = self.layout.get_cover_text_position(
-                col, row, [text], line_index=0
-            )
             draw.text(
-                text_position.dim_px,
+                text_position,
                 text,
                 fill="black",
                 font=self.layout.book.font,
@@ -180,10 +1100,12 @@ class Book_poster_creator:
             )
 
     def add_cover_to_poster(self, poster_image, draw, book, row, col) -> None:
-        # Load cover image
-        cover_image = Image.open(self.get_cover_filename(book))
-        # Resizing cover image
-        cover_image = self.resize_cover_image(cover_image)
+        # Load and resize cover image (or create a title card)
+        cover_image = self.get_cover_image(book)
+        self.add_cover_image_to_poster(poster_image, draw, cover_image, row, col)
+
+    def add_cover_image_to_poster(self, poster_image, draw, cover_image, row, col) -> tuple:
+        """Adding a resized cover at its grid position, returns the box of the cover"""
         cover_size = Dimensions(
             cover_image.size[0], cover_image.size[1], unit="px", dpi=self.layout.dpi
         )
@@ -192,21 +1114,54 @@ class Book_poster_creator:
         poster_image.paste(cover_image, cover_position.dim_px)
 
         # Additing an outline to the cover
+        self.add_cover_outline(draw, cover_position.dim_px, cover_image.size)
+        x, y = cover_position.dim_px
+        return (x, y, x + cover_image.size[H], y + cover_image.size[V])
+
+    def add_cover_outline(self, draw, position: Tuple[int, int], size: Tuple[int, int]) -> None:
         draw.rectangle(
-            (
-                cover_position.dim_px,
-                tuple(cover_position.dim_px[i] + cover_image.size[i] for i in range(2)),
-            ),
+            (position, tuple(position[i] + size[i] for i in range(2))),
             fill=None,
-            width=int(cover_image.size[H] / 200.0),
+            width=int(size[H] / 200.0),
             outline="black",
         )
 
+    def get_cover_size(self, book: dict) -> Tuple[int, int]:
+        """Size of the cover in the grid, only the image header is read"""
+        if not self.has_cover(book):
+            return self.layout.book.cover_area.dim_px
+        with Image.open(self.get_cover_filename(book)) as cover_image:
+            return self.get_cover_image_size(cover_image.size)
+
+    def add_cover_to_pdf(self, canvas: Pdf_canvas, book, row, col) -> None:
+        # The cover is scaled by the PDF viewer
+        cover_image_size = self.get_cover_size(book)
+        cover_size = Dimensions(*cover_image_size, unit="px", dpi=self.layout.dpi)
+        cover_position = self.layout.get_cover_position(col, row, cover_size)
+        self.add_cover_image_to_pdf(canvas, book, cover_position.dim_px, cover_image_size)
+        self.add_cover_outline(canvas, cover_position.dim_px, cover_image_size)
+
+    def add_cover_image_to_pdf(self, canvas: Pdf_canvas, book, position, size) -> None:
+        if self.has_cover(book):
+            cover_file = self.get_cover_filename(book)
+            # Identical cover files are embedded only once
+            canvas.place_image_file(
+                cover_file, position, size, key=self.cover_store.get_hashes(cover_file)["sha256"]
+            )
+        else:
+            canvas.paste(self.cover_store.create_title_card(book, size), position)
+
     def resize_cover_image(
         self, cover_image: Image.Image
     ) -> Tuple[Image.Image, Tuple[int, int]]:
         """Resampling the cover images with the appropriate resolution"""
-        aspect_ratio = cover_image.size[H] / cover_image.size[V]
+        cover_image_size = self.get_cover_image_size(cover_image.size)
+        cover_image = cover_image.resize(cover_image_size, Image.BICUBIC)
+        return cover_image
+
+    def get_cover_image_size(self, original_size: Tuple[int, int]) -> Tuple[int, int]:
+        """Size of a cover on the poster, stretched or fitted into the cover area"""
+        aspect_ratio = original_size[H] / original_size[V]
         # If the cover's aspect ratio is similar to the optimal aspect ratio, the cover is stretched.
         if (
             np.maximum(
@@ -225,13 +1180,12 @@ class Book_poster_creator:
             )
         else:
             cover_image_size = (
-                np.round(self.layout.book.cover_area.height_px() * aspect_ratio).astype(
+                np.round(self.layout.book.cover_area.height_px * aspect_ratio).astype(
                     int
                 ),
-                self.layout.book.cover_area.height_px(),
+                self.layout.book.cover_area.height_px,
             )
-        cover_image = cover_image.resize(cover_image_size, Image.BICUBIC)
-        return cover_image
+        return cover_image_size
 
 
 
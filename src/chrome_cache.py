@@ -0,0 +1,168 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from PIL import Image, ImageChops, ImageDraw
+import layout_generator
+import poster_config
+from auxiliary_text_creator import Auxiliary_text_creator
+from constants import *
+
+# A chrome layer is stored as the few non-background patches of the poster
+# (title strip and signature strip) with their positions.
+Chrome_layer = List[Tuple[Tuple[int, int], Image.Image]]
+
+
+class Chrome_cache:
+    """Cache for the static poster elements (background, title, signatures and QR codes).
+    Layers are kept in memory (the max_layers used last) and as PNG patches on disk,
+    keyed by everything that changes them."""
+
+    def __init__(self, cache_dir: str = "./cache/chrome", max_layers: int = 16) -> None:
+        self.cache_dir = cache_dir
+        self.layers: Dict[str, Chrome_layer] = OrderedDict()
+        self.max_layers = max_layers
+        # Layers are loaded or rendered outside of the lock, by one thread per key
+        self.lock = threading.Lock()
+        self.key_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"skipped": 0, "computed": 0}
+
+    def get_base_canvas(
+        self,
+        layout: layout_generator.PosterLayout,
+        config: poster_config.Config,
+        user_profile_link: str,
+        user_name: str,
+    ) -> Image.Image:
+        """New poster canvas with the chrome already drawn"""
+        poster_image = Image.new(
+            "RGB", layout.poster.dim.dim_px, layout.poster.background_color_hex
+        )
+        for position, patch in self.get_layer(layout, config, user_profile_link, user_name):
+            poster_image.paste(patch, position)
+        return poster_image
+
+    def get_layer(
+        self,
+        layout: layout_generator.PosterLayout,
+        config: poster_config.Config,
+        user_profile_link: str,
+        user_name: str,
+    ) -> Chrome_layer:
+        """Patches of the chrome with their positions on the poster background"""
+        key = self.get_key(layout, config, user_profile_link, user_name)
+        with self.lock:
+            layer = self.get_cached_layer(key)
+            if layer is not None:
+                return layer
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Other layouts are rendered meanwhile, the same layer only once
+            with self.lock:
+                layer = self.get_cached_layer(key)
+            if layer is not None:
+                return layer
+            layer = self.load_layer(key)
+            is_computed = layer is None
+            if is_computed:
+                layer = self.render_layer(layout, config, user_profile_link, user_name)
+                self.save_layer(key, layer)
+            with self.lock:
+                self.layers[key] = layer
+                while len(self.layers) > self.max_layers:
+                    self.layers.popitem(last=False)
+                self.key_locks.pop(key, None)
+                self.stats["computed" if is_computed else "skipped"] += 1
+            return layer
+
+    def get_cached_layer(self, key: str) -> Chrome_layer:
+        """Layer in memory, None if not loaded. To be called with the lock held."""
+        layer = self.layers.get(key)
+        if layer is not None:
+            self.layers.move_to_end(key)
+            self.stats["skipped"] += 1
+        return layer
+
+    def get_key(
+        self,
+        layout: layout_generator.PosterLayout,
+        config: poster_config.Config,
+        user_profile_link: str,
+        user_name: str,
+    ) -> str:
+        key_parts = [
+            layout.get_hash(),
+            config.get_title_str(),
+            user_profile_link,
+            user_name,
+            config.credit_str,
+            config.credit_url,
+        ]
+        return hashlib.sha256("\n".join(key_parts).encode()).hexdigest()[:32]
+
+    def render_layer(
+        self,
+        layout: layout_generator.PosterLayout,
+        config: poster_config.Config,
+        user_profile_link: str,
+        user_name: str,
+    ) -> Chrome_layer:
+        background = Image.new(
+            "RGB", layout.poster.dim.dim_px, layout.poster.background_color_hex
+        )
+        chrome_image = background.copy()
+        draw = ImageDraw.Draw(chrome_image)
+        text_creator = Auxiliary_text_creator(layout, config)
+        if layout.title.enable:
+            text_creator.add_title(draw)
+        if layout.signature.enable:
+            text_creator.add_left_signature(
+                user_profile_link, chrome_image, draw, user_name=user_name
+            )
+            text_creator.add_right_signature(chrome_image, draw)
+
+        # Only the parts differing from the background are kept
+        difference = ImageChops.difference(chrome_image, background)
+        grid_top = layout.get_cover_area_position(0, 0).y_px
+        signature_top = layout.get_signature_position_left().y_px
+        strips = [
+            (0, 0, layout.poster.dim.width_px, grid_top),
+            (0, signature_top, layout.poster.dim.width_px, layout.poster.dim.height_px),
+        ]
+        layer = []
+        for strip in strips:
+            bbox = difference.crop(strip).getbbox()
+            if bbox is None:
+                continue
+            box = (strip[0] + bbox[0], strip[1] + bbox[1], strip[0] + bbox[2], strip[1] + bbox[3])
+            layer.append(((box[0], box[1]), chrome_image.crop(box)))
+        return layer
+
+    def get_layer_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load_layer(self, key: str) -> Chrome_layer:
+        layer_dir = self.get_layer_dir(key)
+        if not os.path.exists(layer_dir):
+            return None
+        layer = []
+        for filename in sorted(os.listdir(layer_dir)):
+            # Patch files are named by their position: <index>_<x>_<y>.png
+            _, x, y = os.path.splitext(filename)[0].split("_")
+            with Image.open(os.path.join(layer_dir, filename)) as patch:
+                layer.append(((int(x), int(y)), patch.convert("RGB")))
+        return layer
+
+    def save_layer(self, key: str, layer: Chrome_layer) -> None:
+        layer_dir = self.get_layer_dir(key)
+        temp_dir = f"{layer_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(temp_dir, exist_ok=True)
+        for i, (position, patch) in enumerate(layer):
+            patch.save(os.path.join(temp_dir, f"{i}_{position[H]}_{position[V]}.png"))
+        try:
+            os.rename(temp_dir, layer_dir)
+        except OSError:  # written by another process in the meantime
+            for filename in os.listdir(temp_dir):
+                os.remove(os.path.join(temp_dir, filename))
+            os.rmdir(temp_dir)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import textwrap
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from constants import *
+
+
+class Cover_store:
+    """Access to the cover images of the books.
+    Covers are identified by a hash of their file content, so identical covers (e.g. several
+    editions with the same image) are decoded and resized only once. Placeholder images
+    ("no photo" covers) are detected and replaced by generated title cards."""
+
+    INDEX_FILE = "index.json"
+    SOURCES_FILE = "sources.json"  # cover variant (URL key) each cover was downloaded from
+    PLACEHOLDER_DIR = "placeholders"  # example placeholder images, compared by perceptual hash
+    PLACEHOLDER_URL_PATTERNS = ("nophoto",)
+    MAX_PHASH_DISTANCE = 4  # bits
+    MAX_BRIGHTNESS_DIFFERENCE = 16  # of 255, plain covers have similar hashes
+
+    def __init__(
+        self,
+        resize_function: Callable[[Image.Image], Image.Image],
+        font_path: str,
+        path_to_covers: str = "./covers",
+        max_resized_covers: int = 32,
+    ) -> None:
+        self.resize_function = resize_function
+        self.font_path = font_path
+        self.path_to_covers = path_to_covers
+        self.lock = threading.Lock()
+        # (content hash, size) -> resized cover, the covers used last (limits the memory)
+        self.resized_covers: Dict[tuple, Image.Image] = OrderedDict()
+        self.max_resized_covers = max_resized_covers
+        # Decoded covers by content hash, e.g. shared by the stores of a layout sweep (read only)
+        self.decoded_covers: Dict[str, Image.Image] = None
+        self.stats = {"skipped": 0, "computed": 0}  # resizes
+        self.index = self.load_index()
+        self.sources = self.load_sources()
+        self.placeholder_hashes = self.load_placeholder_hashes()
+
+    def load_index(self) -> Dict[str, dict]:
+        """Hashes of the cover files from previous runs, valid as long as the file is unchanged"""
+        index_path = os.path.join(self.path_to_covers, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return {}
+        with open(index_path) as f:
+            return json.load(f)
+
+    def load_sources(self) -> Dict[str, str]:
+        sources_path = os.path.join(self.path_to_covers, self.SOURCES_FILE)
+        if not os.path.exists(sources_path):
+            return {}
+        with open(sources_path) as f:
+            return json.load(f)
+
+    def save_index(self) -> None:
+        os.makedirs(self.path_to_covers, exist_ok=True)
+        with self.lock:
+            index = dict(self.index)
+            sources = dict(self.sources)
+        # Replaced at once, other stores may save at the same time
+        for filename, content in ((self.INDEX_FILE, index), (self.SOURCES_FILE, sources)):
+            path = os.path.join(self.path_to_covers, filename)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(content, f)
+            os.replace(temp_path, path)
+
+    def get_source(self, cover_file: str) -> str:
+        """URL key of the cover variant in the file, None if unknown"""
+        with self.lock:
+            return self.sources.get(cover_file)
+
+    def set_source(self, cover_file: str, cover_url_key: str) -> None:
+        with self.lock:
+            self.sources[cover_file] = cover_url_key
+
+    def load_placeholder_hashes(self) -> list:
+        placeholder_dir = os.path.join(self.path_to_covers, self.PLACEHOLDER_DIR)
+        if not os.path.isdir(placeholder_dir):
+            return []
+        return [
+            self.get_perceptual_hashes(os.path.join(placeholder_dir, filename))
+            for filename in sorted(os.listdir(placeholder_dir))
+        ]
+
+    def is_placeholder_url(self, url: str) -> bool:
+        return any(pattern in url for pattern in self.PLACEHOLDER_URL_PATTERNS)
+
+    def get_hashes(self, cover_file: str) -> dict:
+        """Content hash (identical files) and image size of a cover"""
+        stat = os.stat(cover_file)
+        with self.lock:
+            entry = self.index.get(cover_file)
+        if entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return entry
+        with open(cover_file, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        with Image.open(cover_file) as cover_image:
+            image_size = cover_image.size  # from the header, the image is not decoded
+        entry = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "sha256": content_hash,
+            "image_size": image_size,
+        }
+        with self.lock:
+            self.index[cover_file] = entry
+        return entry
+
+    def get_perceptual_hashes(self, cover_file: str) -> dict:
+        """Hashes of get_hashes with the perceptual hash (similar images), which is only
+        calculated for covers compared with placeholder images"""
+        entry = self.get_hashes(cover_file)
+        if "phash" not in entry:
+            with Image.open(cover_file) as cover_image:
+                phash, brightness = self.get_perceptual_hash(cover_image)
+            entry = dict(entry, phash=phash, brightness=brightness)
+            with self.lock:
+                self.index[cover_file] = entry
+        return entry
+
+    @staticmethod
+    def get_perceptual_hash(image: Image.Image) -> Tuple[int, float]:
+        """64 bit difference hash and mean brightness of the grayscale image"""
+        image.draft("L", (32, 32))  # JPEGs are decoded at reduced size
+        pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+        bits = (pixels[:, :-1] > pixels[:, 1:]).flatten()
+        return sum(1 << int(i) for i in np.flatnonzero(bits)), float(pixels.mean())
+
+    def is_placeholder(self, book: dict, cover_file: str, cover_url_key: str) -> bool:
+        if self.is_placeholder_url(book.get(cover_url_key, "")):
+            return True
+        if not os.path.exists(cover_file):
+            return False
+        hashes = self.get_hashes(cover_file)
+        if min(hashes["image_size"]) < 10:  # e.g. 1x1 px "not found" images of image CDNs
+            return True
+        if not self.placeholder_hashes:
+            return False
+        if any(hashes["sha256"] == placeholder["sha256"] for placeholder in self.placeholder_hashes):
+            return True
+        hashes = self.get_perceptual_hashes(cover_file)
+        return any(
+            bin(hashes["phash"] ^ placeholder["phash"]).count("1") <= self.MAX_PHASH_DISTANCE
+            and abs(hashes["brightness"] - placeholder["brightness"]) <= self.MAX_BRIGHTNESS_DIFFERENCE
+            for placeholder in self.placeholder_hashes
+        )
+
+    def get_resized_cover(self, cover_file: str, size: Tuple[int, int] = None) -> Image.Image:
+        """Resized cover, decoded and resized only once per distinct image content while it
+        is among the max_resized_covers used last. Without size, the resize function of the
+        layout is used."""
+        key = (self.get_hashes(cover_file)["sha256"], size)
+        with self.lock:
+            resized_cover = self.resized_covers.get(key)
+            if resized_cover is not None:
+                self.resized_covers.move_to_end(key)
+            self.stats["computed" if resized_cover is None else "skipped"] += 1
+        if resized_cover is None:
+            cover_image = self.get_decoded_cover(cover_file)
+            if size is None:
+                resized_cover = self.resize_function(cover_image)
+            else:
+                resized_cover = cover_image.resize(size, Image.BICUBIC)
+            with self.lock:
+                self.resized_covers[key] = resized_cover
+                while len(self.resized_covers) > self.max_resized_covers:
+                    self.resized_covers.popitem(last=False)
+        return resized_cover
+
+    def get_decoded_cover(self, cover_file: str) -> Image.Image:
+        """Cover as RGB image, from the decoded covers if available"""
+        if self.decoded_covers is not None:
+            decoded_cover = self.decoded_covers.get(self.get_hashes(cover_file)["sha256"])
+            if decoded_cover is not None:
+                return decoded_cover
+        with Image.open(cover_file) as cover_image:
+            return cover_image.convert("RGB")
+
+    def create_title_card(self, book: dict, size: Tuple[int, int]) -> Image.Image:
+        """Simple generated cover with title and author"""
+        title_card = Image.new("RGB", size, "#E6E2DA")
+        draw = ImageDraw.Draw(title_card)
+        margin = size[H] // 10
+        title_font = ImageFont.truetype(self.font_path, size=max(size[H] // 9, 1))
+        author_font = ImageFont.truetype(self.font_path, size=max(size[H] // 13, 1))
+        # Rough line length for the average character width of about half the font size
+        title_lines = textwrap.wrap(
+            book.get("title", ""), width=max((size[H] - 2 * margin) * 2 // title_font.size, 1)
+        )
+        title = "\n".join(title_lines[:5])
+        draw.multiline_text(
+            (size[H] / 2.0, size[V] / 3.0),
+            title,
+            fill="black",
+            font=title_font,
+            anchor="ma",
+            align="center",
+        )
+        draw.text(
+            (size[H] / 2.0, size[V] - margin),
+            book.get("author_name", ""),
+            fill="#404040",
+            font=author_font,
+            anchor="md",
+        )
+        return title_card
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Tuple
+from PIL import Image
+from constants import *
+
+logger = logging.getLogger(__name__)
+
+
+class Deep_zoom_writer:
+    """Writes an image as Deep Zoom (DZI) tile pyramid for web viewers like OpenSeadragon.
+    Tiles whose pixels did not change since the last export are not re-encoded."""
+
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(
+        self,
+        tile_size: int = 254,
+        overlap: int = 1,
+        tile_format: str = "jpg",
+        quality: int = 90,
+        max_workers: int = None,
+    ) -> None:
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.tile_format = tile_format
+        self.quality = quality
+        self.max_workers = max_workers
+
+    def write(self, image: Image.Image, dzi_file: str) -> int:
+        """Writing the pyramid next to the .dzi file, returns the total size of all tiles in bytes"""
+        tiles_dir = self.get_tiles_dir(dzi_file)
+        os.makedirs(tiles_dir, exist_ok=True)
+        old_manifest = self.load_manifest(tiles_dir, image.size)
+        new_manifest = {}
+        n_written = 0
+        max_level = math.ceil(math.log2(max(image.size)))
+        level_image = image
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for level in range(max_level, -1, -1):
+                os.makedirs(os.path.join(tiles_dir, str(level)), exist_ok=True)
+                tile_boxes = self.get_tile_boxes(level, level_image.size)
+                results = executor.map(
+                    partial(self.write_tile, level_image, tiles_dir, old_manifest=old_manifest),
+                    tile_boxes.items(),
+                )
+                for tile_name, digest, written in results:
+                    new_manifest[tile_name] = digest
+                    n_written += written
+                # Each level is half the size of the previous one (rounded up)
+                level_image = level_image.reduce(2)
+
+        self.remove_stale_tiles(tiles_dir, old_manifest, new_manifest)
+        self.save_manifest(tiles_dir, image.size, new_manifest)
+        self.write_descriptor(dzi_file, image.size)
+        logger.info(f"  Deep zoom: {n_written} of {len(new_manifest)} tiles written, the others are unchanged.")
+        return sum(
+            os.path.getsize(os.path.join(tiles_dir, self.get_tile_path(name)))
+            for name in new_manifest
+        )
+
+    @staticmethod
+    def get_tiles_dir(dzi_file: str) -> str:
+        return os.path.splitext(dzi_file)[0] + "_files"
+
+    def get_tile_boxes(self, level: int, level_size: Tuple[int, int]) -> Dict[str, tuple]:
+        n_cols = math.ceil(level_size[H] / self.tile_size)
+        n_rows = math.ceil(level_size[V] / self.tile_size)
+        tile_boxes = {}
+        for col in range(n_cols):
+            for row in range(n_rows):
+                x0 = max(col * self.tile_size - self.overlap, 0)
+                y0 = max(row * self.tile_size - self.overlap, 0)
+                x1 = min((col + 1) * self.tile_size + self.overlap, level_size[H])
+                y1 = min((row + 1) * self.tile_size + self.overlap, level_size[V])
+                tile_boxes[f"{level}/{col}_{row}"] = (x0, y0, x1, y1)
+        return tile_boxes
+
+    def get_tile_path(self, tile_name: str) -> str:
+        return f"{tile_name}.{self.tile_format}"
+
+    def write_tile(
+        self, level_image: Image.Image, tiles_dir: str, item: tuple, old_manifest: Dict[str, str]
+    ) -> Tuple[str, str, bool]:
+        tile_name, box = item
+        tile = level_image.crop(box)
+        digest = hashlib.blake2b(tile.tobytes(), digest_size=16).hexdigest()
+        tile_path = os.path.join(tiles_dir, self.get_tile_path(tile_name))
+        if old_manifest.get(tile_name) == digest and os.path.exists(tile_path):
+            return tile_name, digest, False
+        tile.save(tile_path, quality=self.quality)
+        return tile_name, digest, True
+
+    def load_manifest(self, tiles_dir: str, size: Tuple[int, int]) -> Dict[str, str]:
+        manifest_path = os.path.join(tiles_dir, self.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        # Tiles of another poster size or tiling are not comparable
+        if manifest.get("parameters") != self.get_parameters(size):
+            return {name: None for name in manifest.get("tiles", {})}
+        return manifest["tiles"]
+
+    def save_manifest(self, tiles_dir: str, size: Tuple[int, int], tiles: Dict[str, str]) -> None:
+        with open(os.path.join(tiles_dir, self.MANIFEST_FILE), "w") as f:
+            json.dump({"parameters": self.get_parameters(size), "tiles": tiles}, f)
+
+    def get_parameters(self, size: Tuple[int, int]) -> List:
+        return [list(size), self.tile_size, self.overlap, self.tile_format, self.quality]
+
+    def remove_stale_tiles(
+        self, tiles_dir: str, old_manifest: Dict[str, str], new_manifest: Dict[str, str]
+    ) -> None:
+        for tile_name in set(old_manifest) - set(new_manifest):
+            tile_path = os.path.join(tiles_dir, self.get_tile_path(tile_name))
+            if os.path.exists(tile_path):
+                os.remove(tile_path)
+
+    def write_descriptor(self, dzi_file: str, size: Tuple[int, int]) -> None:
+        with open(dzi_file, "w") as f:
+            f.write(
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+                f'Format="{self.tile_format}" Overlap="{self.overlap}" TileSize="{self.tile_size}">\n'
+                f'  <Size Width="{size[H]}" Height="{size[V]}"/>\n'
+                "</Image>\n"
+            )
@@ -0,0 +1,270 @@
+import base64
+import email.utils
+import gzip
+import http.client
+import logging
+import os
+import random
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from urllib.parse import unquote, urljoin, urlsplit
+import poster_config
+
+logger = logging.getLogger(__name__)
+
+# Connection errors of a keep-alive connection closed by the server in the meantime
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class Http_response:
+    url: str  # after redirects
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+@dataclass
+class Http_stats:
+    requests: int = 0
+    connections_opened: int = 0
+    connections_reused: int = 0
+    retries: int = 0
+    bytes_received: int = 0
+    hosts: Dict[str, int] = field(default_factory=dict)  # requests per host
+
+
+class Rate_limiter:
+    """Spaces requests evenly, shared by all threads"""
+
+    def __init__(self, requests_per_second: float = None) -> None:
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            request_time = max(now, self.next_time)
+            self.next_time = request_time + self.interval
+        time.sleep(request_time - now)
+
+
+class Http_client:
+    """HTTP/1.1 client with one pool of keep-alive connections per host.
+    Used for the feeds and the covers, which come from a few hosts only. Responses are
+    requested gzip-compressed, failed requests are retried with jittered exponential backoff
+    (honoring Retry-After) and all requests pass a global rate limiter.
+    Proxies are taken from the environment (http_proxy, https_proxy, no_proxy) as by urllib,
+    HTTPS connections are tunneled through the proxy."""
+
+    MAX_REDIRECTS = 5
+    MAX_IDLE_CONNECTIONS_PER_HOST = 8
+
+    def __init__(
+        self,
+        max_retries: int = 4,
+        backoff_s: float = 0.5,
+        requests_per_second: float = None,
+        timeout_s: float = 30.0,
+        user_agent: str = "book-poster",
+    ) -> None:
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.timeout_s = timeout_s
+        self.user_agent = user_agent
+        self.rate_limiter = Rate_limiter(requests_per_second)
+        self.ssl_context = ssl.create_default_context()  # certificates are loaded only once
+        self.proxies = urllib.request.getproxies()
+        self.idle_connections: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self.lock = threading.Lock()
+        self.stats = Http_stats()
+
+    @classmethod
+    def from_config(cls, config: poster_config.Config) -> "Http_client":
+        return cls(
+            max_retries=config.http_max_retries,
+            requests_per_second=config.http_requests_per_second,
+            timeout_s=config.http_timeout_s,
+        )
+
+    def get(self, url: str) -> Http_response:
+        """GET request following redirects. Raises urllib.error.HTTPError for error responses
+        and urllib.error.URLError if the host can not be reached, as urllib does."""
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = self.get_with_retries(url)
+            if response.status in (301, 302, 303, 307, 308) and "location" in response.headers:
+                url = urljoin(url, response.headers["location"])
+                continue
+            if response.status >= 400:
+                raise urllib.error.HTTPError(
+                    url, response.status, http.client.responses.get(response.status, ""),
+                    response.headers, None,
+                )
+            return response
+        raise urllib.error.URLError(f"Too many redirects: {url}")
+
+    def download(self, url: str, filename: str) -> None:
+        """Saving the response body, the file only appears if the download succeeded"""
+        response = self.get(url)
+        temp_filename = f"{filename}.{threading.get_ident()}.part"
+        with open(temp_filename, "wb") as f:
+            f.write(response.body)
+        os.replace(temp_filename, filename)
+
+    def get_with_retries(self, url: str) -> Http_response:
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            try:
+                response = self.request(url)
+            except (OSError, http.client.HTTPException) as e:
+                if is_last_attempt:
+                    raise urllib.error.URLError(e)
+                retry_after = None
+            else:
+                if response.status not in RETRY_STATUS_CODES or is_last_attempt:
+                    return response
+                retry_after = self.get_retry_after(response.headers)
+            with self.lock:
+                self.stats.retries += 1
+            # Full jitter, the server may ask for a longer delay
+            delay = random.uniform(0, self.backoff_s * 2**attempt)
+            time.sleep(max(delay, retry_after or 0.0))
+
+    def request(self, url: str) -> Http_response:
+        scheme, netloc, path, query, _ = urlsplit(url)
+        target = (path or "/") + (f"?{query}" if query else "")
+        headers = {"Accept-Encoding": "gzip", "User-Agent": self.user_agent}
+        proxy = self.get_proxy(scheme, netloc)
+        if proxy is not None and scheme == "http":
+            # Plain HTTP is forwarded by the proxy, which gets the full URL
+            target = url.split("#", 1)[0]
+            headers.update(self.get_proxy_headers(proxy))
+        self.rate_limiter.wait()
+        connection, is_reused = self.get_connection(scheme, netloc, proxy)
+        try:
+            response, body = self.send(connection, target, headers)
+        except STALE_CONNECTION_ERRORS:
+            if not is_reused:
+                raise
+            # The server closed the idle connection, the request is repeated on a new one
+            connection, _ = self.get_connection(scheme, netloc, proxy, reuse=False)
+            response, body = self.send(connection, target, headers)
+        if response.will_close:
+            connection.close()
+        else:
+            self.release_connection(scheme, netloc, connection)
+        response_headers = {key.lower(): value for key, value in response.getheaders()}
+        if response_headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        with self.lock:
+            self.stats.requests += 1
+            self.stats.bytes_received += len(body)
+            self.stats.hosts[netloc] = self.stats.hosts.get(netloc, 0) + 1
+        return Http_response(url, response.status, response_headers, body)
+
+    def send(
+        self, connection: http.client.HTTPConnection, target: str, headers: Dict[str, str]
+    ) -> Tuple[http.client.HTTPResponse, bytes]:
+        try:
+            connection.request("GET", target, headers=headers)
+            response = connection.getresponse()
+            # The body is read completely, so that the connection can be reused
+            return response, response.read()
+        except Exception:
+            connection.close()
+            raise
+
+    def get_connection(
+        self, scheme: str, netloc: str, proxy: str = None, reuse: bool = True
+    ) -> Tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            idle_connections = self.idle_connections.get((scheme, netloc), [])
+            if reuse and idle_connections:
+                self.stats.connections_reused += 1
+                return idle_connections.pop(), True
+            self.stats.connections_opened += 1
+        # Connections to the proxy, if any (the host is then reached through it)
+        host, port = netloc, None
+        if proxy is not None:
+            proxy_parts = urlsplit(proxy)
+            host, port = proxy_parts.hostname, proxy_parts.port
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(
+                host, port, timeout=self.timeout_s, context=self.ssl_context
+            )
+            if proxy is not None:
+                connection.set_tunnel(netloc, headers=self.get_proxy_headers(proxy))
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.timeout_s)
+        return connection, False
+
+    def get_proxy(self, scheme: str, netloc: str) -> str:
+        """URL of the proxy for the host, None for a direct connection"""
+        proxy = self.proxies.get(scheme)
+        if proxy is None or urllib.request.proxy_bypass(netloc):
+            return None
+        return proxy if "://" in proxy else f"http://{proxy}"
+
+    @staticmethod
+    def get_proxy_headers(proxy: str) -> Dict[str, str]:
+        """Basic authentication with the credentials of the proxy URL"""
+        proxy_parts = urlsplit(proxy)
+        if proxy_parts.username is None:
+            return {}
+        credentials = f"{unquote(proxy_parts.username)}:{unquote(proxy_parts.password or '')}"
+        return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials.encode()).decode()}
+
+    def release_connection(
+        self, scheme: str, netloc: str, connection: http.client.HTTPConnection
+    ) -> None:
+        with self.lock:
+            idle_connections = self.idle_connections.setdefault((scheme, netloc), [])
+            if len(idle_connections) < self.MAX_IDLE_CONNECTIONS_PER_HOST:
+                idle_connections.append(connection)
+                return
+        connection.close()
+
+    def close(self) -> None:
+        with self.lock:
+            connections = [c for idle in self.idle_connections.values() for c in idle]
+            self.idle_connections = {}
+        for connection in connections:
+            connection.close()
+
+    @staticmethod
+    def get_retry_after(headers: Dict[str, str]) -> float:
+        """Delay requested by the server in seconds (Retry-After: seconds or HTTP date)"""
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        try:
+            retry_time = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max((retry_time - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+    def log_stats(self) -> None:
+        stats = self.stats
+        logger.info(
+            f"  HTTP: {stats.requests} requests to {len(stats.hosts)} hosts, "
+            f"{stats.connections_opened} connections opened, {stats.connections_reused} reused, "
+            f"{stats.retries} retries, {stats.bytes_received / 1e6:.2f} MB received"
+        )
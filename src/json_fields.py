@@ -0,0 +1,60 @@
+"""Dataclasses of the configuration (LayoutSpec, Config, OutputSpec) as plain JSON values,
+for files read by other processes or later runs (no code is run when reading them)"""
+
+import dataclasses
+from datetime import datetime
+from typing import Any, Dict
+from dimensions import Dimensions_cm
+from layout_spec import Frozen_array
+from poster_exporter import OutputSpec
+
+
+def to_json_fields(instance) -> Dict[str, Any]:
+    """Fields of a dataclass (LayoutSpec, Config, OutputSpec) as JSON values"""
+    return {
+        field.name: to_json_value(getattr(instance, field.name))
+        for field in dataclasses.fields(instance)
+    }
+
+
+def from_json_fields(cls, fields: Dict[str, Any]):
+    """Dataclass from its fields as JSON values, unknown fields are rejected"""
+    names = {field.name for field in dataclasses.fields(cls)}
+    unknown_names = set(fields) - names
+    if unknown_names:
+        raise ValueError(f"Fields {sorted(unknown_names)} of {cls.__name__} not recognized!")
+    return cls(**{name: from_json_value(value) for name, value in fields.items()})
+
+
+def to_json_value(value) -> Any:
+    """Values of the configurations, tagged where JSON has no type of its own"""
+    if isinstance(value, datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, OutputSpec):
+        return {"output": to_json_fields(value)}
+    if isinstance(value, Frozen_array):
+        return {"array": list(value.values)}
+    if isinstance(value, Dimensions_cm):
+        return {"dimensions_cm": list(value)}
+    if isinstance(value, (tuple, list)):
+        return [to_json_value(v) for v in value]
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    raise TypeError(f"{type(value).__name__} values can not be bundled!")
+
+
+def from_json_value(value) -> Any:
+    if isinstance(value, list):
+        return tuple(from_json_value(v) for v in value)  # the configurations hold tuples only
+    if isinstance(value, dict):
+        tag, tagged_value = next(iter(value.items()))
+        if tag == "datetime":
+            return datetime.fromisoformat(tagged_value)
+        if tag == "output":
+            return from_json_fields(OutputSpec, tagged_value)
+        if tag == "array":
+            return Frozen_array(tuple(tagged_value))
+        if tag == "dimensions_cm":
+            return Dimensions_cm(*tagged_value)
+        raise ValueError(f"Bundled value {tag} not recognized!")
+    return value
@@ -0,0 +1,131 @@
+import os
+from dataclasses import dataclass
+from typing import List
+import numpy as np
+from PIL import Image
+import layout_generator
+from constants import *
+
+
+@dataclass
+class Cover_cell:
+    """Position and size of one cover in pixels"""
+
+    row: int
+    x: int
+    y: int
+    width: int
+    height: int
+
+    @property
+    def box(self) -> tuple:
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+
+
+class Justified_layout:
+    """Packs covers at their true aspect ratios into rows spanning the full grid width.
+    The books are split into rows by a linear partition of their aspect ratios, so that
+    all rows get similar heights."""
+
+    def __init__(self, layout: layout_generator.PosterLayout) -> None:
+        self.layout = layout
+        cover_area_position = layout.get_cover_area_position(0, 0)
+        self.grid_x = cover_area_position.x_px - round(layout.grid.cover_dist.width_px / 2.0)
+        self.grid_y = cover_area_position.y_px - round(layout.grid.cover_dist.height_px / 2.0)
+        self.gap_h = layout.grid.cover_dist.width_px
+        self.gap_v = layout.grid.cover_dist.height_px
+        # Height of the book text below each cover, as in the grid layout
+        self.text_height = layout.book.number_of_text_lines * (
+            layout.book_font_size.px + layout.book.font_vspace.px
+        )
+
+    @staticmethod
+    def read_aspect_ratios(cover_files: List[str], default_aspect_ratio: float) -> np.ndarray:
+        """Aspect ratios from the image headers, the images are not decoded"""
+        aspect_ratios = []
+        for cover_file in cover_files:
+            if not os.path.exists(cover_file):  # no cover available
+                aspect_ratios.append(default_aspect_ratio)
+                continue
+            with Image.open(cover_file) as cover_image:
+                aspect_ratios.append(cover_image.size[H] / cover_image.size[V])
+        return np.array(aspect_ratios)
+
+    def arrange(self, aspect_ratios: np.ndarray) -> List[Cover_cell]:
+        """Cover cells for all books, in book order"""
+        n_books = aspect_ratios.size
+        # Number of rows for which equal rows would exactly fill the grid height:
+        # n_rows * (row_height + text_height + gap_v) = grid height, with
+        # row_height = (grid width - books per row * gap_h) / (aspect ratio sum per row)
+        width, height = self.layout.grid.area.dim_px
+        sum_aspect_ratios = aspect_ratios.sum()
+        a = width / sum_aspect_ratios
+        b = self.text_height + self.gap_v - n_books * self.gap_h / sum_aspect_ratios
+        n_rows_exact = (-b + np.sqrt(b**2 + 4 * a * height)) / (2 * a)
+        candidates = {
+            int(np.clip(n, 1, n_books))
+            for n in [np.floor(n_rows_exact), np.ceil(n_rows_exact)]
+        }
+        arrangements = [
+            self.arrange_rows(aspect_ratios, self.partition(aspect_ratios, n_rows))
+            for n_rows in sorted(candidates)
+        ]
+        # Largest total cover area
+        return max(
+            arrangements, key=lambda cells: sum(c.width * c.height for c in cells)
+        )
+
+    def partition(self, aspect_ratios: np.ndarray, n_rows: int) -> List[int]:
+        """Splitting the books into n_rows consecutive rows with similar aspect ratio sums.
+        Dynamic program over (rows, books) minimizing the squared deviations from the mean row,
+        vectorized over the books. Returns the index of the first book of each row."""
+        n_books = aspect_ratios.size
+        prefix_sums = np.concatenate(([0.0], np.cumsum(aspect_ratios)))
+        target = prefix_sums[-1] / n_rows
+        # Rows are limited in length, which keeps the program linear in the number of books
+        max_row_length = min(n_books, 3 * int(np.ceil(n_books / n_rows)) + 1)
+        end_indices = np.arange(n_books + 1)
+        cost = np.full(n_books + 1, np.inf)
+        cost[0] = 0.0
+        row_lengths = np.zeros((n_rows + 1, n_books + 1), dtype=int)
+        for row in range(1, n_rows + 1):
+            new_cost = np.full(n_books + 1, np.inf)
+            for row_length in range(1, max_row_length + 1):
+                start_indices = end_indices[row_length:] - row_length
+                candidate = cost[start_indices] + (
+                    prefix_sums[row_length:] - prefix_sums[start_indices] - target
+                ) ** 2
+                better = candidate < new_cost[row_length:]
+                new_cost[row_length:][better] = candidate[better]
+                row_lengths[row, row_length:][better] = row_length
+            cost = new_cost
+        # Backtracking the row lengths
+        row_starts = []
+        end = n_books
+        for row in range(n_rows, 0, -1):
+            end -= row_lengths[row, end]
+            row_starts.append(end)
+        return row_starts[::-1]
+
+    def arrange_rows(self, aspect_ratios: np.ndarray, row_starts: List[int]) -> List[Cover_cell]:
+        width, height = self.layout.grid.area.dim_px
+        row_ends = row_starts[1:] + [aspect_ratios.size]
+        rows = [aspect_ratios[start:end] for start, end in zip(row_starts, row_ends)]
+        row_heights = np.array([(width - r.size * self.gap_h) / r.sum() for r in rows])
+        # Rows are scaled down together if they do not fit the grid height
+        available_height = height - len(rows) * (self.text_height + self.gap_v)
+        row_heights *= min(1.0, available_height / row_heights.sum())
+        total_height = row_heights.sum() + len(rows) * (self.text_height + self.gap_v)
+        y = self.grid_y + (height - total_height) / 2.0 + self.gap_v / 2.0
+        cells = []
+        for row_index, (row, row_height) in enumerate(zip(rows, row_heights)):
+            cover_widths = row * row_height
+            x = self.grid_x + (width - cover_widths.sum() - row.size * self.gap_h) / 2.0
+            for cover_width in cover_widths:
+                x += self.gap_h / 2.0
+                cells.append(
+                    Cover_cell(row_index, round(x), round(y), round(cover_width), round(row_height))
+                )
+                x += cover_width + self.gap_h / 2.0
+            y += row_height + self.text_height + self.gap_v
+        return cells
@@ -0,0 +1,54 @@
+import os
+import pickle
+import threading
+from typing import Dict
+import layout_generator
+from layout_spec import LayoutSpec
+
+# Increased whenever the layout calculation changes, so that old layouts are not reused
+LAYOUT_VERSION = 4
+
+
+class Layout_cache:
+    """Poster layouts by spec hash, kept in memory and on disk.
+    Repeated runs with the same layout configuration skip the layout calculation."""
+
+    def __init__(self, cache_dir: str = "./cache/layouts") -> None:
+        self.cache_dir = cache_dir
+        self.layouts: Dict[str, layout_generator.PosterLayout] = {}
+        self.lock = threading.Lock()
+        self.stats = {"skipped": 0, "computed": 0}
+
+    def get_layout(self, spec: LayoutSpec) -> layout_generator.PosterLayout:
+        key = f"v{LAYOUT_VERSION}_{spec.get_hash()[:32]}"
+        with self.lock:
+            if key not in self.layouts:
+                self.layouts[key] = self.load_layout(key)
+            if self.layouts[key] is None:
+                self.layouts[key] = layout_generator.PosterLayoutCreator(spec=spec).create_poster_layout()
+                self.save_layout(key, self.layouts[key])
+                self.stats["computed"] += 1
+            else:
+                self.stats["skipped"] += 1
+            return self.layouts[key]
+
+    def get_layout_file(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pickle")
+
+    def load_layout(self, key: str) -> layout_generator.PosterLayout:
+        layout_file = self.get_layout_file(key)
+        if not os.path.exists(layout_file):
+            return None
+        try:
+            with open(layout_file, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None  # unreadable (e.g. written by an older version), calculated again
+
+    def save_layout(self, key: str, layout: layout_generator.PosterLayout) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        layout_file = self.get_layout_file(key)
+        temp_file = f"{layout_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file, "wb") as f:
+            pickle.dump(layout, f)
+        os.replace(temp_file, layout_file)
@@ -1,10 +1,12 @@
 from __future__ import annotations
-from dataclasses import dataclass
+import hashlib
+from dataclasses import dataclass, fields, is_dataclass, replace
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from typing import Literal
 from dimensions import Dimensions, Length, Position
-from poster_config import Config, ConfigLayout
+from layout_spec import LayoutSpec
+from area_concept import Area
 
 H = 0  # horizontal index
 V = 1  # vertical intex
@@ -21,12 +23,15 @@ class PosterLayoutCreator:
     poster: dict
     grid: dict
     book: dict
-    poster, grid, year_shading, book, title, signature = (
-        ConfigLayout().get_layout_config_dicts()
-    )
-    config = Config()
 
-    def __init__(self):
+    def __init__(self, n_books_total: int = None, spec: LayoutSpec = None):
+        # n_books_total: number of books to fit on the poster if the grid size is automatic
+        self.spec = spec if spec is not None else LayoutSpec.from_config(n_books_total=n_books_total)
+        self.n_books_total = self.spec.n_books_total
+        # Copies of the configuration, which are completed by the layout calculation
+        self.poster, self.grid, self.year_shading, self.book, self.title, self.signature = (
+            self.spec.get_layout_config_dicts()
+        )
         self.calculate_layout()
 
     def calculate_layout(self):
@@ -35,6 +40,8 @@ class PosterLayoutCreator:
             self.grid["cover_dist_factor"], self.year_shading["factors"] * 2
         )  # of cover width, height
         self.book["number_of_text_lines"] = self.get_num_book_text_lines()
+        if self.grid["auto_size"] and self.n_books_total:
+            self.grid["n_books"] = self.solve_grid(self.n_books_total)
         # Various dimensions based on cm parameters and factors
         self.calculate_layout_parameters_from_factors()
         # Leftover space is added to margins.
@@ -47,26 +54,62 @@ class PosterLayoutCreator:
         # Converting layout parameters into multi-unit data types (dpi-sensitive!)
         self.convert_parameters_to_multiunit_format()
 
+    def solve_grid(self, n_books_total: int) -> tuple[int, int]:
+        """Finding the grid size with the largest covers that holds all books.
+        All numbers of columns are evaluated at once, each with the least number of rows needed."""
+        self.poster["min_margins"] = (
+            self.poster["dim"].height * self.poster["min_margins_factor"]
+        )
+        self.calculate_title_parameters_from_factors()
+        self.calculate_signature_parameters_from_factors()
+        n_cols = np.arange(1, n_books_total + 1)
+        n_rows = np.ceil(n_books_total / n_cols)
+        # Same relations as in calculate_book_parameters_from_factors and update_cover_area
+        grid_area_width = self.poster["dim"].width - 2 * self.poster["min_margins"][SIDES]
+        grid_area_height = (
+            self.poster["dim"].height
+            - self.poster["min_margins"][TOP]
+            - self.poster["min_margins"][BOTTOM]
+            - self.title["vspace"]
+            - self.signature["vspace"]
+            - self.title["font_height"]
+            - self.signature["height"]
+        )
+        area_width = grid_area_width / n_cols
+        cover_area_width = area_width / (1 + self.grid["cover_dist_factor"][H])
+        cover_area_height = (
+            grid_area_height / n_rows / (1 + self.get_non_cover_height_factor())
+        )
+        cover_area_height = np.minimum(
+            cover_area_height, cover_area_width / self.book["default_aspect_ratio"]
+        )
+        cover_area = cover_area_height**2 * self.book["default_aspect_ratio"]
+        # The book text must fit below the cover
+        text_width = (
+            self.get_book_text_width_factor()
+            * self.book["font_height_factor"]
+            * cover_area_height
+        )
+        feasible = (text_width <= area_width) & (cover_area_height > 0)
+        if not feasible.any():
+            feasible[:] = True
+        # Largest cover area, then fewest empty cells
+        empty_cells = n_cols * n_rows - n_books_total
+        best = np.lexsort((empty_cells, -np.where(feasible, cover_area, -np.inf)))[0]
+        return (int(n_cols[best]), int(n_rows[best]))
+
+    def get_book_text_width_factor(self) -> float:
+        """Width of the widest line of a typical book text, relative to the font height"""
+        reference_size = 100
+        font = ImageFont.truetype(self.book["font_path"], size=reference_size)
+        book_str = self.spec.book_text_samples[1]
+        return max(font.getlength(line) for line in book_str.split("\n")) / reference_size
+
     def get_num_book_text_lines(self) -> int:
-        dummy_book = self.create_dummy_book()
-        book_str, _ = self.config.get_book_str(dummy_book)
+        book_str = self.spec.book_text_samples[0]
         num_lines = len(book_str.split("\n"))
         return num_lines
 
-    def create_dummy_book(self):
-        dummy_book = {
-            "title": "",
-            "author_name": "",
-            "book_published": "Sat, 1 Jan 2000 00:00:00 +0000",
-            "num_pages": "0",
-            "average_rating": "0",
-            "user_rating": "0",
-            "user_read_at": "Sat, 1 Jan 2000 00:00:00 +0000",
-            "user_date_created": "Sat, 1 Jan 2000 00:00:00 +0000",
-            "user_date_added": "Sat, 1 Jan 2000 00:00:00 +0000",
-        }
-        return dummy_book
-
     def convert_parameters_to_multiunit_format(self):
         self.convert_poster_parameters_to_multiunit_format()
         self.convert_grid_parameters_to_multiunit_format()
@@ -121,6 +164,17 @@ class PosterLayoutCreator:
         self.book["font"] = ImageFont.truetype(
             self.book["font_path"], size=self.book["font_size"].px
         )
+        self.book["shadow_offset"] = Dimensions(
+            self.book["shadow_factors"][H] * self.book["cover_area_width"],
+            self.book["shadow_factors"][V] * self.book["cover_area_height"],
+            unit="cm",
+            dpi=self.dpi,
+        )
+        self.book["shadow_blur_radius"] = Length(
+            self.book["shadow_blur_factor"] * self.book["cover_area_height"],
+            unit="cm",
+            dpi=self.dpi,
+        )
 
     def convert_year_shading_parameters_to_multiunit_format(self):
         shading_w = self.year_shading["factors"][H] * self.book["cover_area_width"]
@@ -266,6 +320,7 @@ class PosterLayoutCreator:
             title=self.create_title_parameter_obj(),
             signature=self.create_signature_parameter_obj(),
             dpi=self.dpi,
+            spec=self.spec,
         )
 
     def create_poster_parameter_obj(self):
@@ -278,6 +333,7 @@ class PosterLayoutCreator:
     def create_grid_parameter_obj(self):
         return GridParameters(
             n_books=self.grid["n_books"],
+            packing=self.grid["packing"],
             area=self.grid["area"],
             cover_dist=self.grid["cover_dist"],
         )
@@ -299,6 +355,16 @@ class PosterLayoutCreator:
             font_vspace=self.book["font_vspace"],
             font=self.book["font"],
             number_of_text_lines=self.book["number_of_text_lines"],
+            shadow=self.create_shadow_parameter_obj(),
+        )
+
+    def create_shadow_parameter_obj(self):
+        return ShadowParameters(
+            enable=self.book["shadow_enable"],
+            offset=self.book["shadow_offset"],
+            blur_radius=self.book["shadow_blur_radius"],
+            color_hex=self.book["shadow_color_hex"],
+            opacity=self.book["shadow_opacity"],
         )
 
     def create_title_parameter_obj(self):
@@ -327,6 +393,13 @@ class PosterLayout:
     title: TitleParameters
     signature: SignatureParameters
     dpi: int
+    spec: LayoutSpec = None  # the layout is created from it, e.g. again in another process
+
+    def get_hash(self) -> str:
+        """Hash of all layout parameters (in pixels), identical for identical layouts"""
+        return hashlib.sha256(
+            repr(get_hashable_values(replace(self, spec=None))).encode()
+        ).hexdigest()
 
     @property
     def book_font_size(self) -> Length:
@@ -350,56 +423,102 @@ class PosterLayout:
         text_w_px = self.get_text_width_px(text, font)
         return Length(text_w_px, unit="px", dpi=self.dpi)
 
+    def __post_init__(self) -> None:
+        # Nested areas of the poster, positions are calculated once and cached.
+        # All areas are created here, the layout is not changed by reading positions
+        # (it is shared by concurrent renders).
+        self.poster_area = Area(dpi=self.dpi)
+        content_area = self.poster_area.add_content("content", Area(dpi=self.dpi))
+        for name in ("title", "grid", "signature_left", "signature_right"):
+            content_area.add_content(name, Area(dpi=self.dpi))
+        for cover_index_V in range(self.grid.n_books[V]):
+            for cover_index_H in range(self.grid.n_books[H]):
+                cell_area = content_area.content["grid"].add_content(
+                    (cover_index_H, cover_index_V), Area(dpi=self.dpi)
+                )
+                cover_area = cell_area.add_content("cover", Area(dpi=self.dpi))
+                cover_area.add_content("shading", Area(dpi=self.dpi))
+        self.update_areas()
+
+    def update_areas(self) -> int:
+        """Setting the offsets and sizes of the areas from the layout parameters.
+        To be called after changing parameters, e.g. the title height. Only the areas
+        that moved (and their content) are calculated again, returns their number."""
+        poster_width, poster_height = self.poster.dim.dim_px
+        self.poster_area.dimensions = (poster_width, poster_height)
+        content_area = self.poster_area.content["content"]
+        content_area.offset = (self.poster.margins[SIDES].px, self.poster.margins[TOP].px)
+        content_area.dimensions = (
+            poster_width - 2 * self.poster.margins[SIDES].px,
+            poster_height - self.poster.margins[TOP].px - self.poster.margins[BOTTOM].px,
+        )
+        content_width, content_height = content_area.dimensions
+        title_height = self.title_font_size.px + self.title.vspace.px
+        content_area.content["title"].dimensions = (content_width, title_height)
+        grid_area = content_area.content["grid"]
+        grid_area.offset = (0, title_height)
+        grid_area.dimensions = (
+            self.grid.n_books[H] * self.book.area.width_px,
+            self.grid.n_books[V] * self.book.area.height_px,
+        )
+        for (cover_index_H, cover_index_V), cell_area in grid_area.content.items():
+            self.update_cell_area(cell_area, cover_index_H, cover_index_V)
+        signature_height = self.signature.height.px
+        content_area.content["signature_left"].offset = (0, content_height - signature_height)
+        content_area.content["signature_right"].offset = (
+            content_width - signature_height,
+            content_height - signature_height,
+        )
+        for name in ("signature_left", "signature_right"):
+            content_area.content[name].dimensions = (signature_height, signature_height)
+        return self.poster_area.update_positions()
+
+    def update_cell_area(self, cell_area: Area, cover_index_H: int, cover_index_V: int) -> None:
+        """Area of a book in the grid, containing the cover area with the year shading around it"""
+        cell_area.offset = (
+            cover_index_H * self.book.area.width_px,
+            cover_index_V * self.book.area.height_px,
+        )
+        cell_area.dimensions = self.book.area.dim_px
+        cover_dist = self.grid.cover_dist.dim_px
+        cell_area.content["cover"].offset = (cover_dist[H] / 2.0, cover_dist[V] / 2.0)
+        cell_area.content["cover"].dimensions = self.book.cover_area.dim_px
+        protrusion = self.year_shading.protrusion.dim_px
+        shading_area = cell_area.content["cover"].content["shading"]
+        shading_area.offset = (-protrusion[H], -protrusion[V])
+        shading_area.dimensions = (
+            self.book.cover_area.width_px + 2 * protrusion[H],
+            self.book.area.height_px - cover_dist[V] + 2 * protrusion[V],
+        )
+
+    def get_cell_area(self, cover_index_H: int, cover_index_V: int, name: str) -> Area:
+        """Area within the grid cell"""
+        grid_area = self.poster_area.content["content"].content["grid"]
+        cover_area = grid_area.content[(cover_index_H, cover_index_V)].content["cover"]
+        return cover_area if name == "cover" else cover_area.content[name]
+
     def get_title_position(self) -> Position:
-        return Position(
-            self.poster.dim.width_px / 2.0,
-            self.poster.margins[TOP].px,
-            unit="px",
-            dpi=self.dpi,
-        )
+        title_area = self.poster_area.content["content"].content["title"]
+        return title_area.get_position_of("top", "middle", rounded=False)
 
     def get_shading_start_position(
         self, cover_index_H: int, cover_index_V: int
     ) -> Position:
-        cover_area_position = self.get_cover_area_position(cover_index_H, cover_index_V)
-        return Position(
-            cover_area_position.x_cm - self.year_shading.protrusion.width_cm,
-            cover_area_position.y_cm - self.year_shading.protrusion.height_cm,
-            unit="cm",
-            dpi=self.dpi,
-        )
+        return self.get_cell_area(cover_index_H, cover_index_V, "shading").get_position_of()
 
     def get_shading_end_position(
         self, cover_index_H: int, cover_index_V: int
     ) -> Position:
-        cover_area_position = self.get_cover_area_position(cover_index_H, cover_index_V)
+        shading_area = self.get_cell_area(cover_index_H, cover_index_V, "shading")
+        x, y = shading_area.get_position_of().xy_px
         return Position(
-            cover_area_position.x_cm
-            + self.book.cover_area.width_cm
-            + self.year_shading.protrusion.width_cm,
-            cover_area_position.y_cm
-            + self.book.area.height_cm
-            - self.grid.cover_dist.height_cm
-            + self.year_shading.protrusion.height_cm,
-            unit="cm",
-            dpi=self.dpi,
+            x + shading_area.dimensions[H], y + shading_area.dimensions[V], unit="px", dpi=self.dpi
         )
 
     def get_cover_area_position(
         self, cover_index_H: int, cover_index_V: int
     ) -> Position:
-        return Position(
-            self.poster.margins[SIDES].cm
-            + cover_index_H * self.book.area.width_cm
-            + self.grid.cover_dist.width_cm / 2.0,
-            self.poster.margins[TOP].cm
-            + cover_index_V * self.book.area.height_cm
-            + self.title_font_size.cm
-            + self.title.vspace.cm
-            + self.grid.cover_dist.height_cm / 2.0,
-            unit="cm",
-            dpi=self.dpi,
-        )
+        return self.get_cell_area(cover_index_H, cover_index_V, "cover").get_position_of()
 
     def get_cover_position(
         self, cover_index_H: int, cover_index_V: int, cover_size: Dimensions
@@ -428,26 +547,10 @@ class PosterLayout:
         )
 
     def get_signature_position_left(self) -> Position:
-        return Position(
-            self.poster.margins[SIDES].cm,
-            self.poster.dim.height_cm
-            - self.poster.margins[BOTTOM].cm
-            - self.signature.height.cm,
-            unit="cm",
-            dpi=self.dpi,
-        )
+        return self.poster_area.content["content"].content["signature_left"].get_position_of()
 
     def get_signature_position_right(self) -> Position:
-        return Position(
-            self.poster.dim.width_cm
-            - self.poster.margins[SIDES].cm
-            - self.signature.height.cm,
-            self.poster.dim.height_cm
-            - self.poster.margins[BOTTOM].cm
-            - self.signature.height.cm,
-            unit="cm",
-            dpi=self.dpi,
-        )
+        return self.poster_area.content["content"].content["signature_right"].get_position_of()
 
     def get_qr_code_size(self) -> Dimensions:
         return Dimensions.from_length(self.signature.height, self.signature.height)
@@ -465,6 +568,23 @@ class PosterLayout:
         return Position(pos_x, pos_y, unit="cm", dpi=self.dpi)
 
 
+def get_hashable_values(value):
+    """Converting layout parameters into nested tuples of plain values"""
+    if is_dataclass(value):
+        return tuple(
+            (f.name, get_hashable_values(getattr(value, f.name))) for f in fields(value)
+        )
+    if isinstance(value, Dimensions):
+        return tuple(value.dim_px)
+    if isinstance(value, Length):
+        return value.px
+    if isinstance(value, ImageFont.FreeTypeFont):
+        return (value.path, value.size)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(get_hashable_values(v) for v in value)
+    return value
+
+
 @dataclass
 class PosterParameters:
     background_color_hex: str
@@ -475,6 +595,7 @@ class PosterParameters:
 @dataclass
 class GridParameters:
     n_books: tuple[int, int]
+    packing: str
     area: Dimensions
     cover_dist: Length
 
@@ -492,6 +613,16 @@ class BookParameters:
     font_vspace: Length
     font: ImageFont
     number_of_text_lines: int
+    shadow: ShadowParameters
+
+
+@dataclass
+class ShadowParameters:
+    enable: bool
+    offset: Dimensions
+    blur_radius: Length
+    color_hex: str
+    opacity: float
 
 
 @dataclass
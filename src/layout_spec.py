@@ -0,0 +1,115 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Tuple
+import numpy as np
+from poster_config import Config, ConfigLayout
+
+# Parameters of one section of the layout configuration, sorted by name
+Frozen_section = Tuple[Tuple[str, Any], ...]
+
+
+@dataclass(frozen=True)
+class Frozen_array:
+    """Hashable stand-in for a numpy array in the layout configuration"""
+
+    values: tuple
+
+    def thaw(self) -> np.ndarray:
+        return np.array(self.values)
+
+
+@dataclass(frozen=True)
+class LayoutSpec:
+    """Immutable, hashable description of everything a poster layout depends on.
+    Created from the (mutable) layout configuration, identical specs give identical layouts."""
+
+    poster: Frozen_section
+    grid: Frozen_section
+    year_shading: Frozen_section
+    book: Frozen_section
+    title: Frozen_section
+    signature: Frozen_section
+    # Number of books to fit on the poster, only if the grid size is automatic
+    n_books_total: int = None
+    # Book texts of a typical and of a wide dummy book, they determine the text lines and width
+    book_text_samples: Tuple[str, str] = ("", "")
+
+    @classmethod
+    def from_config(
+        cls,
+        config_layout: ConfigLayout = None,
+        config: Config = None,
+        n_books_total: int = None,
+    ) -> "LayoutSpec":
+        config_layout = config_layout if config_layout is not None else ConfigLayout()
+        config = config if config is not None else Config()
+        poster, grid, year_shading, book, title, signature = [
+            freeze_section(section) for section in config_layout.get_layout_config_dicts()
+        ]
+        return cls(
+            poster=poster,
+            grid=grid,
+            year_shading=year_shading,
+            book=book,
+            title=title,
+            signature=signature,
+            n_books_total=n_books_total if dict(grid)["auto_size"] else None,
+            book_text_samples=get_book_text_samples(config),
+        )
+
+    def get_layout_config_dicts(self) -> Tuple[dict, ...]:
+        """New mutable copies of the configuration sections, as in ConfigLayout"""
+        return tuple(
+            {name: thaw(value) for name, value in section}
+            for section in (
+                self.poster,
+                self.grid,
+                self.year_shading,
+                self.book,
+                self.title,
+                self.signature,
+            )
+        )
+
+    def get_hash(self) -> str:
+        return hashlib.sha256(repr(self).encode()).hexdigest()
+
+
+def freeze_section(section: dict) -> Frozen_section:
+    return tuple(sorted((name, freeze(value)) for name, value in section.items()))
+
+
+def freeze(value):
+    if isinstance(value, np.ndarray):
+        return Frozen_array(tuple(value.tolist()))
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, Frozen_array):
+        return value.thaw()
+    return value
+
+
+def create_dummy_book() -> dict:
+    return {
+        "title": "",
+        "author_name": "",
+        "book_published": "Sat, 1 Jan 2000 00:00:00 +0000",
+        "num_pages": "0",
+        "average_rating": "0",
+        "user_rating": "0",
+        "user_read_at": "Sat, 1 Jan 2000 00:00:00 +0000",
+        "user_date_created": "Sat, 1 Jan 2000 00:00:00 +0000",
+        "user_date_added": "Sat, 1 Jan 2000 00:00:00 +0000",
+    }
+
+
+def get_book_text_samples(config: Config) -> Tuple[str, str]:
+    book_str, _ = config.get_book_str(create_dummy_book())
+    wide_book = create_dummy_book()
+    wide_book.update(num_pages="1000", average_rating="4.5", user_rating="5")
+    wide_book_str, _ = config.get_book_str(wide_book)
+    return book_str, wide_book_str
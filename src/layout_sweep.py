@@ -0,0 +1,213 @@
+"""Renders the poster of one shelf with several layout variants (parameters in ConfigSweep).
+The books are loaded and the covers decoded once, the variants are rendered from them in
+parallel. Creates a contact sheet of all variants and a table of the render times.
+Usage: python src/layout_sweep.py"""
+
+import csv
+import dataclasses
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+import poster_config
+from book_loader import Book_loader, No_books_error, open_library
+from book_poster_creator import Book_poster_creator, read_rss_urls, check_python_version
+from http_client import Http_client
+from layout_spec import LayoutSpec
+from layout_cache import Layout_cache
+from artifact_cache import Artifact_cache
+from chrome_cache import Chrome_cache
+
+
+def main() -> None:
+    check_python_version()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    config = poster_config.Config()
+    sweep = poster_config.ConfigSweep()
+    rss_urls = [] if config.input_csv_file else read_rss_urls(config.input_rss_file)
+    http_client = Http_client.from_config(config)
+    artifact_cache = Artifact_cache()
+    layout_cache = Layout_cache()
+    # Title and signatures are shared by variants with the same chrome
+    chrome_cache = Chrome_cache()
+
+    variants = get_variants(sweep.parameters)
+    config_layouts = [get_config_layout(variant) for variant in variants]
+    print(f"Sweeping {len(variants)} layout variants...")
+
+    # The books of all variants, loaded once
+    try:
+        with open_library(config) as library:
+            books = Book_loader(config, http_client, artifact_cache, library).get_list_of_books(
+                rss_urls, max_books=get_max_books(config_layouts)
+            )
+    except No_books_error as e:
+        exit(str(e))
+    layouts = [
+        layout_cache.get_layout(LayoutSpec.from_config(config_layout, config, books.size))
+        for config_layout in config_layouts
+    ]
+
+    # The variants with the largest covers first, so covers are downloaded in the variant
+    # needed by all variants and not downloaded again
+    order = sorted(
+        range(len(variants)),
+        key=lambda i: -int(np.prod(layouts[i].book.cover_area.dim_px)),
+    )
+    creators = [None] * len(variants)
+    for i in order:
+        variant_config = dataclasses.replace(
+            config,
+            output_file=os.path.join(sweep.output_dir, f"variant_{i + 1:02d}.jpg"),
+            additional_outputs=(),
+            stream_covers=False,  # covers are downloaded before rendering
+        )
+        creators[i] = Book_poster_creator(
+            layouts[i],
+            variant_config,
+            rss_urls,
+            books=books,
+            chrome_cache=chrome_cache,
+            http_client=http_client,
+            artifact_cache=artifact_cache,
+        )
+
+    # Each cover is decoded once, the variants only resize them
+    decoded_covers = decode_covers(creators, config.download_concurrency)
+    for creator in creators:
+        creator.cover_store.decoded_covers = decoded_covers
+
+    os.makedirs(sweep.output_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=sweep.parallel_renders) as executor:
+        render_times = list(executor.map(render_variant, creators))
+
+    print_render_times(variants, render_times)
+    save_render_times(os.path.join(sweep.output_dir, "timings.csv"), variants, render_times)
+    contact_sheet = create_contact_sheet(
+        [creator.config.output_file for creator in creators],
+        [get_variant_label(variant, render_time) for variant, render_time in zip(variants, render_times)],
+        sweep.thumbnail_height,
+        sweep.contact_sheet_columns,
+        poster_config.ConfigLayout.signature["font_path"],
+    )
+    contact_sheet_file = os.path.join(sweep.output_dir, "contact_sheet.jpg")
+    contact_sheet.save(contact_sheet_file, quality=90)
+    print(f"Contact sheet saved to {contact_sheet_file}")
+    artifact_cache.print_summary(layout=layout_cache.stats, chrome=chrome_cache.stats)
+
+
+def get_variants(parameters: Dict[str, list]) -> List[dict]:
+    """All combinations of the parameter values"""
+    names = list(parameters)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(parameters[name] for name in names))
+    ]
+
+
+def get_config_layout(variant: dict) -> poster_config.ConfigLayout:
+    """Layout configuration with the values of the variant, the defaults are not changed"""
+    config_layout = poster_config.ConfigLayout()
+    # The sections are class attributes, the variant gets its own copies
+    for section in ("poster", "grid", "year_shading", "book", "title", "signature"):
+        setattr(config_layout, section, dict(getattr(config_layout, section)))
+    for parameter, value in variant.items():
+        section, name = parameter.split(".", 1)
+        sections = getattr(config_layout, section, None)
+        if not isinstance(sections, dict) or name not in sections:
+            raise ValueError(f"Layout parameter {parameter} not recognized!")
+        sections[name] = value
+    return config_layout
+
+
+def get_max_books(config_layouts: List[poster_config.ConfigLayout]) -> int:
+    """Number of books needed for the largest grid, None (all books) for automatic grids"""
+    if any(config_layout.grid["auto_size"] for config_layout in config_layouts):
+        return None
+    return max(int(np.prod(config_layout.grid["n_books"])) for config_layout in config_layouts)
+
+
+def decode_covers(creators: List[Book_poster_creator], max_workers: int) -> Dict[str, Image.Image]:
+    """Decoded covers of the books of all variants by content hash"""
+    cover_store = creators[0].cover_store
+    cover_files = {
+        creator.get_cover_filename(book)
+        for creator in creators
+        for book in creator.books
+        if creator.has_cover(book)
+    }
+    cover_files = {cover_store.get_hashes(cover_file)["sha256"]: cover_file for cover_file in cover_files}
+    print(f"Decoding {len(cover_files)} covers...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        decoded_covers = executor.map(cover_store.get_decoded_cover, cover_files.values())
+        return dict(zip(cover_files, decoded_covers))
+
+
+def render_variant(creator: Book_poster_creator) -> float:
+    start = time.perf_counter()
+    creator.create_poster_image()
+    return time.perf_counter() - start
+
+
+def get_variant_label(variant: dict, render_time: float) -> str:
+    return "\n".join([f"{name} = {value}" for name, value in variant.items()] + [f"{render_time:.2f} s"])
+
+
+def print_render_times(variants: List[dict], render_times: List[float]) -> None:
+    print("Render times (variants rendered in parallel):")
+    for i, (variant, render_time) in enumerate(zip(variants, render_times)):
+        parameters = ", ".join(f"{name}={value}" for name, value in variant.items())
+        print(f"  {i + 1:>3}: {render_time:7.2f} s  {parameters}")
+
+
+def save_render_times(csv_file: str, variants: List[dict], render_times: List[float]) -> None:
+    with open(csv_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["variant", *variants[0], "render_time_s"])
+        for i, (variant, render_time) in enumerate(zip(variants, render_times)):
+            writer.writerow([i + 1, *variant.values(), f"{render_time:.3f}"])
+
+
+def create_contact_sheet(
+    poster_files: List[str],
+    labels: List[str],
+    thumbnail_height: int,
+    columns: int,
+    font_path: str,
+) -> Image.Image:
+    """Thumbnails of the posters in a grid, each with its label below"""
+    thumbnails = []
+    for poster_file in poster_files:
+        with Image.open(poster_file) as poster_image:
+            # Reduced while decoding (JPEG), then resized exactly
+            poster_image.draft("RGB", (thumbnail_height, thumbnail_height))
+            width = round(poster_image.width * thumbnail_height / poster_image.height)
+            thumbnails.append(poster_image.convert("RGB").resize((width, thumbnail_height), Image.BICUBIC))
+    font = ImageFont.truetype(font_path, size=max(thumbnail_height // 40, 10))
+    margin = font.size
+    label_height = (max(label.count("\n") for label in labels) + 1) * round(font.size * 1.3)
+    cell_width = max(thumbnail.width for thumbnail in thumbnails) + margin
+    cell_height = thumbnail_height + label_height + 2 * margin
+    columns = min(columns, len(thumbnails))
+    rows = -(-len(thumbnails) // columns)
+    contact_sheet = Image.new("RGB", (columns * cell_width + margin, rows * cell_height), "#FFFFFF")
+    draw = ImageDraw.Draw(contact_sheet)
+    for i, (thumbnail, label) in enumerate(zip(thumbnails, labels)):
+        x = margin + (i % columns) * cell_width
+        y = margin + (i // columns) * cell_height
+        contact_sheet.paste(thumbnail, (x, y))
+        draw.rectangle(
+            [(x, y), (x + thumbnail.width - 1, y + thumbnail_height - 1)], outline="#808080"
+        )
+        draw.multiline_text(
+            (x, y + thumbnail_height + margin // 2), f"{i + 1}: {label}", fill="black", font=font
+        )
+    return contact_sheet
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+from constants import *
+
+
+class Numpy_canvas:
+    """Poster canvas held as a uint8 array of shape (height, width, 3).
+    Covers are blitted by slice assignment and rectangles are filled by slice writes.
+    The canvas stands in for both the PIL image (paste) and the draw object (rectangle, text).
+    It may also draw into an existing array, e.g. a band of a poster in shared memory: origin is
+    then the poster position of the band, all coordinates are poster coordinates and everything
+    is clipped to the band."""
+
+    MAX_BUFFERS = 16  # array copies kept, limits the memory
+
+    def __init__(
+        self,
+        size: Tuple[int, int],
+        background_color_hex: str = None,
+        pixels: np.ndarray = None,
+        origin: Tuple[int, int] = (0, 0),
+    ) -> None:
+        if pixels is None:
+            pixels = np.empty((size[V], size[H], 3), dtype=np.uint8)
+        self.pixels = pixels
+        self.origin = origin
+        if background_color_hex is not None:
+            self.fill_box(
+                origin[H],
+                origin[V],
+                origin[H] + size[H],
+                origin[V] + size[V],
+                ImageColor.getrgb(background_color_hex)[:3],
+            )
+        # Array copies of the images pasted last, duplicates (same image object, e.g. an identical
+        # cover of another book) are converted only once
+        self.buffers: Dict[int, Tuple[Image.Image, np.ndarray]] = OrderedDict()
+        self.measure_draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return (self.pixels.shape[1], self.pixels.shape[0])
+
+    def to_image(self) -> Image.Image:
+        # Read directly from the array, without an intermediate copy as bytes
+        return Image.frombuffer("RGB", self.size, self.pixels, "raw", "RGB", 0, 1)
+
+    def get_buffer(self, image: Union[Image.Image, np.ndarray]) -> np.ndarray:
+        if isinstance(image, np.ndarray):
+            return image
+        buffer = self.buffers.get(id(image))
+        if buffer is None:
+            # The image is kept with its buffer, so that its id is not reused
+            buffer = (image, np.asarray(image.convert("RGB")))
+            self.buffers[id(image)] = buffer
+            if len(self.buffers) > self.MAX_BUFFERS:
+                self.buffers.popitem(last=False)
+        else:
+            self.buffers.move_to_end(id(image))
+        return buffer[1]
+
+    def fill_box(self, x0: int, y0: int, x1: int, y1: int, color: tuple) -> None:
+        """Fills the pixels x0 <= x < x1, y0 <= y < y1, clipped to the canvas"""
+        x0, x1 = x0 - self.origin[H], x1 - self.origin[H]
+        y0, y1 = y0 - self.origin[V], y1 - self.origin[V]
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.size[H]), min(y1, self.size[V])
+        if x0 < x1 and y0 < y1:
+            # Filling the first row, which is then copied row by row (faster than
+            # broadcasting the color over all pixels)
+            self.pixels[y0, x0:x1] = color
+            self.pixels[y0 + 1 : y1, x0:x1] = self.pixels[y0, x0:x1]
+
+    def paste(self, image: Union[Image.Image, np.ndarray, str], xy, mask: Image.Image = None) -> None:
+        """Pasting an image, or a color through a mask (xy is then the box of the mask)"""
+        if mask is not None:
+            x, y = int(xy[H]), int(xy[V])
+            self.blend(x, y, np.asarray(mask.convert("L")), ImageColor.getrgb(image)[:3])
+            return
+        buffer = self.get_buffer(image)
+        x, y = int(xy[H]) - self.origin[H], int(xy[V]) - self.origin[V]
+        # Clipping the image to the canvas
+        x0, y0 = max(x, 0), max(y, 0)
+        x1 = min(x + buffer.shape[1], self.size[H])
+        y1 = min(y + buffer.shape[0], self.size[V])
+        if x0 < x1 and y0 < y1:
+            self.pixels[y0:y1, x0:x1] = buffer[y0 - y : y1 - y, x0 - x : x1 - x]
+
+    def rectangle(self, xy, fill=None, outline=None, width: int = 1) -> None:
+        """Same pixels as ImageDraw.rectangle: corners inclusive, the outline lies inside"""
+        x0, y0, x1, y1 = (int(v) for v in np.ravel(xy))
+        if fill is not None:
+            self.fill_box(x0, y0, x1 + 1, y1 + 1, ImageColor.getrgb(fill)[:3])
+        if outline is not None and outline != fill and width != 0:
+            color = ImageColor.getrgb(outline)[:3]
+            self.fill_box(x0, y0, x1 + 1, y0 + width, color)  # top
+            self.fill_box(x0, y1 + 1 - width, x1 + 1, y1 + 1, color)  # bottom
+            self.fill_box(x0, y0, x0 + width, y1 + 1, color)  # left
+            self.fill_box(x1 + 1 - width, y0, x1 + 1, y1 + 1, color)  # right
+
+    def text(self, xy, text: str, fill=None, font=None, align="left", anchor=None) -> None:
+        """Text is rendered by PIL as coverage mask and blended into the array"""
+        bbox = self.measure_draw.textbbox(xy, text, font=font, anchor=anchor, align=align)
+        # One pixel of margin for antialiasing, clipped to the canvas (in poster coordinates)
+        x0 = max(int(bbox[0]) - 1, self.origin[H])
+        y0 = max(int(bbox[1]) - 1, self.origin[V])
+        x1 = min(int(np.ceil(bbox[2])) + 1, self.origin[H] + self.size[H])
+        y1 = min(int(np.ceil(bbox[3])) + 1, self.origin[V] + self.size[V])
+        if x0 >= x1 or y0 >= y1:
+            return
+        mask = Image.new("L", (x1 - x0, y1 - y0), 0)
+        ImageDraw.Draw(mask).text(
+            (xy[H] - x0, xy[V] - y0), text, fill=255, font=font, align=align, anchor=anchor
+        )
+        self.blend(x0, y0, np.asarray(mask), ImageColor.getrgb(fill or "black")[:3])
+
+    def blend(self, x: int, y: int, alpha: np.ndarray, color: tuple) -> None:
+        """Blending a color into the canvas with the opacities alpha (0-255) at x, y"""
+        x, y = x - self.origin[H], y - self.origin[V]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1 = min(x + alpha.shape[1], self.size[H])
+        y1 = min(y + alpha.shape[0], self.size[V])
+        if x0 >= x1 or y0 >= y1:
+            return
+        alpha = alpha[y0 - y : y1 - y, x0 - x : x1 - x, np.newaxis].astype(np.uint32)
+        patch = self.pixels[y0:y1, x0:x1]
+        # Rounded division by 255 as in PIL, gives the same pixels as drawing on the image
+        blended = patch * (255 - alpha) + np.array(color, dtype=np.uint32) * alpha + 128
+        patch[:] = ((blended >> 8) + blended) >> 8
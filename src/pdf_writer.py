@@ -0,0 +1,369 @@
+import hashlib
+import os
+import struct
+import zlib
+from typing import Dict, List, Tuple
+from PIL import Image, ImageColor, ImageFont
+from constants import *
+
+
+class Pdf_document:
+    """Minimal PDF writer with embedded TrueType fonts and passthrough JPEG images"""
+
+    def __init__(self) -> None:
+        self.objects: List[bytes] = []
+        self.page_ids: List[int] = []
+        self.pages_id = self.reserve_object()
+        self.resources_id = self.reserve_object()  # shared by all pages
+        self.fonts: Dict[str, "Pdf_font"] = {}
+        self.images: Dict[str, Tuple[str, int]] = {}
+
+    def reserve_object(self) -> int:
+        self.objects.append(b"")
+        return len(self.objects)
+
+    def set_object(self, object_id: int, content: bytes) -> None:
+        self.objects[object_id - 1] = content
+
+    def add_object(self, content: bytes) -> int:
+        object_id = self.reserve_object()
+        self.set_object(object_id, content)
+        return object_id
+
+    def add_stream(self, dictionary: str, data: bytes) -> int:
+        return self.add_object(
+            f"<< {dictionary} /Length {len(data)} >>\nstream\n".encode()
+            + data
+            + b"\nendstream"
+        )
+
+    def get_font(self, font: ImageFont.FreeTypeFont) -> "Pdf_font":
+        if font.path not in self.fonts:
+            self.fonts[font.path] = Pdf_font(font.path, f"F{len(self.fonts) + 1}")
+        return self.fonts[font.path]
+
+    def get_image(self, path: str, key: str = None) -> str:
+        """Embedding an image file once per key (default: the path),
+        JPEG data is passed through without re-encoding"""
+        key = key or path
+        if key not in self.images:
+            with Image.open(path) as image:
+                if image.format == "JPEG" and image.mode in ["L", "RGB", "CMYK"]:
+                    with open(path, "rb") as f:
+                        object_id = self.add_jpeg_image(f.read(), image)
+                else:
+                    object_id = self.add_raw_image(image)
+            self.images[key] = (f"Im{len(self.images) + 1}", object_id)
+        return self.images[key][0]
+
+    def add_jpeg_image(self, jpeg_data: bytes, image: Image.Image) -> int:
+        color_space = {"L": "DeviceGray", "RGB": "DeviceRGB", "CMYK": "DeviceCMYK"}
+        decode = ""
+        if image.mode == "CMYK" and "adobe" in image.info:
+            decode = " /Decode [1 0 1 0 1 0 1 0]"  # Adobe CMYK JPEGs are stored inverted
+        return self.add_stream(
+            f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+            f"/ColorSpace /{color_space[image.mode]} /BitsPerComponent 8{decode} /Filter /DCTDecode",
+            jpeg_data,
+        )
+
+    def add_raw_image(self, image: Image.Image) -> int:
+        image = image.convert("RGB")
+        return self.add_stream(
+            f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+            "/ColorSpace /DeviceRGB /BitsPerComponent 8 /Interpolate false /Filter /FlateDecode",
+            zlib.compress(image.tobytes()),
+        )
+
+    def add_pseudo_image(self, image: Image.Image) -> str:
+        """Embedding an in-memory image (e.g. a QR code), keyed by its content"""
+        key = "<memory>" + hashlib.sha1(image.tobytes()).hexdigest() + str(image.size)
+        if key not in self.images:
+            self.images[key] = (f"Im{len(self.images) + 1}", self.add_raw_image(image))
+        return self.images[key][0]
+
+    def add_masked_color(self, color: str, mask: Image.Image) -> str:
+        """Embedding a plain color shown through a soft mask (e.g. shadows), keyed by content"""
+        mask = mask.convert("L")
+        key = "<mask>" + hashlib.sha1(mask.tobytes()).hexdigest() + str(mask.size) + color
+        if key not in self.images:
+            mask_id = self.add_stream(
+                f"/Type /XObject /Subtype /Image /Width {mask.width} /Height {mask.height} "
+                "/ColorSpace /DeviceGray /BitsPerComponent 8 /Interpolate true /Filter /FlateDecode",
+                zlib.compress(mask.tobytes()),
+            )
+            # The color image is a single pixel, stretched over the mask
+            object_id = self.add_stream(
+                "/Type /XObject /Subtype /Image /Width 1 /Height 1 "
+                f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /SMask {mask_id} 0 R",
+                bytes(ImageColor.getrgb(color)[:3]),
+            )
+            self.images[key] = (f"Im{len(self.images) + 1}", object_id)
+        return self.images[key][0]
+
+    def add_page(self, canvas: "Pdf_canvas") -> None:
+        content_id = self.add_stream("/Filter /FlateDecode", zlib.compress(canvas.get_content()))
+        self.page_ids.append(
+            self.add_object(
+                f"<< /Type /Page /Parent {self.pages_id} 0 R "
+                f"/MediaBox [0 0 {canvas.width_pt:.3f} {canvas.height_pt:.3f}] "
+                f"/Resources {self.resources_id} 0 R "
+                f"/Contents {content_id} 0 R >>".encode()
+            )
+        )
+
+    def save(self, filename: str) -> None:
+        # Fonts are written last, when all glyphs used on all pages are known
+        font_refs = " ".join(
+            f"/{font.name} {font.write(self)} 0 R" for font in self.fonts.values()
+        )
+        image_refs = " ".join(f"/{name} {object_id} 0 R" for name, object_id in self.images.values())
+        self.set_object(
+            self.resources_id,
+            f"<< /Font << {font_refs} >> /XObject << {image_refs} >> >>".encode(),
+        )
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.set_object(
+            self.pages_id,
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode(),
+        )
+        catalog_id = self.add_object(f"<< /Type /Catalog /Pages {self.pages_id} 0 R >>".encode())
+
+        output_dir = os.path.dirname(filename)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(filename, "wb") as f:
+            f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+            offsets = []
+            for object_id, content in enumerate(self.objects, start=1):
+                offsets.append(f.tell())
+                f.write(f"{object_id} 0 obj\n".encode() + content + b"\nendobj\n")
+            xref_offset = f.tell()
+            f.write(f"xref\n0 {len(self.objects) + 1}\n0000000000 65535 f \n".encode())
+            for offset in offsets:
+                f.write(f"{offset:010d} 00000 n \n".encode())
+            f.write(
+                f"trailer\n<< /Size {len(self.objects) + 1} /Root {catalog_id} 0 R >>\n"
+                f"startxref\n{xref_offset}\n%%EOF\n".encode()
+            )
+
+
+class Pdf_font:
+    """Embedded TrueType font, addressed by glyph ids (Identity-H encoding)"""
+
+    def __init__(self, path: str, name: str) -> None:
+        self.path = path
+        self.name = name
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.tables = self.read_table_directory()
+        self.units_per_em, self.bbox = self.read_head()
+        self.ascent, self.descent, n_h_metrics = self.read_hhea()
+        self.advance_widths = self.read_hmtx(n_h_metrics)
+        self.cmap = self.read_cmap()
+        self.used_glyphs: Dict[int, str] = {}  # glyph id -> character
+
+    def read_table_directory(self) -> Dict[str, int]:
+        n_tables = struct.unpack(">H", self.data[4:6])[0]
+        tables = {}
+        for i in range(n_tables):
+            record = self.data[12 + 16 * i : 28 + 16 * i]
+            tables[record[:4].decode("latin-1")] = struct.unpack(">I", record[8:12])[0]
+        return tables
+
+    def read_head(self) -> Tuple[int, Tuple[int, int, int, int]]:
+        offset = self.tables["head"]
+        units_per_em = struct.unpack(">H", self.data[offset + 18 : offset + 20])[0]
+        bbox = struct.unpack(">hhhh", self.data[offset + 36 : offset + 44])
+        return units_per_em, bbox
+
+    def read_hhea(self) -> Tuple[int, int, int]:
+        offset = self.tables["hhea"]
+        ascent, descent = struct.unpack(">hh", self.data[offset + 4 : offset + 8])
+        n_h_metrics = struct.unpack(">H", self.data[offset + 34 : offset + 36])[0]
+        return ascent, descent, n_h_metrics
+
+    def read_hmtx(self, n_h_metrics: int) -> List[int]:
+        offset = self.tables["hmtx"]
+        return [
+            struct.unpack(">H", self.data[offset + 4 * i : offset + 4 * i + 2])[0]
+            for i in range(n_h_metrics)
+        ]
+
+    def read_cmap(self) -> Dict[int, int]:
+        """Reading the unicode character to glyph id mapping (format 4 subtable)"""
+        offset = self.tables["cmap"]
+        n_subtables = struct.unpack(">H", self.data[offset + 2 : offset + 4])[0]
+        for i in range(n_subtables):
+            platform, encoding, sub_offset = struct.unpack(
+                ">HHI", self.data[offset + 4 + 8 * i : offset + 12 + 8 * i]
+            )
+            table = offset + sub_offset
+            if (platform, encoding) in [(3, 1), (0, 3)] and struct.unpack(
+                ">H", self.data[table : table + 2]
+            )[0] == 4:
+                return self.read_cmap_format_4(table)
+        raise ValueError(f"No supported unicode cmap found in {self.path}")
+
+    def read_cmap_format_4(self, table: int) -> Dict[int, int]:
+        seg_count = struct.unpack(">H", self.data[table + 6 : table + 8])[0] // 2
+
+        def array(index: int, signed: bool = False) -> tuple:
+            start = table + 14 + index * 2 * seg_count + (2 if index else 0)
+            return struct.unpack(
+                f">{seg_count}{'h' if signed else 'H'}", self.data[start : start + 2 * seg_count]
+            )
+
+        end_codes, start_codes = array(0), array(1)
+        id_deltas, id_range_offsets = array(2, signed=True), array(3)
+        id_range_offsets_start = table + 16 + 6 * seg_count
+        cmap = {}
+        for s in range(seg_count):
+            for code in range(start_codes[s], end_codes[s] + 1):
+                if code == 0xFFFF:
+                    continue
+                if id_range_offsets[s] == 0:
+                    glyph = (code + id_deltas[s]) % 65536
+                else:
+                    glyph_offset = (
+                        id_range_offsets_start + 2 * s + id_range_offsets[s] + 2 * (code - start_codes[s])
+                    )
+                    glyph = struct.unpack(">H", self.data[glyph_offset : glyph_offset + 2])[0]
+                    if glyph:
+                        glyph = (glyph + id_deltas[s]) % 65536
+                if glyph:
+                    cmap[code] = glyph
+        return cmap
+
+    def encode(self, text: str) -> str:
+        glyphs = [self.cmap.get(ord(c), 0) for c in text]
+        self.used_glyphs.update(zip(glyphs, text))
+        return "".join(f"{g:04X}" for g in glyphs)
+
+    def scale(self, value: int) -> int:
+        return round(value * 1000 / self.units_per_em)
+
+    def write(self, document: Pdf_document) -> int:
+        font_file_id = document.add_stream(
+            f"/Length1 {len(self.data)} /Filter /FlateDecode", zlib.compress(self.data)
+        )
+        base_font = "".join(c for c in os.path.basename(self.path).split(".")[0] if c.isalnum())
+        descriptor_id = document.add_object(
+            f"<< /Type /FontDescriptor /FontName /{base_font} /Flags 32 "
+            f"/FontBBox [{' '.join(str(self.scale(b)) for b in self.bbox)}] /ItalicAngle 0 "
+            f"/Ascent {self.scale(self.ascent)} /Descent {self.scale(self.descent)} "
+            f"/CapHeight {self.scale(self.ascent)} /StemV 80 /FontFile2 {font_file_id} 0 R >>".encode()
+        )
+        widths = " ".join(
+            f"{g} [{self.scale(self.advance_widths[min(g, len(self.advance_widths) - 1)])}]"
+            for g in sorted(self.used_glyphs)
+        )
+        cid_font_id = document.add_object(
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{base_font} "
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {descriptor_id} 0 R /W [{widths}] /CIDToGIDMap /Identity >>".encode()
+        )
+        to_unicode_id = document.add_stream("", self.create_to_unicode_cmap())
+        return document.add_object(
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{base_font} /Encoding /Identity-H "
+            f"/DescendantFonts [{cid_font_id} 0 R] /ToUnicode {to_unicode_id} 0 R >>".encode()
+        )
+
+    def create_to_unicode_cmap(self) -> bytes:
+        """Mapping of glyph ids back to characters, for searching and copying text"""
+        glyphs = sorted(self.used_glyphs.items())
+        # bfchar blocks are limited to 100 entries
+        blocks = [glyphs[i : i + 100] for i in range(0, len(glyphs), 100)]
+        bfchars = "".join(
+            f"{len(block)} beginbfchar\n"
+            + "".join(f"<{g:04X}> <{ord(c):04X}>\n" for g, c in block)
+            + "endbfchar\n"
+            for block in blocks
+        )
+        return (
+            "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+            "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+            "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+            f"{bfchars}endcmap\nCMapName currentdict /CMapResource defineresource pop\nend\nend"
+        ).encode()
+
+
+class Pdf_canvas:
+    """One PDF page, drawn in layout pixel coordinates.
+    Mimics the parts of PIL's Image and ImageDraw interfaces used by the poster creators."""
+
+    # Masks are stretched over their box by the PDF transformation, e.g. shadow masks are
+    # embedded at the reduced resolution they are blurred at
+    scales_masks = True
+
+    def __init__(self, document: Pdf_document, size_px: Tuple[int, int], dpi: int, background_color_hex: str) -> None:
+        self.document = document
+        self.size = size_px
+        self.pt_per_px = 72.0 / dpi
+        self.width_pt = size_px[H] * self.pt_per_px
+        self.height_pt = size_px[V] * self.pt_per_px
+        # Page coordinates are scaled to pixels, only the y-axis is flipped manually
+        self.operations = [f"{self.pt_per_px:.6f} 0 0 {self.pt_per_px:.6f} 0 0 cm"]
+        self.rectangle(((0, 0), (size_px[H] - 1, size_px[V] - 1)), fill=background_color_hex)
+
+    def get_content(self) -> bytes:
+        return "\n".join(self.operations).encode()
+
+    def set_color(self, color: str, operator: str) -> None:
+        r, g, b = ImageColor.getrgb(color)[:3]
+        self.operations.append(f"{r / 255:.3f} {g / 255:.3f} {b / 255:.3f} {operator}")
+
+    def rectangle(self, xy, fill: str = None, outline: str = None, width: int = 1) -> None:
+        (x0, y0), (x1, y1) = xy
+        # PIL rectangles include their end point
+        w, h = x1 - x0 + 1, y1 - y0 + 1
+        if fill is not None:
+            self.set_color(fill, "rg")
+            self.operations.append(f"{x0} {self.size[V] - y0 - h} {w} {h} re f")
+        if outline is not None and width > 0:
+            # PIL draws the outline inside the rectangle, PDF strokes centered on the path
+            self.set_color(outline, "RG")
+            self.operations.append(
+                f"{width} w {x0 + width / 2} {self.size[V] - y0 - h + width / 2} "
+                f"{w - width} {h - width} re S"
+            )
+
+    def text(self, xy, text: str, fill: str = "black", font: ImageFont.FreeTypeFont = None, align: str = "left", anchor: str = "la") -> None:
+        pdf_font = self.document.get_font(font)
+        ascent, descent = font.getmetrics()
+        lines = text.split("\n")
+        line_spacing = font.getbbox("A")[3] + 4  # as in PIL's multiline_text
+        top = xy[V]
+        if anchor[1] == "m":
+            top -= (len(lines) - 1) * line_spacing / 2.0
+            baseline_offset = (ascent - descent) / 2.0
+        else:
+            baseline_offset = ascent
+        self.set_color(fill, "rg")
+        for i, line in enumerate(lines):
+            line_width = font.getlength(line)
+            x = xy[H] - {"l": 0, "m": line_width / 2.0, "r": line_width}[anchor[0]]
+            y = self.size[V] - (top + i * line_spacing + baseline_offset)
+            self.operations.append(
+                f"BT /{pdf_font.name} {font.size} Tf {x:.2f} {y:.2f} Td <{pdf_font.encode(line)}> Tj ET"
+            )
+
+    def place_image(self, name: str, xy, size_px: Tuple[int, int]) -> None:
+        x, y = xy
+        self.operations.append(
+            f"q {size_px[H]} 0 0 {size_px[V]} {x} {self.size[V] - y - size_px[V]} cm /{name} Do Q"
+        )
+
+    def place_image_file(self, path: str, xy, size_px: Tuple[int, int], key: str = None) -> None:
+        """Placing an image file, scaled by the PDF transformation instead of resampling"""
+        self.place_image(self.document.get_image(path, key), xy, size_px)
+
+    def paste(self, image, xy, mask: Image.Image = None) -> None:
+        """Pasting an image, or a color through a mask (xy is then the box of the mask,
+        the mask is stretched over it)"""
+        if mask is not None:
+            box_size = (xy[2] - xy[0], xy[3] - xy[1]) if len(xy) == 4 else mask.size
+            self.place_image(self.document.add_masked_color(image, mask), xy[:2], box_size)
+            return
+        self.place_image(self.document.add_pseudo_image(image), xy, image.size)
@@ -1,8 +1,9 @@
 from datetime import datetime, timezone
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 import numpy as np
-from typing import Tuple
+from typing import List, Tuple
 from dimensions import Dimensions_cm
+from poster_exporter import OutputSpec
 
 
 @dataclass
@@ -10,18 +11,79 @@ class Config:
     DEFAULT_READ_DATE = datetime(year=1900, month=1, day=1, tzinfo=timezone.utc)
 
     input_rss_file: str = "./input/gr_shelf_urls.txt"
+    # Alternative source: Goodreads library export (My Books > Import and export).
+    # If set, the RSS feeds are not used.
+    input_csv_file: str = None
+    csv_shelf: str = "read"
+    csv_user_name: str = "me"
+    goodreads_user_id: int = None  # for the profile link on the poster, if no RSS feed is used
+    # Local library of the books loaded so far (SQLite), e.g. "./cache/library.sqlite": the books
+    # of the poster are selected from it, so other date ranges need no new downloads.
+    # None: the books are taken from the feeds (or the export) only, paging stops early
+    library_file: str = None
+    # False: the feeds are not loaded, the books are taken from the library only
+    # (e.g. to try other date ranges)
+    sync_library: bool = True
     output_file: str = "./output/poster.jpg"
+    # Settings of the output_file (format, quality, scale), None: the defaults of OutputSpec
+    output_spec: OutputSpec = None
+    # Further files encoded from the same render, e.g.:
+    # (OutputSpec("./output/poster_print.tif"),
+    #  OutputSpec("./output/poster_web.webp", quality=80, scale=0.25),
+    #  OutputSpec("./output/poster_thumbnail.jpg", quality=75, scale=0.05),
+    #  OutputSpec("./output/poster.dzi", quality=85))  # Deep Zoom tiles for web viewers
+    additional_outputs: Tuple[OutputSpec, ...] = ()
+    # "pil": draw with PIL, "numpy": composite in a NumPy array (see benchmark_compositing.py)
+    compositing_backend: str = "pil"
+    # > 1: the rows of the grid are composited by this many processes into a NumPy canvas
+    # in shared memory (grid packing only)
+    compositing_processes: int = 1
+
+    # Shelf feeds return up to 100 books per page, further pages are loaded concurrently
+    feed_page_concurrency: int = 4
+    max_feed_pages: int = 100
+    # Feeds and covers are loaded over shared keep-alive connections
+    http_max_retries: int = 4
+    http_requests_per_second: float = 10.0  # for all hosts together
+    http_timeout_s: float = 30.0
+    covers_dir: str = "./covers"  # downloaded covers, kept for later runs
+    # Covers are added to the poster while further covers are downloaded (grid packing only)
+    stream_covers: bool = True
+    download_concurrency: int = 8
+    # Resized covers waiting to be added, and resized covers kept for identical covers
+    # of other books. Limits the memory
+    max_covers_in_flight: int = 32
+    # Seconds from the start of a render until the covers must be downloaded. Covers not
+    # downloaded by then are drawn as title cards and recorded in <output file>_missing_covers.json,
+    # patch_missing_covers (book_poster_creator.py) adds them later. None: waiting for all covers
+    cover_deadline_s: float = None
+    # The smallest cover variant of the feed with this many times the pixels of the cover area
+    # is downloaded. Covers are downloaded again only if a later layout needs a larger variant
+    cover_oversampling: float = 1.0
 
     aspect_ratio_stretch_tolerance = 1.15  # tol > 1. Max. rel. difference between the larger a.r. to the smaller one.
 
+    # More books than the grid holds: False keeps the books read last (the others are dropped),
+    # True puts all books on several sheets (numbered files, or the pages of a PDF output)
+    multi_sheet: bool = False
+    sheet_year_boundaries: bool = False  # a new sheet starts with the first book of a year
+    parallel_sheets: int = 4  # sheets rendered at the same time (threads)
+
     # Only books read after this date are included
-    start_date = datetime(year=2015, month=1, day=1, tzinfo=timezone.utc)
+    start_date: datetime = datetime(year=2015, month=1, day=1, tzinfo=timezone.utc)
     # Only books read before this date are included
-    end_date = datetime.now(timezone.utc).astimezone()  # Now in local timezone
+    # Now in local timezone, when the config is created
+    end_date: datetime = field(default_factory=lambda: datetime.now(timezone.utc).astimezone())
 
     credit_str = "Created with the\nBook Poster Creator by N. Römheld"
     credit_url = "https://github.com/n-roemheld/book-poster"
 
+    def get_output_specs(self) -> List[OutputSpec]:
+        output_spec = OutputSpec(self.output_file)
+        if self.output_spec is not None:
+            output_spec = replace(self.output_spec, file=self.output_file)
+        return [output_spec] + list(self.additional_outputs)
+
     def get_title_str(self):
         return f"Books read between {str(self.start_date.date())} and {str(self.end_date.date())}"
 
@@ -56,6 +118,8 @@ class ConfigLayout:
 
     grid = {}
     grid["n_books"]: Tuple[int, int] = (8, 8) # Number of books (horizontal, vertical)
+    grid["auto_size"]: bool = False  # Choose n_books with the largest covers that fit all books
+    grid["packing"]: str = "grid"  # "grid": fixed cells, "justified": rows of covers at their true aspect ratios
     grid["cover_dist_factor"] = np.array([0.01, 0.01])  # of cover width, height
 
     poster = {}
@@ -74,7 +138,11 @@ class ConfigLayout:
     book["font_path"]: str = "./fonts/Lato-star.ttf"
     book["default_aspect_ratio"]: float = 0.6555 # target cover aspect ratio, median of a large set
     book["expected_cover_height"]: (int) = 475  # px, common height of cover images on GR, used for dpi calculations
-    book["shadow_factors"] = np.array([0.03, 0.06])  # of cover width, height | not implemented yet
+    book["shadow_enable"]: bool = False
+    book["shadow_factors"] = np.array([0.03, 0.06])  # offset of the shadow, of cover width, height
+    book["shadow_blur_factor"]: float = 0.04  # blur radius, of cover height
+    book["shadow_color_hex"]: str = "#000000"
+    book["shadow_opacity"]: float = 0.5
     book["font_height_factor"]: float = 1 / 15.0  # of cover height
     book["font_vspace_factor"]: float = 1 / 4.0  # of font height
 
@@ -103,6 +171,22 @@ class ConfigLayout:
         )
 
 
+@dataclass
+class ConfigSweep:
+    """Layout variants rendered by layout_sweep.py, e.g. to choose a layout"""
+
+    # Values to try per layout parameter ("section.name" of ConfigLayout),
+    # every combination is rendered
+    parameters = {}
+    parameters["grid.n_books"] = [(6, 8), (8, 8)]
+    parameters["year_shading.enable"] = [True, False]
+
+    output_dir: str = "./output/sweep"  # posters of the variants, contact sheet and timings
+    parallel_renders: int = 4  # variants rendered at the same time (threads)
+    thumbnail_height: int = 600  # px, of each poster on the contact sheet
+    contact_sheet_columns: int = 4
+
+
 if __name__ == "__main__":
     from book_poster_creator import main
 
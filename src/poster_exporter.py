@@ -0,0 +1,132 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from PIL import Image
+from deep_zoom import Deep_zoom_writer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OutputSpec:
+    """Description of one file written from the rendered poster"""
+
+    file: str
+    format: Optional[str] = None  # e.g. "JPEG", "TIFF", "WEBP", "PNG", "DZI". None: derived from the file extension
+    quality: int = 95  # JPEG/WebP quality, ignored by lossless formats
+    progressive: bool = False  # JPEG only
+    scale: float = 1.0  # of the rendered poster size, <= 1
+
+    def get_format(self) -> str:
+        if self.format is not None:
+            return self.format.upper()
+        extension = os.path.splitext(self.file)[1].lower()
+        if extension == ".dzi":
+            return "DZI"
+        return Image.registered_extensions().get(extension, "JPEG")
+
+
+@dataclass
+class ExportResult:
+    spec: OutputSpec
+    size_px: tuple
+    encode_time_s: float
+    file_size_bytes: int
+
+
+class Poster_exporter:
+    def __init__(self, dpi: int, max_workers: int = None) -> None:
+        self.dpi = dpi
+        self.max_workers = max_workers
+
+    def export(self, poster_image: Image.Image, specs: List[OutputSpec]) -> List[ExportResult]:
+        """Encoding the poster into all requested outputs concurrently"""
+        scaled_images = self.create_scaled_images(poster_image, specs)
+        # Image.save keeps the encoder settings on the image object, so outputs of the same
+        # scale are saved from copies, the first one from the image itself.
+        images = []
+        for spec in specs:
+            image = scaled_images[spec.scale]
+            images.append(image.copy() if any(image is other for other in images) else image)
+        # Pillow releases the GIL while encoding, so threads encode in parallel.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.encode, images, specs))
+        return results
+
+    @staticmethod
+    def get_output_paths(specs: List[OutputSpec]) -> List[str]:
+        """All files and directories written for the specs"""
+        paths = []
+        for spec in specs:
+            paths.append(spec.file)
+            if spec.get_format() == "DZI":
+                paths.append(Deep_zoom_writer.get_tiles_dir(spec.file))
+        return paths
+
+    def create_scaled_images(
+        self, poster_image: Image.Image, specs: List[OutputSpec]
+    ) -> Dict[float, Image.Image]:
+        """Creating one image per requested scale by successive reductions of the largest one"""
+        scaled_images = {1.0: poster_image}
+        source = poster_image
+        for scale in sorted({spec.scale for spec in specs}, reverse=True):
+            if scale in scaled_images:
+                continue
+            if not 0 < scale < 1:
+                raise ValueError(f"Output scale must be in (0, 1], got {scale}")
+            target_size = tuple(max(1, round(s * scale)) for s in poster_image.size)
+            scaled_images[scale] = self.reduce(source, target_size)
+            source = scaled_images[scale]
+        return scaled_images
+
+    def reduce(self, image: Image.Image, target_size: tuple) -> Image.Image:
+        # Integer box reduction is cheap and gets close to the target size,
+        # the remainder is done by a resampling step on the smaller image.
+        factor = min(image.size[i] // target_size[i] for i in range(2))
+        if factor >= 2:
+            image = image.reduce(factor)
+        if image.size != target_size:
+            image = image.resize(target_size, Image.LANCZOS)
+        return image
+
+    def encode(self, image: Image.Image, spec: OutputSpec) -> ExportResult:
+        start_time = time.perf_counter()
+        output_format = spec.get_format()
+        save_kwargs = {"dpi": (self.dpi * spec.scale,) * 2}
+        if output_format in ["JPEG", "WEBP"]:
+            save_kwargs["quality"] = spec.quality
+        if output_format == "JPEG":
+            save_kwargs["progressive"] = spec.progressive
+            save_kwargs["optimize"] = spec.progressive
+        elif output_format == "TIFF":
+            save_kwargs["compression"] = "tiff_lzw"
+        output_dir = os.path.dirname(spec.file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if output_format == "DZI":
+            # Tile pyramid for web viewers, tiles are encoded in parallel per level
+            file_size_bytes = Deep_zoom_writer(quality=spec.quality).write(image, spec.file)
+            return ExportResult(
+                spec=spec,
+                size_px=image.size,
+                encode_time_s=time.perf_counter() - start_time,
+                file_size_bytes=file_size_bytes,
+            )
+        image.save(spec.file, format=output_format, **save_kwargs)
+        return ExportResult(
+            spec=spec,
+            size_px=image.size,
+            encode_time_s=time.perf_counter() - start_time,
+            file_size_bytes=os.path.getsize(spec.file),
+        )
+
+    @staticmethod
+    def log_report(results: List[ExportResult]) -> None:
+        for result in results:
+            logger.info(
+                f"  {result.spec.file}: {result.size_px[0]}x{result.size_px[1]} px, "
+                f"{result.file_size_bytes / 1e6:.2f} MB, encoded in {result.encode_time_s:.2f} s"
+            )
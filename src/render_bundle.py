@@ -0,0 +1,303 @@
+"""Rendering on several machines without each one loading feeds and covers.
+A fetch step bundles everything a render needs (books, cover files, layout spec and config)
+into one file and submits it to a queue directory, e.g. on a shared drive. Render workers
+on any machine claim the bundles, render them and leave the outputs in the queue.
+Usage: python src/render_bundle.py fetch <queue dir>
+       python src/render_bundle.py work <queue dir> [idle timeout in s]"""
+
+import dataclasses
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+from typing import Dict, List, Optional
+import numpy as np
+import poster_config
+from book_library import Book_library
+from book_loader import No_books_error
+from book_poster_creator import (
+    COVER_URL_KEYS,
+    Book_poster_creator,
+    Render_caches,
+    Render_result,
+    check_python_version,
+    load_books,
+    read_rss_urls,
+    render_poster,
+)
+from json_fields import from_json_fields, to_json_fields
+from layout_spec import LayoutSpec
+from poster_exporter import OutputSpec
+
+# Increased whenever the bundle content changes, workers reject other versions
+BUNDLE_VERSION = 2
+BOOKS_FILE = "books.json"
+# Layout spec, config and outputs as plain JSON values (no code is run when reading a bundle)
+RENDER_FILE = "render.json"
+COVERS_DIR = "covers"
+
+
+def main() -> None:
+    check_python_version()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if len(sys.argv) < 3 or sys.argv[1] not in ("fetch", "work"):
+        exit(__doc__)
+    queue = Bundle_queue(sys.argv[2])
+    if sys.argv[1] == "fetch":
+        config = poster_config.Config()
+        rss_urls = [] if config.input_csv_file else read_rss_urls(config.input_rss_file)
+        caches = Render_caches.from_config(config)
+        try:
+            books, spec = load_books(config, rss_urls, caches)
+        except No_books_error as e:
+            exit(str(e))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bundle_file = os.path.join(temp_dir, "poster.bundle")
+            create_bundle(
+                bundle_file, books, spec, config.get_output_specs(), config, caches, rss_urls
+            )
+            job_id = queue.submit(bundle_file)
+        print(f"Submitted job {job_id} to {queue.queue_dir}")
+    else:
+        idle_timeout_s = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+        n_jobs = run_worker(queue.queue_dir, idle_timeout_s=idle_timeout_s)
+        print(f"Rendered {n_jobs} jobs")
+
+
+def create_bundle(
+    bundle_file: str,
+    books: np.ndarray,
+    layout_spec: LayoutSpec,
+    outputs: List[OutputSpec],
+    config: poster_config.Config = None,
+    caches: Render_caches = None,
+    rss_urls: List[str] = (),
+) -> None:
+    """Fetch step: downloading the covers of the books on the poster and writing them into
+    the bundle, with the books (text fields only), the layout spec, the config and the outputs.
+    Books without a usable cover get no cover URL, so the workers draw title cards."""
+    caches = caches if caches is not None else Render_caches()
+    config = dataclasses.replace(
+        config if config is not None else poster_config.Config(), stream_covers=False
+    )
+    # Downloads the covers (the books are trimmed to the grid like for the poster)
+    creator = Book_poster_creator(
+        caches.layout_cache.get_layout(layout_spec),
+        config,
+        list(rss_urls),
+        books=np.asarray(books),
+        chrome_cache=caches.chrome_cache,
+        http_client=caches.http_client,
+        artifact_cache=caches.artifact_cache,
+    )
+    book_records = []
+    temp_file = f"{bundle_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # Covers are JPEG files already, they are stored without compression
+    with zipfile.ZipFile(temp_file, "w", zipfile.ZIP_STORED) as bundle:
+        for book in creator.books:
+            book_record = json.loads(Book_library.to_json(book))
+            # Only the variant in the bundle is kept, the workers download nothing
+            cover_url_key = creator.get_cover_url_key(book)
+            for key in COVER_URL_KEYS:
+                if key != cover_url_key:
+                    book_record[key] = ""
+            if creator.has_cover(book):
+                bundle.write(
+                    creator.get_cover_filename(book), f"{COVERS_DIR}/{book['book_id']}.jpg"
+                )
+            else:
+                book_record[cover_url_key] = ""
+            book_records.append(book_record)
+        bundle.writestr(BOOKS_FILE, json.dumps(book_records))
+        bundle.writestr(
+            RENDER_FILE,
+            json.dumps(
+                {
+                    "version": BUNDLE_VERSION,
+                    "layout_spec": to_json_fields(layout_spec),
+                    # With the start date of the trimmed books
+                    "config": to_json_fields(creator.config),
+                    # Written to the output directory of the worker
+                    "outputs": [
+                        to_json_fields(dataclasses.replace(spec, file=os.path.basename(spec.file)))
+                        for spec in outputs
+                    ],
+                    "rss_urls": list(rss_urls),
+                }
+            ),
+        )
+    os.replace(temp_file, bundle_file)
+    print(f"Bundled {len(book_records)} books into {bundle_file}")
+
+
+def render_bundle(bundle_file: str, output_dir: str, caches: Render_caches = None) -> Render_result:
+    """Rendering the poster of the bundle into output_dir, only from the bundle"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with zipfile.ZipFile(bundle_file) as bundle:
+            if RENDER_FILE not in bundle.namelist():
+                raise ValueError(f"Bundle {bundle_file} not supported (no {RENDER_FILE})!")
+            render = json.loads(bundle.read(RENDER_FILE))
+            if render["version"] != BUNDLE_VERSION:
+                raise ValueError(
+                    f"Bundle version {render['version']} not supported (expected {BUNDLE_VERSION})!"
+                )
+            books = np.array(json.loads(bundle.read(BOOKS_FILE)))
+            cover_files = [name for name in bundle.namelist() if name.startswith(f"{COVERS_DIR}/")]
+            bundle.extractall(temp_dir, members=cover_files)
+        config = dataclasses.replace(
+            from_json_fields(poster_config.Config, render["config"]),
+            covers_dir=os.path.join(temp_dir, COVERS_DIR),
+            stream_covers=False,
+        )
+        os.makedirs(output_dir, exist_ok=True)
+        outputs = [
+            # Only file names, nothing is written outside of output_dir
+            dataclasses.replace(
+                from_json_fields(OutputSpec, spec),
+                file=os.path.join(output_dir, os.path.basename(spec["file"])),
+            )
+            for spec in render["outputs"]
+        ]
+        layout_spec = from_json_fields(LayoutSpec, render["layout_spec"])
+        return render_poster(books, layout_spec, outputs, config, caches, render["rss_urls"])
+
+
+class Bundle_queue:
+    """Render jobs in a directory, e.g. on a shared drive:
+        pending/<job>.bundle   submitted bundles, claimed in the order of submission
+        claimed/<job>.bundle   claimed by a worker (moved, so each job is claimed only once)
+        claimed/<job>/         outputs while rendering
+        done/<job>/            outputs and result.json
+        failed/<job>.bundle    bundles whose render failed, with <job>.json
+    Jobs of workers that stopped while rendering remain in claimed/ and can be submitted again."""
+
+    def __init__(self, queue_dir: str) -> None:
+        self.queue_dir = queue_dir
+        for state in ("pending", "claimed", "done", "failed"):
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def get_path(self, state: str, name: str) -> str:
+        return os.path.join(self.queue_dir, state, name)
+
+    def submit(self, bundle_file: str) -> str:
+        """Adding a copy of the bundle, returns the job id"""
+        # Sorted by time of submission
+        job_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+        temp_file = self.get_path("pending", f".{job_id}.tmp")  # not claimed while copying
+        shutil.copyfile(bundle_file, temp_file)
+        os.replace(temp_file, self.get_path("pending", f"{job_id}.bundle"))
+        return job_id
+
+    def claim(self) -> Optional[str]:
+        """Job id of the oldest pending job, which is moved to claimed/. None if there is none."""
+        for filename in sorted(os.listdir(os.path.join(self.queue_dir, "pending"))):
+            if not filename.endswith(".bundle"):
+                continue
+            try:
+                os.rename(self.get_path("pending", filename), self.get_path("claimed", filename))
+            except FileNotFoundError:
+                continue  # claimed by another worker in the meantime
+            return filename[: -len(".bundle")]
+        return None
+
+    def complete(self, job_id: str, result: dict) -> None:
+        output_dir = self.get_path("claimed", job_id)
+        with open(os.path.join(output_dir, "result.json"), "w") as f:
+            json.dump(result, f)
+        os.replace(output_dir, self.get_path("done", job_id))
+        os.remove(self.get_path("claimed", f"{job_id}.bundle"))
+
+    def fail(self, job_id: str, result: dict) -> None:
+        with open(self.get_path("failed", f"{job_id}.json"), "w") as f:
+            json.dump(result, f)
+        os.replace(
+            self.get_path("claimed", f"{job_id}.bundle"), self.get_path("failed", f"{job_id}.bundle")
+        )
+        shutil.rmtree(self.get_path("claimed", job_id), ignore_errors=True)
+
+    def get_result(self, job_id: str) -> Optional[dict]:
+        """Result of a finished job ("status": "done" or "failed"), None if not finished yet.
+        The output files of done jobs are in done/<job id>/."""
+        for result_file in (
+            os.path.join(self.get_path("done", job_id), "result.json"),
+            self.get_path("failed", f"{job_id}.json"),
+        ):
+            if os.path.exists(result_file):
+                with open(result_file) as f:
+                    return json.load(f)
+        return None
+
+    def wait_for_results(
+        self, job_ids: List[str], timeout_s: float = None, poll_interval_s: float = 0.5
+    ) -> Dict[str, dict]:
+        """Results of the jobs, of those finished within the timeout only"""
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        results = {}
+        while True:
+            for job_id in job_ids:
+                if job_id not in results:
+                    result = self.get_result(job_id)
+                    if result is not None:
+                        results[job_id] = result
+            if len(results) == len(job_ids) or (deadline is not None and time.monotonic() > deadline):
+                return results
+            time.sleep(poll_interval_s)
+
+
+def run_worker(
+    queue_dir: str,
+    worker_id: str = None,
+    caches: Render_caches = None,
+    idle_timeout_s: float = 0.0,
+    poll_interval_s: float = 0.5,
+) -> int:
+    """Rendering the jobs of the queue until there is none for idle_timeout_s.
+    Returns the number of jobs rendered (including failed ones)."""
+    queue = Bundle_queue(queue_dir)
+    worker_id = worker_id or f"{socket.gethostname()}_{os.getpid()}"
+    # Layouts and title/signature images are reused between the jobs of the worker
+    caches = caches if caches is not None else Render_caches()
+    n_jobs = 0
+    idle_since = time.monotonic()
+    while True:
+        job_id = queue.claim()
+        if job_id is None:
+            if time.monotonic() - idle_since >= idle_timeout_s:
+                return n_jobs
+            time.sleep(poll_interval_s)
+            continue
+        print(f"Worker {worker_id}: rendering job {job_id}...")
+        try:
+            result = render_bundle(
+                queue.get_path("claimed", f"{job_id}.bundle"), queue.get_path("claimed", job_id), caches
+            )
+            queue.complete(
+                job_id,
+                {
+                    "status": "done",
+                    "worker": worker_id,
+                    "files": [os.path.relpath(path, queue.get_path("claimed", job_id)) for path in result.files],
+                    "n_books": result.n_books,
+                    "start_date": result.start_date.isoformat(),
+                    "end_date": result.end_date.isoformat(),
+                    "render_time_s": result.render_time_s,
+                },
+            )
+        except Exception as e:
+            error_text = traceback.format_exc()
+            print(f"Worker {worker_id}: job {job_id} failed ({e})")
+            queue.fail(job_id, {"status": "failed", "worker": worker_id, "error": error_text})
+        n_jobs += 1
+        idle_since = time.monotonic()
+
+
+if __name__ == "__main__":
+    main()
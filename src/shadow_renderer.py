@@ -0,0 +1,97 @@
+import math
+from typing import List, Tuple
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+import layout_generator
+
+
+class Shadow_renderer:
+    """Drop shadows under the covers, rendered as one blurred mask for all covers.
+    The mask is drawn and blurred at reduced resolution (a few pixels per blur radius),
+    so the cost hardly depends on the number of covers."""
+
+    PIXELS_PER_RADIUS = 4  # resolution of the blurred mask
+
+    def __init__(self, layout: layout_generator.PosterLayout) -> None:
+        self.layout = layout
+        self.shadow = layout.book.shadow
+
+    def add_shadows(
+        self,
+        poster_image,
+        cover_boxes: List[tuple],
+        exclude_boxes: List[tuple] = None,
+        clip: tuple = None,
+    ) -> None:
+        """Compositing the shadows of all covers (boxes: x0, y0, x1, y1, end exclusive)
+        in a single paste. Must be called before the covers are added, unless the covers
+        are passed as exclude_boxes, which are left untouched. With clip (a box), only the
+        shadows within it are added."""
+        if not cover_boxes:
+            return
+        # Canvases scaling masks themselves (PDF) get the mask at reduced resolution
+        scaled_by_canvas = (
+            getattr(poster_image, "scales_masks", False) and not exclude_boxes and clip is None
+        )
+        region, mask = self.render_mask(cover_boxes, clip, full_size=not scaled_by_canvas)
+        if mask is None:
+            return
+        if exclude_boxes:
+            draw = ImageDraw.Draw(mask)
+            for x0, y0, x1, y1 in exclude_boxes:
+                draw.rectangle(
+                    ((x0 - region[0], y0 - region[1]), (x1 - region[0] - 1, y1 - region[1] - 1)),
+                    fill=0,
+                )
+        poster_image.paste(self.shadow.color_hex, region, mask)
+
+    def render_mask(
+        self, cover_boxes: List[tuple], clip: tuple = None, full_size: bool = True
+    ) -> Tuple[tuple, Image.Image]:
+        """Region of the poster covered by shadows and the shadow opacity within.
+        The region is limited to clip, the mask is then None if nothing is left.
+        Without full_size (and clip), the mask is returned at reduced resolution, to be
+        stretched over the region."""
+        radius = self.shadow.blur_radius.px
+        boxes = np.array(cover_boxes, dtype=float) + np.tile(self.shadow.offset.dim_px, 2)
+        # The blur extends about three radii beyond the shadow rectangles
+        margin = 3 * radius
+        region = (
+            max(math.floor(boxes[:, 0].min() - margin), 0),
+            max(math.floor(boxes[:, 1].min() - margin), 0),
+            min(math.ceil(boxes[:, 2].max() + margin), self.layout.poster.dim.width_px),
+            min(math.ceil(boxes[:, 3].max() + margin), self.layout.poster.dim.height_px),
+        )
+        region_size = (region[2] - region[0], region[3] - region[1])
+        scale = max(radius / self.PIXELS_PER_RADIUS, 1.0)
+        small_size = tuple(max(math.ceil(s / scale), 1) for s in region_size)
+        mask = Image.new("L", small_size, 0)
+        draw = ImageDraw.Draw(mask)
+        opacity = round(255 * self.shadow.opacity)
+        for x0, y0, x1, y1 in (boxes - np.tile(region[:2], 2)) / scale:
+            draw.rectangle(
+                ((round(x0), round(y0)), (round(x1) - 1, round(y1) - 1)), fill=opacity
+            )
+        if radius > 0:
+            # PIL approximates the Gaussian by repeated separable box blurs
+            mask = mask.filter(ImageFilter.GaussianBlur(radius / scale))
+        if clip is None:
+            return region, mask.resize(region_size, Image.BILINEAR) if full_size else mask
+        clipped_region = (
+            max(region[0], clip[0]),
+            max(region[1], clip[1]),
+            min(region[2], clip[2]),
+            min(region[3], clip[3]),
+        )
+        if clipped_region[0] >= clipped_region[2] or clipped_region[1] >= clipped_region[3]:
+            return clipped_region, None
+        # Upscaling only the clipped part of the mask, the same pixels as cropping the full size
+        scale_x, scale_y = mask.size[0] / region_size[0], mask.size[1] / region_size[1]
+        source_box = (
+            (clipped_region[0] - region[0]) * scale_x,
+            (clipped_region[1] - region[1]) * scale_y,
+            (clipped_region[2] - region[0]) * scale_x,
+            (clipped_region[3] - region[1]) * scale_y,
+        )
+        clipped_size = (clipped_region[2] - clipped_region[0], clipped_region[3] - clipped_region[1])
+        return clipped_region, mask.resize(clipped_size, Image.BILINEAR, box=source_box)
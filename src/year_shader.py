@@ -1,7 +1,7 @@
 from datetime import datetime
 import numpy as np
 from PIL import ImageDraw
-from typing import Tuple
+from typing import List, Tuple
 import layout_generator
 from constants import *
 
@@ -42,6 +42,45 @@ class Year_shader:
                         outline=None,
                     )
 
+    def shade_cells(self, books: np.ndarray, draw: ImageDraw, cells: list) -> None:
+        """Shading for covers at arbitrary positions (e.g. justified rows):
+        one rectangle per year and row, spanning the year's covers and texts in that row"""
+        protrusion = self.layout.year_shading.protrusion
+        text_height = self.layout.book.number_of_text_lines * (
+            self.layout.book_font_size.px + self.layout.book.font_vspace.px
+        )
+        years = [
+            datetime.strptime(book["user_read_at"], "%a, %d %b %Y %H:%M:%S %z").year
+            for book in books
+        ]
+        year_index = 0
+        span_start = 0
+        for b in range(1, len(books) + 1):
+            if b < len(books) and years[b] == years[b - 1] and cells[b].row == cells[b - 1].row:
+                continue
+            # Span of books from span_start to b-1 ends here
+            color = (
+                self.layout.year_shading.color1_hex
+                if year_index % 2 == 0
+                else self.layout.year_shading.color2_hex
+            )
+            if color != self.layout.poster.background_color_hex:
+                first, last = cells[span_start], cells[b - 1]
+                draw.rectangle(
+                    (
+                        (first.x - protrusion.width_px, first.y - protrusion.height_px),
+                        (
+                            last.x + last.width + protrusion.width_px,
+                            last.y + last.height + text_height + protrusion.height_px,
+                        ),
+                    ),
+                    fill=color,
+                    outline=None,
+                )
+            if b < len(books) and years[b] != years[b - 1]:
+                year_index += 1
+            span_start = b
+
     def get_grid_col_indices_in_row(
         self,
         row: int,
@@ -65,38 +104,27 @@ class Year_shader:
     def get_grid_index_of_first_books_in_years(
         self, books: np.ndarray
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        # Add first book/year
-        years = [
-            int(
-                datetime.strptime(
-                    books[0]["user_read_at"], "%a, %d %b %Y %H:%M:%S %z"
-                ).year
-            ),
-        ]
-        row_first_book_in_year = [
-            0,
-        ]
-        col_first_book_in_year = [
-            0,
-        ]
+        years, first_books_in_years = self.get_first_books_in_years(books)
+        # Dummy for the end of the grid
+        years.append(years[-1] + 1)
+        first_books_in_years.append(len(books))
+
+        years = np.array(years, dtype=int)
+        first_books_in_years = np.array(first_books_in_years, dtype=int)
+        # Grid positions of the first covers
+        row_first_book_in_year = first_books_in_years // self.layout.grid.n_books[H]
+        col_first_book_in_year = first_books_in_years % self.layout.grid.n_books[H]
+        return years, row_first_book_in_year, col_first_book_in_year
+
+    def get_first_books_in_years(self, books: np.ndarray) -> Tuple[List[int], List[int]]:
+        """Years of the books (ordered by read date) and the index of the first book in each"""
+        years = []
+        first_books_in_years = []
         for b, book in enumerate(books):
-            if b == 0:  # already added
-                continue
             current_year = int(
                 datetime.strptime(book["user_read_at"], "%a, %d %b %Y %H:%M:%S %z").year
             )
-            if years[-1] < current_year:  # New year
+            if not years or years[-1] < current_year:  # New year
                 years.append(current_year)
-                # Grid position of the current cover
-                row_first_book_in_year.append(b // self.layout.grid.n_books[H])
-                col_first_book_in_year.append(b % self.layout.grid.n_books[H])
-        # Dummy for the end of the grid
-        b = b + 1
-        years.append(current_year + 1)
-        row_first_book_in_year.append(b // self.layout.grid.n_books[H])
-        col_first_book_in_year.append(b % self.layout.grid.n_books[H])
-
-        years = np.array(years, dtype=int)
-        row_first_book_in_year = np.array(row_first_book_in_year, dtype=int)
-        col_first_book_in_year = np.array(col_first_book_in_year, dtype=int)
-        return years, row_first_book_in_year, col_first_book_in_year
\ No newline at end of file
+                first_books_in_years.append(b)
+        return years, first_books_in_years
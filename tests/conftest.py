@@ -0,0 +1,86 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+
+
+@pytest.fixture(autouse=True)
+def root_dir(monkeypatch):
+    """The fonts of the layout are found relative to the repository"""
+    monkeypatch.chdir(ROOT_DIR)
+
+
+def make_books(covers_dir: str, n_books: int, seed: int = 0) -> np.ndarray:
+    """Books read over several years, with plain covers in covers_dir (downloaded already)"""
+    rng = random.Random(seed)
+    os.makedirs(covers_dir, exist_ok=True)
+    read_at = datetime(year=2016, month=1, day=1, tzinfo=timezone.utc)
+    books = []
+    for i in range(n_books):
+        read_at += timedelta(days=rng.randint(20, 60))
+        book_id = str(1000 + i)
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        Image.new("RGB", (rng.choice([300, 316, 400]), 475), color).save(
+            os.path.join(covers_dir, f"{book_id}.jpg"), quality=90
+        )
+        books.append(
+            {
+                "book_id": book_id,
+                "title": f"Book {i}",
+                "author_name": f"Author {i}",
+                "book_published": "2000",
+                "num_pages": str(rng.randint(100, 900)),
+                "average_rating": "3.9",
+                "user_rating": str(rng.randint(0, 5)),
+                "user_read_at": read_at.strftime("%a, %d %b %Y %H:%M:%S %z"),
+                "user_name": "Tester",
+                "book_large_image_url": f"https://example.invalid/{book_id}.jpg",
+                "book_medium_image_url": "",
+                "book_small_image_url": "",
+            }
+        )
+    return np.array(books)
+
+
+def make_layout_spec(config, n_books=(4, 3), packing="grid", **book):
+    """Spec of a small poster, the defaults of ConfigLayout are not changed"""
+    from dimensions import Dimensions_cm
+    from layout_spec import LayoutSpec
+    from layout_sweep import get_config_layout
+
+    config_layout = get_config_layout({"grid.n_books": n_books, "grid.packing": packing})
+    config_layout.poster["dim"] = Dimensions_cm(width=20, height=30)
+    config_layout.book.update(book)
+    return LayoutSpec.from_config(config_layout, config)
+
+
+@pytest.fixture
+def config(tmp_path):
+    import poster_config
+
+    return poster_config.Config(
+        library_file=None,
+        goodreads_user_id=1,
+        covers_dir=str(tmp_path / "covers"),
+        output_file=str(tmp_path / "output" / "poster.png"),
+    )
+
+
+@pytest.fixture
+def caches(tmp_path):
+    from book_poster_creator import Render_caches
+    from artifact_cache import Artifact_cache
+    from chrome_cache import Chrome_cache
+    from layout_cache import Layout_cache
+
+    return Render_caches(
+        layout_cache=Layout_cache(str(tmp_path / "cache" / "layouts")),
+        chrome_cache=Chrome_cache(str(tmp_path / "cache" / "chrome")),
+        artifact_cache=Artifact_cache(str(tmp_path / "cache" / "artifacts")),
+    )
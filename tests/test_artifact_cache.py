@@ -0,0 +1,63 @@
+import os
+import time
+import pytest
+from conftest import make_books, make_layout_spec
+from artifact_cache import Artifact_cache
+from book_poster_creator import render_poster
+from poster_exporter import OutputSpec
+
+
+def test_keys_contain_the_upstream_artifacts():
+    key = Artifact_cache.get_key("filter", {"parse": "a"}, "first", "last", 64)
+    assert Artifact_cache.get_key("filter", {"parse": "a"}, "first", "last", 64) == key
+    assert Artifact_cache.get_key("filter", {"parse": "b"}, "first", "last", 64) != key
+    assert Artifact_cache.get_key("filter", {"parse": "a"}, "first", "last", 32) != key
+    with pytest.raises(ValueError):
+        Artifact_cache.get_key("filter", {}, "first", "last", 64)
+    with pytest.raises(ValueError):
+        Artifact_cache.get_key("poster", {"filter": "a", "covers": []}, "image")
+
+
+def set_ages(artifact_cache, stage, keys, suffix=""):
+    """Oldest first, a second apart"""
+    now = time.time()
+    for i, key in enumerate(keys):
+        mtime = now - 100 + i
+        os.utime(artifact_cache.get_path(stage, key) + suffix, (mtime, mtime))
+
+
+def test_artifacts_used_last_are_kept(tmp_path):
+    artifact_cache = Artifact_cache(str(tmp_path), max_entries=3)
+    for key in "abc":
+        artifact_cache.save("parse", key, [key])
+    set_ages(artifact_cache, "parse", "abc", ".pickle")
+    assert artifact_cache.load("parse", "a") == ["a"]  # now used last
+    artifact_cache.save("parse", "d", ["d"])
+    assert [artifact_cache.load("parse", key) for key in "abcd"] == [["a"], None, ["c"], ["d"]]
+
+
+def test_output_files_used_last_are_kept(tmp_path):
+    artifact_cache = Artifact_cache(str(tmp_path / "cache"), max_file_entries=2)
+    output_file = str(tmp_path / "poster.png")
+    for key in "abc":
+        with open(output_file, "w") as f:
+            f.write(key)
+        artifact_cache.save_files("poster", key, [output_file])
+        set_ages(artifact_cache, "poster", key)
+    assert sorted(os.listdir(os.path.join(artifact_cache.cache_dir, "poster"))) == ["b", "c"]
+    assert artifact_cache.load_files("poster", "b", [output_file])
+    with open(output_file) as f:
+        assert f.read() == "b"
+    assert not artifact_cache.load_files("poster", "a", [output_file])
+
+
+def test_unchanged_poster_is_restored(config, caches, tmp_path):
+    books = make_books(config.covers_dir, 12)
+    outputs = [OutputSpec(str(tmp_path / "poster.png"))]
+    assert not render_poster(books, make_layout_spec(config), outputs, config, caches).restored
+    os.remove(outputs[0].file)
+    assert render_poster(books, make_layout_spec(config), outputs, config, caches).restored
+    assert os.path.exists(outputs[0].file)
+    # Another layout is rendered again
+    assert not render_poster(books, make_layout_spec(config, (3, 4)), outputs, config, caches).restored
+    assert caches.artifact_cache.stats["poster"] == {"skipped": 1, "computed": 2}
@@ -0,0 +1,61 @@
+import os
+import dataclasses
+import pytest
+from conftest import make_books, make_layout_spec
+from book_poster_creator import Book_poster_creator, render_poster
+from poster_exporter import OutputSpec
+
+SHM_DIR = "/dev/shm"
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(SHM_DIR), reason="POSIX shared memory only")
+
+
+def get_segments():
+    return {name for name in os.listdir(SHM_DIR) if name.startswith("psm_")}
+
+
+@pytest.fixture
+def compositor_config(config):
+    return dataclasses.replace(config, compositing_processes=2)
+
+
+def test_shared_memory_released_after_render(compositor_config, caches):
+    books = make_books(compositor_config.covers_dir, 12)
+    segments = get_segments()
+    result = render_poster(
+        books, make_layout_spec(compositor_config), [OutputSpec(compositor_config.output_file)],
+        compositor_config, caches,
+    )
+    assert os.path.exists(result.files[0])
+    assert get_segments() == segments
+
+
+def test_shared_memory_released_if_download_fails(compositor_config, caches, monkeypatch):
+    books = make_books(compositor_config.covers_dir, 12)
+
+    def download_covers(self, *args):
+        raise RuntimeError("download failed")
+
+    monkeypatch.setattr(Book_poster_creator, "download_covers", download_covers)
+    segments = get_segments()
+    with pytest.raises(RuntimeError, match="download failed"):
+        render_poster(
+            books, make_layout_spec(compositor_config), [OutputSpec(compositor_config.output_file)],
+            compositor_config, caches,
+        )
+    assert get_segments() == segments
+
+
+def test_shared_memory_released_if_export_fails(compositor_config, caches):
+    books = make_books(compositor_config.covers_dir, 12)
+    segments = get_segments()
+    # The image of the canvas exists when the export fails
+    with pytest.raises(ValueError, match="Output scale"):
+        render_poster(
+            books,
+            make_layout_spec(compositor_config),
+            [OutputSpec(compositor_config.output_file), OutputSpec("poster_small.png", scale=2.0)],
+            compositor_config,
+            caches,
+        )
+    assert get_segments() == segments
@@ -0,0 +1,28 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+import pytest
+from book_library import Book_library
+
+
+def get_dated_books(user_name, book_ids):
+    read_at = datetime(year=2020, month=1, day=1, tzinfo=timezone.utc)
+    for i in book_ids:
+        yield read_at + timedelta(days=i), {"user_name": user_name, "book_id": str(i), "title": f"Book {i}"}
+
+
+def test_sync_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(Book_library, "SYNC_BATCH_SIZE", 7)
+    with Book_library(str(tmp_path / "library.sqlite")) as library:
+        books = list(get_dated_books("a", range(20))) + list(get_dated_books("b", range(20, 25)))
+        assert library.sync("read", iter(books), is_complete=True) == {"a", "b"}
+        assert library.count_books() == 25
+        # The complete shelf without the first books of each user
+        books = list(get_dated_books("a", range(5, 20))) + list(get_dated_books("b", range(22, 25)))
+        assert library.sync("read", iter(books), is_complete=True) == {"a", "b"}
+        assert library.count_books() == 18
+        start, end = datetime(2000, 1, 1, tzinfo=timezone.utc), datetime(2030, 1, 1, tzinfo=timezone.utc)
+        selected = library.query(["read"], start, end, max_books=3)
+        assert [book["book_id"] for book in selected] == ["22", "23", "24"]
+    # Closed on leaving the block
+    with pytest.raises(sqlite3.ProgrammingError):
+        library.count_books()
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from artifact_cache import Artifact_cache
+from book_loader import Book_loader, No_books_error
+
+FIRST_READ_AT = datetime(year=2020, month=1, day=1, tzinfo=timezone.utc)
+
+
+def make_entry(book_id, day, user_name="a"):
+    read_at = FIRST_READ_AT + timedelta(days=day)
+    return {
+        "book_id": str(book_id),
+        "title": f"Book {book_id}",
+        "user_name": user_name,
+        "user_read_at": read_at.strftime("%a, %d %b %Y %H:%M:%S %z"),
+    }
+
+
+@pytest.fixture
+def loader(config, tmp_path):
+    config.start_date = FIRST_READ_AT + timedelta(days=10)
+    config.end_date = FIRST_READ_AT + timedelta(days=90)
+    return Book_loader(config, artifact_cache=Artifact_cache(str(tmp_path / "artifacts")))
+
+
+def get_book_ids(books):
+    return [book["book_id"] for book in books]
+
+
+def test_merge_dedupes_by_book_id(loader):
+    feed_a = [make_entry(i, i) for i in range(60, 20, -5)]  # sorted by read date
+    feed_b = [make_entry(i, i + 1, "b") for i in [30, 50, 40]]  # unsorted, read later than in a
+    books = loader.merge_books([feed_a, feed_b])
+    assert get_book_ids(books) == [str(i) for i in range(25, 61, 5)]
+    # The entry read last is kept
+    assert {book["book_id"]: book["user_name"] for book in books}["40"] == "b"
+
+
+def test_merge_applies_date_window(loader):
+    feed = [make_entry(i, i) for i in range(120, -1, -10)]
+    books = loader.merge_books([feed, list(reversed(feed))])
+    assert get_book_ids(books) == [str(i) for i in range(10, 91, 10)]
+    loader.config.start_date = FIRST_READ_AT + timedelta(days=200)
+    with pytest.raises(No_books_error):
+        loader.merge_books([feed])
+
+
+def test_merge_keeps_newest_books_and_stops_early(loader):
+    feed = [make_entry(i, i) for i in range(90, 9, -1)]
+    unsorted_feed = [make_entry(i, i, "b") for i in [95, 12, 88, 89, 50]]
+    books = loader.merge_books([feed, unsorted_feed], max_books=3)
+    assert get_book_ids(books) == ["88", "89", "90"]
+    # The sorted feed is read lazily (after checking its order) up to the books of the poster
+    feed = Counting_feed(feed)
+    loader.merge_books([feed], max_books=3)
+    assert feed.n_read <= 5
+
+
+class Counting_feed(list):
+    """Counts the entries read by the last iteration"""
+
+    def __iter__(self):
+        self.n_read = 0
+        for entry in super().__iter__():
+            self.n_read += 1
+            yield entry
+
+
+def test_unsorted_source_keeps_max_books(loader):
+    books = [make_entry(i, (i * 37) % 100) for i in range(100)]
+    newest = loader.get_newest_books(books, max_books=5)
+    read_dates = [read_at for read_at, _ in newest]
+    in_range = sorted(
+        loader.get_read_date(book)
+        for book in books
+        if loader.config.start_date <= loader.get_read_date(book) <= loader.config.end_date
+    )
+    assert read_dates == in_range[::-1][:5]
+
+
+def write_export(csv_file, rows):
+    header = "Book Id,Title,Author,ISBN,ISBN13,Number of Pages,Date Read,Date Added,Bookshelves,Exclusive Shelf\n"
+    with open(csv_file, "w", encoding="utf-8") as f:
+        f.write(header)
+        for book_id, date_read, shelves, exclusive_shelf in rows:
+            f.write(
+                f'{book_id},Book {book_id},Author,"=""""","=""97800000{book_id}""",200,'
+                f'{date_read},2019/12/01,"{shelves}",{exclusive_shelf}\n'
+            )
+
+
+def test_csv_export_filters_shelf_and_dates(loader, tmp_path):
+    csv_file = str(tmp_path / "goodreads_library_export.csv")
+    write_export(
+        csv_file,
+        [
+            ("11", "2020/01/05", "", "read"),  # before the start date
+            ("12", "2020/01/20", "", "read"),
+            ("13", "2020/02/10", "", "to-read"),
+            ("14", "2020/03/01", "favorites, classics", "read"),
+            ("15", "2020/02/01", "", "read"),
+            ("16", "2020/05/01", "", "read"),  # after the end date
+            ("17", "", "", "read"),  # no read date
+        ],
+    )
+    loader.config.input_csv_file = csv_file
+    books = loader.get_list_of_books([])
+    assert get_book_ids(books) == ["12", "15", "14"]
+    assert books[0]["isbn"] == "9780000012"
+    assert books[0]["book_large_image_url"].startswith("https://covers.openlibrary.org/b/isbn/9780000012-L")
+    assert books[0]["user_read_at"] == "Mon, 20 Jan 2020 00:00:00 +0000"
+    # The newest books only
+    assert get_book_ids(loader.get_list_of_books([], max_books=2)) == ["15", "14"]
+    # Books on a custom shelf
+    loader.config.csv_shelf = "favorites"
+    assert get_book_ids(loader.get_list_of_books([])) == ["14"]
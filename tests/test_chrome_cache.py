@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from chrome_cache import Chrome_cache
+from conftest import make_layout_spec
+from layout_generator import PosterLayoutCreator
+
+PROFILE_LINK = "https://www.goodreads.com/user/show/1"
+
+
+@pytest.fixture
+def layout(config):
+    return PosterLayoutCreator(spec=make_layout_spec(config)).create_poster_layout()
+
+
+def test_layers_are_kept_and_bounded(layout, config, tmp_path):
+    chrome_cache = Chrome_cache(str(tmp_path / "chrome"), max_layers=2)
+    layers = [chrome_cache.get_layer(layout, config, PROFILE_LINK, name) for name in "abc"]
+    assert len(chrome_cache.layers) == 2
+    assert chrome_cache.stats == {"skipped": 0, "computed": 3}
+    assert chrome_cache.get_layer(layout, config, PROFILE_LINK, "c") is layers[2]
+    # Evicted from memory, loaded from disk
+    layer = chrome_cache.get_layer(layout, config, PROFILE_LINK, "a")
+    assert [position for position, _ in layer] == [position for position, _ in layers[0]]
+    assert chrome_cache.stats == {"skipped": 2, "computed": 3}
+
+
+def test_layers_are_rendered_concurrently(layout, config, tmp_path):
+    chrome_cache = Chrome_cache(str(tmp_path / "chrome"))
+    render_layer = chrome_cache.render_layer
+    barrier = threading.Barrier(2, timeout=10)
+
+    def render_layer_together(*args):
+        barrier.wait()  # both layers are rendered at the same time
+        return render_layer(*args)
+
+    chrome_cache.render_layer = render_layer_together
+    with ThreadPoolExecutor(2) as executor:
+        futures = [
+            executor.submit(chrome_cache.get_layer, layout, config, PROFILE_LINK, name)
+            for name in "ab"
+        ]
+        assert all(future.result() for future in futures)
+
+
+def test_same_layer_is_rendered_once(layout, config, tmp_path):
+    chrome_cache = Chrome_cache(str(tmp_path / "chrome"))
+    render_layer = chrome_cache.render_layer
+    n_renders = 0
+
+    def render_layer_slowly(*args):
+        nonlocal n_renders
+        n_renders += 1
+        time.sleep(0.2)
+        return render_layer(*args)
+
+    chrome_cache.render_layer = render_layer_slowly
+    with ThreadPoolExecutor(4) as executor:
+        layers = list(
+            executor.map(lambda _: chrome_cache.get_layer(layout, config, PROFILE_LINK, "a"), range(4))
+        )
+    assert n_renders == 1
+    assert all(layer is layers[0] for layer in layers)
@@ -0,0 +1,54 @@
+import dataclasses
+import re
+import numpy as np
+import pytest
+from PIL import Image
+from conftest import make_books, make_layout_spec
+from book_poster_creator import render_poster
+from poster_exporter import OutputSpec
+
+
+def render_pixels(books, layout_spec, config, caches, tmp_path, **config_changes):
+    output_file = str(tmp_path / ("_".join(f"{k}_{v}" for k, v in config_changes.items()) + ".png"))
+    config = dataclasses.replace(config, **config_changes)
+    result = render_poster(books, layout_spec, [OutputSpec(output_file)], config, caches)
+    assert not result.restored
+    with Image.open(output_file) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+@pytest.mark.parametrize("packing", ["grid", "justified"])
+def test_numpy_backend_gives_identical_pixels(config, caches, tmp_path, packing):
+    books = make_books(config.covers_dir, 11)
+    layout_spec = make_layout_spec(config, packing=packing)
+    pil_pixels = render_pixels(books, layout_spec, config, caches, tmp_path, compositing_backend="pil")
+    numpy_pixels = render_pixels(books, layout_spec, config, caches, tmp_path, compositing_backend="numpy")
+    assert np.array_equal(pil_pixels, numpy_pixels)
+
+
+def test_shadows_give_identical_pixels(config, caches, tmp_path):
+    books = make_books(config.covers_dir, 11)
+    layout_spec = make_layout_spec(config, shadow_enable=True)
+    pil_pixels = render_pixels(books, layout_spec, config, caches, tmp_path, compositing_backend="pil")
+    numpy_pixels = render_pixels(books, layout_spec, config, caches, tmp_path, compositing_backend="numpy")
+    assert np.array_equal(pil_pixels, numpy_pixels)
+    # The shadows are drawn: darker pixels below the covers than without shadows
+    no_shadow_pixels = render_pixels(
+        books, make_layout_spec(config), config, caches, tmp_path, compositing_backend="numpy"
+    )
+    assert (pil_pixels.astype(int) < no_shadow_pixels).sum() > 1000
+
+
+def test_pdf_shadow_mask_is_embedded_reduced(config, caches, tmp_path):
+    books = make_books(config.covers_dir, 11)
+    layout_spec = make_layout_spec(config, shadow_enable=True)
+    pdf_file = str(tmp_path / "poster.pdf")
+    render_poster(books, layout_spec, [OutputSpec(pdf_file)], config, caches)
+    with open(pdf_file, "rb") as f:
+        pdf = f.read()
+    masks = re.findall(
+        rb"/Width (\d+) /Height (\d+) /ColorSpace /DeviceGray /BitsPerComponent 8 /Interpolate true", pdf
+    )
+    assert masks
+    poster_width = caches.layout_cache.get_layout(layout_spec).poster.dim.width_px
+    assert all(int(width) < poster_width / 2 for width, _ in masks)
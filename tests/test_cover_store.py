@@ -0,0 +1,73 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from cover_store import Cover_store
+
+FONT_PATH = "./fonts/DejaVuSans.ttf"
+COVER_URL_KEY = "book_large_image_url"
+
+
+@pytest.fixture
+def covers_dir(tmp_path):
+    return str(tmp_path / "covers")
+
+
+def create_store(covers_dir):
+    return Cover_store(lambda image: image.resize((30, 45)), FONT_PATH, covers_dir)
+
+
+def save_cover(path, seed, size=(120, 180), quality=90):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    pixels = np.repeat(np.repeat(rng.integers(0, 256, (12, 8, 3), dtype=np.uint8), 15, 0), 15, 1)
+    Image.fromarray(pixels, "RGB").resize(size).save(path, quality=quality)
+
+
+def save_placeholder(path, quality=90):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image = Image.new("RGB", (120, 180), "#dddddd")
+    ImageDraw.Draw(image).rectangle((30, 40, 90, 120), fill="#888888")
+    image.save(path, quality=quality)
+
+
+def test_identical_covers_are_resized_once(covers_dir):
+    save_cover(os.path.join(covers_dir, "1.jpg"), seed=0)
+    shutil.copyfile(os.path.join(covers_dir, "1.jpg"), os.path.join(covers_dir, "2.jpg"))
+    save_cover(os.path.join(covers_dir, "3.jpg"), seed=1)
+    store = create_store(covers_dir)
+    covers = [store.get_resized_cover(os.path.join(covers_dir, f"{i}.jpg")) for i in (1, 2, 3)]
+    assert covers[0] is covers[1] and covers[0] is not covers[2]
+    assert covers[0].size == (30, 45)
+    assert store.stats == {"skipped": 1, "computed": 2}
+
+
+def test_placeholders_are_detected(covers_dir):
+    placeholder_dir = os.path.join(covers_dir, Cover_store.PLACEHOLDER_DIR)
+    save_placeholder(os.path.join(placeholder_dir, "nophoto.jpg"))
+    save_placeholder(os.path.join(covers_dir, "1.jpg"), quality=60)  # recompressed by the CDN
+    save_cover(os.path.join(covers_dir, "2.jpg"), seed=0)
+    Image.new("RGB", (1, 1)).save(os.path.join(covers_dir, "3.gif"))
+    store = create_store(covers_dir)
+    book = {COVER_URL_KEY: "https://example.invalid/cover.jpg"}
+    is_placeholder = [
+        store.is_placeholder(book, os.path.join(covers_dir, name), COVER_URL_KEY)
+        for name in ("1.jpg", "2.jpg", "3.gif")
+    ]
+    assert is_placeholder == [True, False, True]
+    nophoto_book = {COVER_URL_KEY: "https://s.gr-assets.com/assets/nophoto/book/111x148.png"}
+    assert store.is_placeholder(nophoto_book, os.path.join(covers_dir, "2.jpg"), COVER_URL_KEY)
+
+
+def test_perceptual_hash_only_with_placeholders(covers_dir):
+    cover_file = os.path.join(covers_dir, "1.jpg")
+    save_cover(cover_file, seed=0)
+    store = create_store(covers_dir)
+    assert not store.is_placeholder({COVER_URL_KEY: ""}, cover_file, COVER_URL_KEY)
+    assert "phash" not in store.index[cover_file]
+    store.save_index()
+    save_placeholder(os.path.join(covers_dir, Cover_store.PLACEHOLDER_DIR, "nophoto.jpg"))
+    store = create_store(covers_dir)
+    assert not store.is_placeholder({COVER_URL_KEY: ""}, cover_file, COVER_URL_KEY)
+    assert "phash" in store.index[cover_file]
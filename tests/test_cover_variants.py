@@ -0,0 +1,89 @@
+import dataclasses
+from PIL import Image
+from conftest import make_books, make_layout_spec
+from book_poster_creator import Book_poster_creator
+from poster_exporter import OutputSpec
+
+
+class Recording_http_client:
+    """Saves a plain cover of the size stated in the URL, records the URLs downloaded"""
+
+    def __init__(self) -> None:
+        self.urls = []
+
+    def download(self, url: str, file: str) -> None:
+        self.urls.append(url)
+        height = int(url.rsplit("_SY", 1)[-1].split("_")[0]) if "_SY" in url else 475
+        Image.new("RGB", (height * 2 // 3, height), "#336699").save(file, quality=90)
+
+    def log_stats(self) -> None:
+        pass
+
+
+def add_variants(books):
+    for book in books:
+        url = book["book_large_image_url"]
+        book["book_small_image_url"] = url.replace(".jpg", "._SY75_.jpg")
+        book["book_medium_image_url"] = url.replace(".jpg", "._SY160_.jpg")
+    return books
+
+
+def create_creator(books, config, caches, outputs, **book):
+    config = dataclasses.replace(
+        config,
+        stream_covers=True,  # nothing downloaded on creation
+        output_file=outputs[0].file,
+        output_spec=outputs[0],
+        additional_outputs=tuple(outputs[1:]),
+    )
+    return Book_poster_creator(
+        caches.layout_cache.get_layout(make_layout_spec(config, **book)),
+        config,
+        [],
+        books=books,
+        chrome_cache=caches.chrome_cache,
+        http_client=caches.http_client,
+        artifact_cache=caches.artifact_cache,
+    )
+
+
+def test_variant_follows_the_output_size(config, caches, tmp_path):
+    books = add_variants(make_books(str(tmp_path / "source"), 12))
+    poster_file = str(tmp_path / "poster.jpg")
+    # The cover area is about 475 px high at full size
+    expected_keys = {
+        1.0: "book_large_image_url",
+        0.25: "book_medium_image_url",
+        0.1: "book_small_image_url",
+    }
+    for scale, cover_url_key in expected_keys.items():
+        creator = create_creator(books, config, caches, [OutputSpec(poster_file, scale=scale)])
+        assert creator.get_cover_target_size()[1] == creator.layout.book.cover_area.dim_px[1] * scale
+        assert {creator.get_cover_url_key(book) for book in creator.books} == {cover_url_key}
+    # Smaller cover areas (e.g. of a preview layout) at full size
+    creator = create_creator(books, config, caches, [OutputSpec(poster_file)], expected_cover_height=120)
+    assert creator.layout.book.cover_area.dim_px[1] < 160
+    assert creator.get_cover_url_key(creator.books[0]) == "book_medium_image_url"
+    # The largest output decides
+    outputs = [OutputSpec(poster_file, scale=0.1), OutputSpec(str(tmp_path / "preview.jpg"), scale=0.25)]
+    creator = create_creator(books, config, caches, outputs)
+    assert creator.get_cover_url_key(creator.books[0]) == "book_medium_image_url"
+
+
+def test_covers_are_upgraded_not_downgraded(config, caches, tmp_path):
+    books = add_variants(make_books(str(tmp_path / "source"), 12))
+    caches = dataclasses.replace(caches, http_client=Recording_http_client())
+    poster_file = str(tmp_path / "poster.jpg")
+
+    def download_covers(scale):
+        caches.http_client.urls = []
+        create_creator(books, config, caches, [OutputSpec(poster_file, scale=scale)]).download_covers()
+        return caches.http_client.urls
+
+    assert all("_SY160_" in url for url in download_covers(0.25))
+    assert download_covers(0.25) == []
+    # Full size needs the large covers, the smaller preview keeps them
+    assert all("_SY" not in url for url in download_covers(1.0))
+    assert download_covers(0.1) == []
+    with Image.open(f"{config.covers_dir}/{books[0]['book_id']}.jpg") as cover:
+        assert cover.height == 475
@@ -0,0 +1,61 @@
+import math
+import os
+import numpy as np
+from PIL import Image
+from deep_zoom import Deep_zoom_writer
+
+
+def get_tiles(tiles_dir):
+    return {
+        f"{level}/{name}"
+        for level in os.listdir(tiles_dir)
+        if level.isdigit()
+        for name in os.listdir(os.path.join(tiles_dir, level))
+    }
+
+
+def test_pyramid_levels_and_tile_sizes(tmp_path):
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (600, 1000, 3), dtype=np.uint8), "RGB")
+    dzi_file = str(tmp_path / "poster.dzi")
+    writer = Deep_zoom_writer(tile_size=254, overlap=1)
+    writer.write(image, dzi_file)
+    tiles_dir = Deep_zoom_writer.get_tiles_dir(dzi_file)
+    max_level = math.ceil(math.log2(1000))
+    assert sorted(int(d) for d in os.listdir(tiles_dir) if d.isdigit()) == list(range(max_level + 1))
+    # Full resolution: 4x3 tiles, overlapping their neighbours by one pixel
+    assert len(os.listdir(os.path.join(tiles_dir, str(max_level)))) == 12
+    tile_sizes = {}
+    for name in ["0_0", "1_1", "3_2"]:
+        with Image.open(os.path.join(tiles_dir, str(max_level), f"{name}.jpg")) as tile:
+            tile_sizes[name] = tile.size
+    assert tile_sizes == {"0_0": (255, 255), "1_1": (256, 256), "3_2": (1000 - 761, 600 - 507)}
+    # Each level halves the size (rounded up) down to a single pixel
+    with Image.open(os.path.join(tiles_dir, str(max_level - 1), "0_0.jpg")) as tile:
+        assert tile.size == (255, 255)
+    with Image.open(os.path.join(tiles_dir, "0", "0_0.jpg")) as tile:
+        assert tile.size == (1, 1)
+    with open(dzi_file) as f:
+        descriptor = f.read()
+    assert 'TileSize="254"' in descriptor and 'Overlap="1"' in descriptor
+    assert '<Size Width="1000" Height="600"/>' in descriptor
+
+
+def test_unchanged_tiles_are_not_written_again(tmp_path):
+    image = Image.new("RGB", (600, 400), "white")
+    dzi_file = str(tmp_path / "poster.dzi")
+    writer = Deep_zoom_writer()
+    writer.write(image, dzi_file)
+    tiles_dir = Deep_zoom_writer.get_tiles_dir(dzi_file)
+    tiles = get_tiles(tiles_dir)
+    mtimes = {name: os.stat(os.path.join(tiles_dir, name)).st_mtime_ns for name in tiles}
+    image.paste("black", (0, 0, 10, 10))
+    writer.write(image, dzi_file)
+    changed = {
+        name for name in tiles if os.stat(os.path.join(tiles_dir, name)).st_mtime_ns != mtimes[name]
+    }
+    # Only top left tiles (in the small levels, the change may be averaged away)
+    assert "10/0_0.jpg" in changed and all(name.endswith("/0_0.jpg") for name in changed)
+    # Tiles of another poster size are removed
+    writer.write(image.resize((300, 200)), dzi_file)
+    assert len(get_tiles(tiles_dir)) < len(tiles)
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlsplit
+import pytest
+from artifact_cache import Artifact_cache
+from book_loader import Book_loader
+from http_client import Http_response
+
+SHELF_URL = "https://www.goodreads.com/review/list_rss/1?shelf=read&sort=user_read_at"
+LAST_READ_AT = datetime(year=2024, month=1, day=1, tzinfo=timezone.utc)
+
+
+class Shelf_feed_client:
+    """Serves the pages of a shelf feed of n_books, newest first, 100 books per page"""
+
+    def __init__(self, n_books: int) -> None:
+        self.n_books = n_books
+        self.pages = []
+
+    def get(self, url: str) -> Http_response:
+        page = int(dict(parse_qsl(urlsplit(url).query))["page"])
+        self.pages.append(page)
+        items = "".join(
+            f"<item><title>Book {i}</title><book_id>{i}</book_id>"
+            f"<user_read_at>{self.get_read_date(i).strftime('%a, %d %b %Y %H:%M:%S %z')}</user_read_at>"
+            "</item>"
+            for i in range((page - 1) * 100, min(page * 100, self.n_books))
+        )
+        body = f'<?xml version="1.0"?><rss version="2.0"><channel><title>Shelf</title>{items}</channel></rss>'
+        return Http_response(url, 200, {"content-type": "application/xml"}, body.encode())
+
+    @staticmethod
+    def get_read_date(i: int) -> datetime:
+        return LAST_READ_AT - timedelta(days=3 * i)
+
+
+@pytest.fixture
+def loader(config, tmp_path):
+    config.feed_page_concurrency = 1
+    config.start_date = LAST_READ_AT - timedelta(days=3000)
+    return Book_loader(config, artifact_cache=Artifact_cache(str(tmp_path / "artifacts")))
+
+
+def load_pages(loader, n_books, url=SHELF_URL, max_books=None):
+    loader.http_client = Shelf_feed_client(n_books)
+    entries, is_complete = loader.load_feed_pages(url, 0, max_books)
+    return loader.http_client.pages, len(entries), is_complete
+
+
+def test_paging_stops_once_the_poster_is_full(loader):
+    assert load_pages(loader, 350, max_books=120) == ([1, 2], 200, False)
+
+
+def test_paging_stops_at_the_start_date(loader):
+    loader.config.start_date = Shelf_feed_client.get_read_date(150)
+    assert load_pages(loader, 350) == ([1, 2], 200, False)
+
+
+def test_unsorted_shelves_are_loaded_completely(loader):
+    url = SHELF_URL.replace("&sort=user_read_at", "")
+    assert load_pages(loader, 350, url, max_books=120) == ([1, 2, 3, 4], 350, True)
+    # A short first page is the last one
+    assert load_pages(loader, 30, url) == ([1], 30, True)
+
+
+def test_pages_are_loaded_in_batches(loader):
+    loader.config.feed_page_concurrency = 4
+    pages, n_entries, is_complete = load_pages(loader, 350)
+    assert sorted(pages) == [1, 2, 3, 4, 5] and n_entries == 350 and is_complete
@@ -0,0 +1,56 @@
+import itertools
+import numpy as np
+import pytest
+from conftest import make_layout_spec
+from justified_layout import Justified_layout
+from layout_generator import PosterLayoutCreator
+
+
+@pytest.fixture
+def justified_layout(config):
+    spec = make_layout_spec(config, (4, 3))
+    return Justified_layout(PosterLayoutCreator(spec=spec).create_poster_layout())
+
+
+def get_cost(aspect_ratios, row_starts):
+    row_ends = list(row_starts[1:]) + [aspect_ratios.size]
+    target = aspect_ratios.sum() / len(row_starts)
+    return sum((aspect_ratios[start:end].sum() - target) ** 2 for start, end in zip(row_starts, row_ends))
+
+
+def partition_brute_force(aspect_ratios, n_rows):
+    """Cost of the best split into n_rows consecutive, non-empty rows"""
+    return min(
+        get_cost(aspect_ratios, (0,) + row_starts)
+        for row_starts in itertools.combinations(range(1, aspect_ratios.size), n_rows - 1)
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_partition_is_optimal(justified_layout, seed):
+    rng = np.random.default_rng(seed)
+    for n_books in range(1, 11):
+        aspect_ratios = rng.uniform(0.4, 1.0, n_books)
+        for n_rows in range(1, n_books + 1):
+            row_starts = justified_layout.partition(aspect_ratios, n_rows)
+            assert row_starts[0] == 0 and len(row_starts) == n_rows
+            assert all(a < b for a, b in zip(row_starts, row_starts[1:]))  # no empty row
+            assert get_cost(aspect_ratios, row_starts) == pytest.approx(
+                partition_brute_force(aspect_ratios, n_rows)
+            )
+
+
+def test_rows_span_the_grid(justified_layout):
+    aspect_ratios = np.random.default_rng(0).uniform(0.5, 0.8, 12)
+    cells = justified_layout.arrange(aspect_ratios)
+    assert len(cells) == 12
+    grid_width, grid_height = justified_layout.layout.grid.area.dim_px
+    for _, row_cells in itertools.groupby(cells, key=lambda cell: cell.row):
+        row_cells = list(row_cells)
+        assert len({cell.height for cell in row_cells}) == 1
+        row_width = row_cells[-1].box[2] - row_cells[0].x + justified_layout.gap_h
+        assert row_width == pytest.approx(grid_width, abs=len(row_cells))
+    # Covers at their aspect ratios, in book order
+    for cell, aspect_ratio in zip(cells, aspect_ratios):
+        assert cell.width / cell.height == pytest.approx(aspect_ratio, abs=0.02)
+    assert cells[-1].box[3] <= justified_layout.grid_y + grid_height
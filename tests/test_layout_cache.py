@@ -0,0 +1,30 @@
+import poster_config
+from conftest import make_layout_spec
+from layout_cache import Layout_cache
+
+
+def test_identical_specs_have_the_same_hash(config):
+    spec = make_layout_spec(config)
+    assert make_layout_spec(config) == spec
+    assert make_layout_spec(config).get_hash() == spec.get_hash()
+    assert hash(make_layout_spec(config)) == hash(spec)
+    assert make_layout_spec(config, (4, 4)).get_hash() != spec.get_hash()
+    assert make_layout_spec(config, shadow_opacity=0.3).get_hash() != spec.get_hash()
+    # The book texts determine the text lines below the covers
+    other_config = poster_config.Config(library_file=None)
+    other_config.get_book_str = lambda book: ("Read\n\nthree lines", "center")
+    assert make_layout_spec(other_config).get_hash() != spec.get_hash()
+
+
+def test_layouts_are_cached_by_spec(config, tmp_path):
+    cache_dir = str(tmp_path / "layouts")
+    layout_cache = Layout_cache(cache_dir)
+    layout = layout_cache.get_layout(make_layout_spec(config))
+    assert layout_cache.get_layout(make_layout_spec(config)) is layout
+    assert layout_cache.get_layout(make_layout_spec(config, (4, 4))) is not layout
+    assert layout_cache.stats == {"skipped": 1, "computed": 2}
+    # Loaded from disk by another cache
+    other_cache = Layout_cache(cache_dir)
+    other_layout = other_cache.get_layout(make_layout_spec(config))
+    assert other_cache.stats == {"skipped": 1, "computed": 0}
+    assert other_layout.get_hash() == layout.get_hash()
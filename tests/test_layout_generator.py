@@ -0,0 +1,34 @@
+from conftest import make_layout_spec
+from dimensions import Length
+from layout_generator import PosterLayoutCreator
+
+
+def get_layout(config, n_books=(4, 3)):
+    return PosterLayoutCreator(spec=make_layout_spec(config, n_books)).create_poster_layout()
+
+
+def test_cells_are_created_with_the_layout(config):
+    layout = get_layout(config)
+    grid_area = layout.poster_area.content["content"].content["grid"]
+    assert len(grid_area.content) == 12
+    # Reading positions calculates nothing and creates no areas
+    positions = [layout.get_cover_area_position(h, v).xy_px for v in range(3) for h in range(4)]
+    assert len(grid_area.content) == 12
+    assert layout.poster_area.update_positions() == 0
+    assert positions[1][0] - positions[0][0] == layout.book.area.width_px
+    assert positions[4][1] - positions[0][1] == layout.book.area.height_px
+
+
+def test_update_areas_calculates_the_changed_subtree_only(config):
+    layout = get_layout(config)
+    signature_position = layout.get_signature_position_left().xy_px
+    cover_position = layout.get_cover_area_position(2, 1).xy_px
+    assert layout.update_areas() == 0  # nothing changed
+    # A higher title moves the grid (and all its cells), the signatures stay
+    layout.title.vspace = Length(layout.title.vspace.px + 10, unit="px", dpi=layout.dpi)
+    n_cells = layout.grid.n_books_total
+    assert layout.update_areas() == 1 + 3 * n_cells  # grid, cells, covers and shadings
+    assert layout.get_signature_position_left().xy_px == signature_position
+    new_cover_position = layout.get_cover_area_position(2, 1).xy_px
+    assert new_cover_position[0] == cover_position[0]
+    assert new_cover_position[1] == cover_position[1] + 10
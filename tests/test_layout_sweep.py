@@ -0,0 +1,80 @@
+import dataclasses
+import pytest
+from PIL import Image
+from conftest import make_books, make_layout_spec
+import poster_config
+from book_poster_creator import Book_poster_creator
+from layout_sweep import (
+    create_contact_sheet,
+    decode_covers,
+    get_config_layout,
+    get_max_books,
+    get_variants,
+    render_variant,
+)
+
+
+def test_variants_are_all_combinations():
+    variants = get_variants({"grid.n_books": [(4, 3), (5, 4)], "year_shading.enable": [True, False]})
+    assert variants == [
+        {"grid.n_books": (4, 3), "year_shading.enable": True},
+        {"grid.n_books": (4, 3), "year_shading.enable": False},
+        {"grid.n_books": (5, 4), "year_shading.enable": True},
+        {"grid.n_books": (5, 4), "year_shading.enable": False},
+    ]
+
+
+def test_variant_config_keeps_the_defaults():
+    default_n_books = poster_config.ConfigLayout.grid["n_books"]
+    config_layout = get_config_layout({"grid.n_books": (2, 2)})
+    assert config_layout.grid["n_books"] == (2, 2)
+    assert poster_config.ConfigLayout.grid["n_books"] == default_n_books
+    with pytest.raises(ValueError):
+        get_config_layout({"grid.no_such_parameter": 1})
+
+
+def test_max_books_of_the_largest_grid():
+    config_layouts = [get_config_layout({"grid.n_books": n_books}) for n_books in [(4, 3), (5, 4)]]
+    assert get_max_books(config_layouts) == 20
+    config_layouts.append(get_config_layout({"grid.auto_size": True}))
+    assert get_max_books(config_layouts) is None
+
+
+def test_variants_share_the_decoded_covers(config, caches, tmp_path, monkeypatch):
+    books = make_books(config.covers_dir, 12)
+    creators = []
+    for i, year_shading in enumerate([True, False]):
+        spec = make_layout_spec(config)
+        spec = dataclasses.replace(
+            spec, year_shading=tuple((k, year_shading if k == "enable" else v) for k, v in spec.year_shading)
+        )
+        creators.append(
+            Book_poster_creator(
+                caches.layout_cache.get_layout(spec),
+                dataclasses.replace(config, output_file=str(tmp_path / f"variant_{i + 1}.jpg")),
+                [],
+                books=books,
+                chrome_cache=caches.chrome_cache,
+                artifact_cache=caches.artifact_cache,
+            )
+        )
+    decoded_covers = decode_covers(creators, max_workers=2)
+    assert len(decoded_covers) == 12
+    for creator in creators:
+        creator.cover_store.decoded_covers = decoded_covers
+    # The variants do not decode the covers again
+    opened_files = []
+    image_open = Image.open
+    monkeypatch.setattr(Image, "open", lambda file, *args: opened_files.append(file) or image_open(file, *args))
+    render_times = [render_variant(creator) for creator in creators]
+    monkeypatch.undo()
+    assert not [file for file in opened_files if str(file).startswith(config.covers_dir)]
+    assert all(render_time > 0 for render_time in render_times)
+    contact_sheet = create_contact_sheet(
+        [creator.config.output_file for creator in creators],
+        ["with shading", "without shading"],
+        thumbnail_height=120,
+        columns=4,
+        font_path="./fonts/DejaVuSans.ttf",
+    )
+    assert contact_sheet.height > 120 and contact_sheet.width > 2 * 80
@@ -0,0 +1,67 @@
+import dataclasses
+import json
+import os
+import shutil
+import time
+import numpy as np
+from PIL import Image
+from conftest import make_books, make_layout_spec
+from book_poster_creator import (
+    get_master_file,
+    get_missing_covers_file,
+    patch_missing_covers,
+    render_poster,
+)
+from poster_exporter import OutputSpec
+
+
+class Slow_http_client:
+    """Copies the covers from a directory, the slow ones after a delay"""
+
+    def __init__(self, source_dir: str, slow_book_ids: set) -> None:
+        self.source_dir = source_dir
+        self.slow_book_ids = slow_book_ids
+
+    def download(self, url: str, file: str) -> None:
+        book_id = url.rsplit("/", 1)[-1].split(".")[0]
+        if book_id in self.slow_book_ids:
+            time.sleep(1.5)
+        shutil.copyfile(os.path.join(self.source_dir, f"{book_id}.jpg"), file)
+
+    def log_stats(self) -> None:
+        pass
+
+
+def test_patch_equals_full_render(config, caches, tmp_path):
+    books = make_books(str(tmp_path / "source"), 12)
+    slow_book_ids = {books[2]["book_id"], books[7]["book_id"]}
+    config = dataclasses.replace(config, stream_covers=False, cover_deadline_s=0.5)
+    spec = make_layout_spec(config)
+    output = OutputSpec(str(tmp_path / "poster.jpg"))
+    caches = dataclasses.replace(
+        caches, http_client=Slow_http_client(str(tmp_path / "source"), slow_book_ids)
+    )
+    result = render_poster(books, spec, [output], config, caches)
+    assert sorted(result.missing_book_ids) == sorted(slow_book_ids)
+    assert os.path.exists(get_master_file(output.file))
+    # Plain JSON, with the cells of the missing covers
+    with open(get_missing_covers_file(output.file)) as f:
+        record = json.load(f)
+    assert record["missing_cells"] == {
+        book["book_id"]: cell for cell, book in enumerate(books) if book["book_id"] in slow_book_ids
+    }
+
+    time.sleep(1.5)  # the late downloads finish, they are downloaded again by the patch
+    for book_id in slow_book_ids:
+        os.remove(os.path.join(config.covers_dir, f"{book_id}.jpg"))
+    caches.http_client.slow_book_ids = set()
+    assert sorted(patch_missing_covers(output.file, caches)) == sorted(slow_book_ids)
+    assert not os.path.exists(get_missing_covers_file(output.file))
+    assert not os.path.exists(get_master_file(output.file))
+
+    full_output = OutputSpec(str(tmp_path / "full.jpg"))
+    render_poster(
+        books, spec, [full_output], dataclasses.replace(config, cover_deadline_s=None), caches
+    )
+    patched_pixels = np.asarray(Image.open(output.file))
+    assert np.array_equal(patched_pixels, np.asarray(Image.open(full_output.file)))
@@ -0,0 +1,31 @@
+from PIL import Image, ImageFont
+from pdf_writer import Pdf_canvas, Pdf_document
+
+FONT_PATH = "./fonts/DejaVuSans.ttf"
+
+
+def test_jpeg_covers_are_embedded_unchanged(tmp_path):
+    jpeg_file = str(tmp_path / "cover.jpg")
+    Image.radial_gradient("L").convert("RGB").save(jpeg_file, quality=80)
+    png_file = str(tmp_path / "cover.png")
+    Image.linear_gradient("L").save(png_file)
+    document = Pdf_document()
+    canvas = Pdf_canvas(document, (600, 800), 300, "#ffffff")
+    canvas.place_image_file(jpeg_file, (10, 10), (100, 150))
+    canvas.place_image_file(jpeg_file, (200, 10), (100, 150))  # embedded once
+    canvas.place_image_file(png_file, (10, 300), (100, 100))
+    canvas.text((300, 500), "Title", font=ImageFont.truetype(FONT_PATH, 40), anchor="mm")
+    document.add_page(canvas)
+    pdf_file = str(tmp_path / "poster.pdf")
+    document.save(pdf_file)
+
+    with open(pdf_file, "rb") as f:
+        pdf = f.read()
+    with open(jpeg_file, "rb") as f:
+        jpeg_data = f.read()
+    assert pdf.startswith(b"%PDF-1.4") and pdf.rstrip().endswith(b"%%EOF")
+    assert pdf.count(jpeg_data) == 1
+    assert pdf.count(b"/Filter /DCTDecode") == 1
+    assert b"/Subtype /Type0" in pdf  # vector text with the embedded font
+    content = canvas.get_content().decode()
+    assert content.count("/Im1 Do") == 2 and content.count("/Im2 Do") == 1
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from PIL import Image
+from poster_exporter import OutputSpec, Poster_exporter
+
+
+@pytest.fixture
+def poster_image():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (300, 200, 3), dtype=np.uint8), "RGB")
+
+
+def test_export_encodes_all_outputs(poster_image, tmp_path):
+    specs = [
+        OutputSpec(str(tmp_path / "poster.png")),
+        OutputSpec(str(tmp_path / "poster.jpg"), quality=95),
+        OutputSpec(str(tmp_path / "poster_progressive.jpg"), quality=60, progressive=True),
+        OutputSpec(str(tmp_path / "poster_small.webp"), scale=0.25),
+    ]
+    results = Poster_exporter(dpi=300).export(poster_image, specs)
+    assert [result.spec for result in results] == specs
+    assert [result.size_px for result in results] == [(200, 300)] * 3 + [(50, 75)]
+    with Image.open(specs[0].file) as image:
+        assert np.array_equal(np.asarray(image), np.asarray(poster_image))
+        assert image.info["dpi"] == pytest.approx((300, 300), abs=0.01)  # stored in px per m
+    # The encoder settings of one output are not used for another of the same scale
+    with Image.open(specs[1].file) as image:
+        assert not image.info.get("progressive")
+    with Image.open(specs[2].file) as image:
+        assert image.info.get("progressive")
+    assert results[2].file_size_bytes < results[1].file_size_bytes
+    with Image.open(specs[3].file) as image:
+        assert image.format == "WEBP" and image.size == (50, 75)
+
+
+def test_export_rejects_upscaling(poster_image, tmp_path):
+    with pytest.raises(ValueError):
+        Poster_exporter(dpi=300).export(poster_image, [OutputSpec(str(tmp_path / "a.png"), scale=2)])
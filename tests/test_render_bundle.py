@@ -0,0 +1,48 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from conftest import ROOT_DIR, make_books, make_layout_spec
+import poster_config
+from layout_spec import LayoutSpec
+from poster_exporter import OutputSpec
+from render_bundle import Bundle_queue, create_bundle, from_json_fields, to_json_fields
+
+
+def test_config_round_trip(config):
+    config.additional_outputs = (OutputSpec("poster_web.webp", quality=80, scale=0.25),)
+    layout_spec = LayoutSpec.from_config(poster_config.ConfigLayout(), config)
+    for instance in (config, layout_spec):
+        fields = json.loads(json.dumps(to_json_fields(instance)))
+        assert from_json_fields(type(instance), fields) == instance
+
+
+def test_each_job_claimed_once_by_two_workers(config, caches, tmp_path):
+    books = make_books(config.covers_dir, 12)
+    bundle_file = str(tmp_path / "poster.bundle")
+    create_bundle(
+        bundle_file, books, make_layout_spec(config), [OutputSpec("poster.png")], config, caches
+    )
+    queue = Bundle_queue(str(tmp_path / "queue"))
+    job_ids = [queue.submit(bundle_file) for _ in range(8)]
+
+    # Two independent workers, in a directory of their own (with the fonts of the layout)
+    worker_dir = tmp_path / "worker"
+    worker_dir.mkdir()
+    os.symlink(os.path.join(ROOT_DIR, "fonts"), worker_dir / "fonts")
+    command = [sys.executable, os.path.join(ROOT_DIR, "src", "render_bundle.py"), "work", queue.queue_dir, "2"]
+    workers = [
+        subprocess.Popen(command, cwd=worker_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(2)
+    ]
+    outputs = [worker.communicate(timeout=300)[0] for worker in workers]
+    assert all(worker.returncode == 0 for worker in workers)
+
+    claimed_job_ids = re.findall(r"rendering job (\S+)\.\.\.", "".join(outputs))
+    assert sorted(claimed_job_ids) == sorted(job_ids)
+    results = queue.wait_for_results(job_ids, timeout_s=0)
+    assert all(results[job_id]["status"] == "done" for job_id in job_ids)
+    assert all(os.path.exists(queue.get_path("done", os.path.join(job_id, "poster.png"))) for job_id in job_ids)
+    for state in ("pending", "claimed", "failed"):
+        assert os.listdir(queue.get_path(state, "")) == []
@@ -0,0 +1,33 @@
+import logging
+import os
+import pytest
+from conftest import make_books, make_layout_spec
+from book_poster_creator import render_poster
+from poster_exporter import OutputSpec
+
+
+def test_render_poster_outputs(config, caches, tmp_path):
+    books = make_books(config.covers_dir, 12)
+    outputs = [OutputSpec(str(tmp_path / "poster.png")), OutputSpec(str(tmp_path / "small.jpg"), scale=0.5)]
+    result = render_poster(books, make_layout_spec(config), outputs, config, caches)
+    assert result.files == [spec.file for spec in outputs]
+    assert all(os.path.exists(file) for file in result.files)
+    assert result.n_books == 12 and not result.restored
+
+
+def test_pdf_with_further_outputs_rejected(config, caches, tmp_path):
+    books = make_books(config.covers_dir, 12)
+    outputs = [OutputSpec(str(tmp_path / "poster.pdf")), OutputSpec(str(tmp_path / "poster.jpg"))]
+    with pytest.raises(ValueError, match="only output"):
+        render_poster(books, make_layout_spec(config), outputs, config, caches)
+    assert not (tmp_path / "poster.pdf").exists()
+
+
+def test_progress_is_logged_not_printed(config, caches, tmp_path, capsys, caplog):
+    books = make_books(config.covers_dir, 12)
+    outputs = [OutputSpec(str(tmp_path / "poster.jpg"))]
+    with caplog.at_level(logging.INFO):
+        render_poster(books, make_layout_spec(config), outputs, config, caches)
+    assert capsys.readouterr().out == ""
+    messages = [record.getMessage() for record in caplog.records]
+    assert "Creating poster..." in messages and "Saving Poster..." in messages
@@ -0,0 +1,76 @@
+import dataclasses
+import os
+import re
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from conftest import make_books, make_layout_spec
+from book_poster_creator import get_read_date, get_sheet_file, render_sheets, split_into_sheets
+from poster_exporter import OutputSpec
+
+
+@pytest.fixture
+def layout(config, caches):
+    return caches.layout_cache.get_layout(make_layout_spec(config, (4, 3)))
+
+
+def set_read_dates(books, books_per_year):
+    """Books read evenly over consecutive years, the given number per year"""
+    dates = [
+        datetime(2016 + year, 1, 1, tzinfo=timezone.utc) + timedelta(days=day * 300 // n_books)
+        for year, n_books in enumerate(books_per_year)
+        for day in range(n_books)
+    ]
+    for book, date in zip(books, dates):
+        book["user_read_at"] = date.strftime("%a, %d %b %Y %H:%M:%S %z")
+    return books
+
+
+def test_sheets_are_filled_in_order(config, layout):
+    books = make_books(config.covers_dir, 30)
+    sheets = split_into_sheets(books, layout)
+    assert [sheet.size for sheet in sheets] == [12, 12, 6]
+    assert list(np.concatenate(sheets)) == list(books)
+
+
+def test_sheets_end_on_year_boundaries(config, layout):
+    books = set_read_dates(make_books(config.covers_dir, 35), [5, 4, 16, 7, 3])
+    sheets = split_into_sheets(books, layout, on_year_boundaries=True)
+    assert list(np.concatenate(sheets)) == list(books)
+    # A year longer than a sheet is split, the sheets of the other years end before a new year
+    years = [[get_read_date(book).year for book in sheet] for sheet in sheets]
+    assert years == [
+        [2016] * 5 + [2017] * 4,
+        [2018] * 12,
+        [2018] * 4 + [2019] * 7,
+        [2020] * 3,
+    ]
+
+
+def test_sheet_files_are_numbered():
+    assert get_sheet_file("out/poster.jpg", 0, 3) == "out/poster_1.jpg"
+    assert get_sheet_file("out/poster.jpg", 9, 12) == "out/poster_10.jpg"
+    assert get_sheet_file("out/poster.jpg", 0, 12) == "out/poster_01.jpg"
+
+
+def test_render_sheets(config, caches, tmp_path):
+    books = set_read_dates(make_books(config.covers_dir, 20), [10, 10])
+    config = dataclasses.replace(config, sheet_year_boundaries=True)
+    spec = make_layout_spec(config, (4, 3))
+    outputs = [OutputSpec(str(tmp_path / "poster.png")), OutputSpec(str(tmp_path / "small.jpg"), scale=0.5)]
+    results = render_sheets(books, spec, outputs, config, caches)
+    assert [result.n_books for result in results] == [10, 10]
+    assert [result.files for result in results] == [
+        [str(tmp_path / f"poster_{i}.png"), str(tmp_path / f"small_{i}.jpg")] for i in (1, 2)
+    ]
+    assert all(os.path.exists(file) for result in results for file in result.files)
+    # Each sheet is titled with the dates of its books, the outer dates are the configured ones
+    assert results[0].start_date == config.start_date
+    assert results[0].end_date == get_read_date(books[9])
+    assert results[1].start_date == get_read_date(books[10])
+
+    pdf_file = str(tmp_path / "poster.pdf")
+    results = render_sheets(books, spec, [OutputSpec(pdf_file)], config, caches)
+    assert [result.files for result in results] == [[pdf_file]] * 2
+    with open(pdf_file, "rb") as f:
+        assert len(re.findall(rb"/Type /Page\b", f.read())) == 2
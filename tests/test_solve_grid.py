@@ -0,0 +1,34 @@
+import math
+import pytest
+from layout_generator import PosterLayoutCreator
+from layout_spec import LayoutSpec
+from layout_sweep import get_config_layout
+
+
+def create_layout_creator(config, n_books_total=None, n_books=None):
+    variant = {"grid.auto_size": n_books is None}
+    if n_books is not None:
+        variant["grid.n_books"] = n_books
+    spec = LayoutSpec.from_config(get_config_layout(variant), config, n_books_total=n_books_total)
+    return PosterLayoutCreator(spec=spec)
+
+
+def get_cover_size_cm2(creator):
+    """Area of a cover of the default aspect ratio fitted into the cover area"""
+    aspect_ratio = creator.book["default_aspect_ratio"]
+    cover_height = min(creator.book["cover_area_height"], creator.book["cover_area_width"] / aspect_ratio)
+    return cover_height**2 * aspect_ratio
+
+
+@pytest.mark.parametrize("n_books_total", [1, 7, 12, 30])
+def test_solve_grid_picks_the_largest_covers(config, n_books_total):
+    creator = create_layout_creator(config, n_books_total)
+    n_cols, n_rows = creator.grid["n_books"]
+    assert n_cols * n_rows >= n_books_total
+    assert n_cols * (n_rows - 1) < n_books_total  # no empty row
+    # No other grid holding all books has larger covers
+    cover_size = get_cover_size_cm2(creator)
+    for other_n_cols in range(1, n_books_total + 1):
+        other_n_books = (other_n_cols, math.ceil(n_books_total / other_n_cols))
+        other_creator = create_layout_creator(config, n_books=other_n_books)
+        assert get_cover_size_cm2(other_creator) <= cover_size * (1 + 1e-9), other_n_books